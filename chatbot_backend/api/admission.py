@@ -0,0 +1,130 @@
+"""
+Admission control for the chat endpoints
+
+At most ``max_concurrent`` requests run at once; the rest wait in a
+bounded queue that is served round-robin across clients (user_id, else
+session_id, else client address), so one noisy client cannot starve the
+others. When the queue (or a client's share of it) is full, or a request
+has waited too long, it is rejected straight away with a Retry-After hint.
+"""
+import os
+import sys
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag.deadline import LatencyTracker
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_queue: int, max_queue_per_client: int,
+                 queue_timeout: float, window: int = 200):
+        """Bounded concurrency with a fair, bounded wait queue (one instance per event loop)"""
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_times = LatencyTracker(window)
+        self.service_times = LatencyTracker(window)
+        # client -> waiters, in round-robin order
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    def _retry_after(self) -> float:
+        """Rough time until a slot frees up for a new request"""
+        service = self.service_times.percentile(50) or 1.0
+        return max(1.0, service * (self.queued + 1) / self.max_concurrent)
+
+    async def acquire(self, client: str) -> float:
+        """Wait for a slot; returns the seconds spent queued or raises AdmissionRejected"""
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+            self.admitted += 1
+            self.wait_times.record(0.0)
+            return 0.0
+
+        queue = self._queues.get(client)
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected("Server is busy", self._retry_after())
+        if queue is not None and len(queue) >= self.max_queue_per_client:
+            self.rejected += 1
+            raise AdmissionRejected("Too many queued requests for this client", self._retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[client] = deque()
+        queue.append(waiter)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up: pass it on
+                self.release()
+            else:
+                waiter.cancel()
+                self._discard(client, waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected += 1
+            raise AdmissionRejected("Timed out waiting for a free worker", self._retry_after())
+
+        waited = time.monotonic() - started
+        self.wait_times.record(waited)
+        return waited
+
+    def _discard(self, client: str, waiter: asyncio.Future):
+        queue = self._queues.get(client)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self.queued -= 1
+            if not queue:
+                del self._queues[client]
+
+    def release(self, service_time: float = None):
+        """Free a slot, handing it to the next client in round-robin order"""
+        if service_time is not None:
+            self.service_times.record(service_time)
+        while self._queues:
+            client, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._queues.move_to_end(client)
+            else:
+                del self._queues[client]
+            if not waiter.done():
+                # The slot moves to the waiter; ``active`` stays the same
+                waiter.set_result(None)
+                self.admitted += 1
+                return
+        self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": self.queued,
+            "max_queue": self.max_queue,
+            "queued_clients": len(self._queues),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_seconds": self.wait_times.stats(),
+            "service_seconds": self.service_times.stats(),
+            "retry_after_hint": math.ceil(self._retry_after())
+        }
@@ -0,0 +1,140 @@
+"""
+Background re-indexing jobs
+
+Scraping and embedding run in a worker thread, so neither the request nor
+the event loop waits for them. Only one re-index runs at a time; asking for
+another while one is running returns the running job. Recent jobs are kept
+so their status can be polled by ID.
+
+With a ``path``, job records live in a JSON file (next to the shared vector
+store) instead of in memory, so every worker process on the host sees the
+same jobs: a job started by one worker can be polled on any other, and a
+second worker asking for a re-index gets the running one. A job whose
+worker died is marked failed the next time its state is read.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+# Finished jobs remembered for status queries
+MAX_FINISHED_JOBS = 20
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class ReindexJobs:
+    def __init__(self, max_finished: int = MAX_FINISHED_JOBS, path: Optional[str] = None):
+        """Job records kept in memory, or in the JSON file at ``path`` shared by worker processes"""
+        self.max_finished = max_finished
+        self.path = path
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Keep references so running tasks are not garbage collected
+        self._tasks = set()
+
+    @contextmanager
+    def _state(self, write: bool = True) -> Iterator["OrderedDict[str, Dict[str, Any]]"]:
+        """The job records, locked (and written back, unless ``write`` is False) when persisted to a file"""
+        if self.path is None:
+            yield self._jobs
+            return
+
+        import fcntl
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f"{self.path}.lock", 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                jobs = OrderedDict()
+                if os.path.exists(self.path):
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        jobs = OrderedDict((job["job_id"], job) for job in json.load(f))
+                expired = self._expire_orphans(jobs)
+                yield jobs
+                if not (write or expired):
+                    return
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(list(jobs.values()), f)
+                os.replace(tmp_path, self.path)
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _expire_orphans(jobs: Dict[str, Dict[str, Any]]) -> bool:
+        """Fail active jobs whose worker process has exited; returns whether any were"""
+        expired = False
+        for job in jobs.values():
+            if job["status"] not in ACTIVE_STATUSES or job.get("pid") is None:
+                continue
+            try:
+                os.kill(job["pid"], 0)
+            except ProcessLookupError:
+                job["status"] = "failed"
+                job["error"] = "Worker process exited"
+                job["finished_at"] = time.time()
+                expired = True
+            except PermissionError:
+                pass  # alive, owned by another user
+        return expired
+
+    def start(self, work: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Run ``work`` (blocking, returns a result dict) in a thread; returns the job record"""
+        with self._state() as jobs:
+            current = next(reversed(jobs.values()), None)
+            if current is not None and current["status"] in ACTIVE_STATUSES:
+                return dict(current) if self.path else current
+
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "status": "queued",
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None,
+                "pid": os.getpid()
+            }
+            jobs[job["job_id"]] = job
+            self._trim(jobs)
+
+        task = asyncio.get_running_loop().create_task(self._run(job, work))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return dict(job) if self.path else job
+
+    def _update(self, job: Dict[str, Any], **fields: Any):
+        job.update(fields)
+        if self.path is not None:
+            with self._state() as jobs:
+                if job["job_id"] in jobs:
+                    jobs[job["job_id"]].update(fields)
+
+    async def _run(self, job: Dict[str, Any], work: Callable[[], Dict[str, Any]]):
+        self._update(job, status="running", started_at=time.time())
+        print(f"🔄 Re-index job {job['job_id']} started")
+        try:
+            result = await asyncio.to_thread(work)
+            self._update(job, result=result, status="succeeded", finished_at=time.time())
+            print(f"✅ Re-index job {job['job_id']} finished")
+        except Exception as e:
+            self._update(job, error=str(e), status="failed", finished_at=time.time())
+            print(f"❌ Re-index job {job['job_id']} failed: {e}")
+
+    def _trim(self, jobs: Dict[str, Dict[str, Any]]):
+        finished = [job_id for job_id, job in jobs.items() if job["status"] in ("succeeded", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._state(write=False) as jobs:
+            return jobs.get(job_id)
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """The most recently started job"""
+        with self._state(write=False) as jobs:
+            return next(reversed(jobs.values()), None)
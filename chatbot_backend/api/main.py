@@ -3,17 +3,28 @@ FastAPI main application for the chatbot backend
 """
 import os
 import sys
-from fastapi import FastAPI, HTTPException
+import json
+import math
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional
 import uvicorn
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import settings
 from rag.query_engine import RAGQueryEngine
-from scraper.website_scraper import WebsiteScraper
+from rag.http_client import aclose_http_clients, upstream_stats
+from rag.metrics import (REGISTRY, render_snapshot, record_stage, server_timing_header,
+                         stage, start_request_timings)
+from api.admission import AdmissionController, AdmissionRejected
+from api.jobs import ReindexJobs
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -31,8 +42,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize global components
+# Request counts and latencies per route template
+HTTP_REQUESTS = REGISTRY.counter(
+    "chatbot_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_SECONDS = REGISTRY.histogram(
+    "chatbot_http_request_duration_seconds", "Time until the response headers are sent", ("method", "route"))
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    HTTP_SECONDS.observe(time.perf_counter() - started, request.method, path)
+    HTTP_REQUESTS.inc(1, request.method, path, str(response.status_code))
+    return response
+
+# Initialize global components (query_engine is set once the index is loaded)
 query_engine = None
+# Background initialization progress, reported by /health and /readyz
+startup_state: Dict[str, Any] = {
+    "phase": "starting",  # starting, loading_index, scraping, embedding, ready, failed
+    "started_at": time.time(),
+    "ready_at": None,
+    "error": None
+}
+initialization_task: Optional[asyncio.Task] = None
+refresh_task: Optional[asyncio.Task] = None
+admission = AdmissionController(
+    settings.CHAT_MAX_CONCURRENCY,
+    settings.CHAT_MAX_QUEUE,
+    settings.CHAT_MAX_QUEUE_PER_CLIENT,
+    settings.CHAT_QUEUE_TIMEOUT
+)
+# With a shared store every worker sees the same re-index jobs
+reindex_jobs = ReindexJobs(
+    path=os.path.join(settings.VECTOR_STORE_DIR, "reindex_jobs.json") if settings.VECTOR_STORE_SHARED else None
+)
 
 # Pydantic models for API
 class ChatMessage(BaseModel):
@@ -47,52 +93,175 @@ class ChatResponse(BaseModel):
     suggested_actions: List[str]
     session_id: Optional[str] = None
 
+class ChatBatchRequest(BaseModel):
+    queries: List[str]
+
+class ChatBatchResponse(BaseModel):
+    results: List[ChatResponse]
+
 class HealthCheck(BaseModel):
     status: str
     message: str
     vector_store_stats: Optional[Dict[str, int]] = None
+    startup: Optional[Dict[str, Any]] = None
+
+def set_startup_phase(phase: str):
+    startup_state["phase"] = phase
+    print(f"🚦 Startup phase: {phase}")
+
+def startup_progress() -> Dict[str, Any]:
+    """Startup phase and how long it has taken so far"""
+    finished_at = startup_state["ready_at"] or time.time()
+    return {**startup_state, "elapsed_seconds": round(finished_at - startup_state["started_at"], 3)}
 
 # Startup event
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the RAG system on startup"""
-    global query_engine
+    """Start initializing the RAG system in the background so the server binds immediately"""
+    global initialization_task
+    startup_state["started_at"] = time.time()
+    initialization_task = asyncio.create_task(initialize_rag())
+
+async def initialize_rag():
+    """Load (or, if empty, scrape and populate) the index off the event loop, then mark the API ready"""
+    global query_engine, refresh_task
     
     try:
+        set_startup_phase("loading_index")
         print("Initializing RAG Query Engine...")
-        query_engine = RAGQueryEngine()
+        engine = await asyncio.to_thread(RAGQueryEngine)
         
-        # Check if vector store is populated
-        stats = query_engine.vector_store.get_collection_stats()
-        total_docs = sum(stats.values())
+        # Populate the vector store if it is empty
+        try:
+            await asyncio.to_thread(populate_if_empty, engine, set_startup_phase)
+        except Exception as e:
+            print(f"Error populating vector store: {e}")
+            # Continue without RAG content for basic functionality
         
-        if total_docs == 0:
-            print("Vector store is empty. Scraping website and populating...")
-            await populate_vector_store()
-        else:
-            print(f"Vector store already populated with {total_docs} documents")
-            
+        query_engine = engine
+        if settings.VECTOR_STORE_SHARED:
+            refresh_task = asyncio.create_task(refresh_index_loop())
+        startup_state["ready_at"] = time.time()
+        set_startup_phase("ready")
         print("RAG system initialized successfully!")
         
     except Exception as e:
         print(f"Error initializing RAG system: {e}")
-        # Continue without RAG for basic functionality
+        startup_state["error"] = str(e)
+        set_startup_phase("failed")
 
-async def populate_vector_store():
-    """Populate vector store with scraped data"""
-    try:
-        # Scrape website content
-        scraper = WebsiteScraper()
-        scraped_data = scraper.scrape_all()
-        
-        # Populate vector store
-        query_engine.vector_store.populate_from_scraped_data(scraped_data)
-        
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled upstream connections"""
+    if refresh_task is not None:
+        refresh_task.cancel()
+    await aclose_http_clients()
+    print("HTTP clients closed")
+
+def populate_if_empty(engine: RAGQueryEngine, on_phase: Optional[Callable[[str], None]] = None):
+    """Scrape and populate an empty store; with a shared store only one worker does, the others load its result"""
+    with engine.vector_store.exclusive_write():
+        stats = engine.vector_store.get_collection_stats()
+        total_docs = sum(stats.values())
+        if total_docs:
+            print(f"Vector store already populated with {total_docs} documents")
+            return
+        print("Vector store is empty. Scraping website and populating...")
+        rebuild_index(engine, on_phase)
         print("Vector store populated successfully!")
-        
-    except Exception as e:
-        print(f"Error populating vector store: {e}")
-        raise
+    
+    # The loaded snapshot may be newer than the structured data read at construction
+    engine.structured_index.load_from_disk()
+
+async def refresh_index_loop():
+    """Shared mode: pick up index generations published by other workers"""
+    while True:
+        await asyncio.sleep(settings.VECTOR_STORE_REFRESH_INTERVAL)
+        try:
+            await asyncio.to_thread(query_engine.refresh_index)
+        except Exception as e:
+            print(f"Error refreshing vector store: {e}")
+
+def rebuild_index(engine: Optional[RAGQueryEngine] = None,
+                  on_phase: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Scrape the website and swap the refreshed content in (blocking; run off the event loop)"""
+    engine = engine or query_engine
+    
+    # Scrape website content; selenium and bs4 are only imported when scraping
+    if on_phase:
+        on_phase("scraping")
+    from scraper.website_scraper import WebsiteScraper
+    scraper = WebsiteScraper()
+    scraped_data = scraper.scrape_all()
+    
+    # Embed changes on a copy of the index, then swap it in for readers
+    if on_phase:
+        on_phase("embedding")
+    engine.vector_store.populate_from_scraped_data(scraped_data)
+    engine.structured_index.load(scraped_data)
+    return {"stats": engine.vector_store.get_collection_stats()}
+
+def client_key(request: Request, message: Optional[ChatMessage] = None) -> str:
+    """Who a request is queued as: user_id, else session_id, else address"""
+    client = None
+    if message is not None:
+        client = message.user_id or message.session_id
+    if not client:
+        client = request.client.host if request.client else "anonymous"
+    return client
+
+def locked_rebuild_index() -> Dict[str, Any]:
+    """rebuild_index holding the store's write lock for the whole job, so one re-index runs across workers"""
+    with query_engine.vector_store.exclusive_write():
+        return rebuild_index()
+
+async def admit(request: Request, message: Optional[ChatMessage] = None) -> float:
+    """Take a chat slot for this client or fail fast with 429"""
+    client = client_key(request, message)
+    try:
+        waited = await admission.acquire(client)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"{e}. Please retry shortly.",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    record_stage("queue", waited)
+    return time.monotonic()
+
+@asynccontextmanager
+async def admission_slot(client: str):
+    """Hold one chat slot for a block (raises AdmissionRejected when none can be had)"""
+    await admission.acquire(client)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        admission.release(time.monotonic() - started)
+
+def release_once(started: float) -> Callable[[], None]:
+    """A release for the slot taken at ``started`` that frees it only the first time it is called"""
+    released = False
+    
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(time.monotonic() - started)
+    return release
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """Streaming response that frees its chat slot however sending ends, even if the body never starts"""
+    
+    def __init__(self, content, release: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
 
 # API Routes
 
@@ -114,15 +283,36 @@ async def root():
         vector_store_stats=stats
     )
 
+@app.get("/livez")
+async def liveness():
+    """Liveness probe: the process is up and its event loop is responsive"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness():
+    """Readiness probe: 200 once the index is loaded and queries can be served, 503 before"""
+    progress = startup_progress()
+    if not query_engine:
+        return JSONResponse(status_code=503, content={"status": "not_ready", **progress})
+    return {"status": "ready", **progress}
+
 @app.get("/health", response_model=HealthCheck)
 async def health_check():
-    """Detailed health check"""
+    """Detailed health check, including startup progress"""
     global query_engine
     
+    progress = startup_progress()
     if not query_engine:
+        if startup_state["phase"] == "failed":
+            return HealthCheck(
+                status="unhealthy",
+                message=f"RAG system failed to initialize: {startup_state['error']}",
+                startup=progress
+            )
         return HealthCheck(
-            status="unhealthy", 
-            message="RAG system not initialized"
+            status="starting",
+            message=f"RAG system initializing ({startup_state['phase']})",
+            startup=progress
         )
     
     try:
@@ -132,7 +322,8 @@ async def health_check():
         return HealthCheck(
             status="healthy",
             message=f"RAG system operational with {total_docs} documents",
-            vector_store_stats=stats
+            vector_store_stats=stats,
+            startup=progress
         )
     except Exception as e:
         return HealthCheck(
@@ -141,7 +332,7 @@ async def health_check():
         )
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(message: ChatMessage):
+async def chat(message: ChatMessage, request: Request):
     """Main chat endpoint"""
     global query_engine
     
@@ -151,20 +342,24 @@ async def chat(message: ChatMessage):
             detail="RAG system not available. Please try again later."
         )
     
+    timings = start_request_timings()
+    started = await admit(request, message)
     try:
-        # Process the query through RAG
-        result = query_engine.process_query(message.message)
+        # Process the query through RAG without blocking the event loop
+        result = await query_engine.process_query_async(message.message, session_id=message.session_id)
         
         # Get suggested actions
         suggested_actions = query_engine.get_suggested_actions(result["intent"])
         
-        return ChatResponse(
-            response=result["response"],
-            intent=result["intent"],
-            sources=result["sources"],
-            suggested_actions=suggested_actions,
-            session_id=message.session_id
-        )
+        with stage("serialize"):
+            content = jsonable_encoder(ChatResponse(
+                response=result["response"],
+                intent=result["intent"],
+                sources=result["sources"],
+                suggested_actions=suggested_actions,
+                session_id=message.session_id
+            ))
+        return JSONResponse(content=content, headers={"Server-Timing": server_timing_header(timings)})
         
     except Exception as e:
         print(f"Error processing chat message: {e}")
@@ -172,34 +367,107 @@ async def chat(message: ChatMessage):
             status_code=500,
             detail="Error processing your message. Please try again."
         )
+    finally:
+        admission.release(time.monotonic() - started)
 
-@app.post("/scrape-and-update")
-async def scrape_and_update():
-    """Manually trigger website scraping and vector store update"""
+@app.post("/chat/stream")
+async def chat_stream(message: ChatMessage, request: Request):
+    """Chat endpoint streaming Server-Sent Events: meta, then tokens, then done"""
     global query_engine
     
     if not query_engine:
         raise HTTPException(
-            status_code=503,
-            detail="RAG system not available"
+            status_code=503, 
+            detail="RAG system not available. Please try again later."
         )
     
+    # The slot is held until the stream finishes (or the client disconnects)
+    release = release_once(await admit(request, message))
+    
+    async def event_stream():
+        try:
+            async for event in query_engine.stream_query_async(message.message, session_id=message.session_id):
+                data = event["data"]
+                if event["event"] == "meta":
+                    data = {**data, "session_id": message.session_id}
+                yield f"event: {event['event']}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            print(f"Error streaming chat message: {e}")
+            error = {"detail": "Error processing your message. Please try again."}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+        finally:
+            release()
+    
+    return AdmittedStreamingResponse(
+        event_stream(),
+        release,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch(request: ChatBatchRequest, http_request: Request):
+    """Answer many independent questions in one call (offline evaluation, ticket triage)"""
+    global query_engine
+    
+    if not query_engine:
+        raise HTTPException(
+            status_code=503, 
+            detail="RAG system not available. Please try again later."
+        )
+    
+    if len(request.queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BATCH_MAX_QUERIES} queries per batch"
+        )
+    
+    # Every chat completion in the batch takes its own slot (at most BATCH_MAX_CONCURRENCY at once)
+    client = client_key(http_request)
     try:
-        await populate_vector_store()
-        
-        stats = query_engine.vector_store.get_collection_stats()
-        return {
-            "status": "success",
-            "message": "Vector store updated successfully",
-            "stats": stats
-        }
+        results = await query_engine.process_queries_async(
+            request.queries, slot=lambda: admission_slot(client))
+        return ChatBatchResponse(results=[
+            ChatResponse(
+                response=result["response"],
+                intent=result["intent"],
+                sources=result["sources"],
+                suggested_actions=query_engine.get_suggested_actions(result["intent"])
+            )
+            for result in results
+        ])
         
     except Exception as e:
-        print(f"Error updating vector store: {e}")
+        print(f"Error processing chat batch: {e}")
         raise HTTPException(
             status_code=500,
-            detail=f"Error updating vector store: {str(e)}"
+            detail="Error processing your batch. Please try again."
+        )
+
+@app.post("/scrape-and-update", status_code=202)
+async def scrape_and_update():
+    """Start re-scraping and re-indexing in the background; poll the returned job for its status"""
+    global query_engine
+    
+    if not query_engine:
+        raise HTTPException(
+            status_code=503,
+            detail="RAG system not available"
         )
+    
+    job = reindex_jobs.start(locked_rebuild_index)
+    return {**job, "status_url": f"/scrape-and-update/{job['job_id']}"}
+
+@app.get("/scrape-and-update/{job_id}")
+async def scrape_and_update_status(job_id: str):
+    """Status of a re-index job: queued, running, succeeded or failed"""
+    job = reindex_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Unknown job"
+        )
+    return job
 
 @app.get("/stats")
 async def get_stats():
@@ -216,7 +484,17 @@ async def get_stats():
         stats = query_engine.vector_store.get_collection_stats()
         return {
             "collections": stats,
-            "total_documents": sum(stats.values())
+            "total_documents": sum(stats.values()),
+            # Recall sampling scans whole collections: keep it off the event loop
+            "storage": await asyncio.to_thread(query_engine.vector_store.get_storage_stats),
+            "embedding_cache": query_engine.vector_store.embedding_manager.get_cache_stats(),
+            "answer_cache": query_engine.answer_cache.stats(),
+            "structured_answers": query_engine.structured_index.stats(),
+            "upstreams": upstream_stats(),
+            "sessions": await asyncio.to_thread(query_engine.sessions.stats),
+            "admission": admission.stats(),
+            "reindex": reindex_jobs.current(),
+            "index_generation": query_engine.vector_store.persistence.generation
         }
     except Exception as e:
         raise HTTPException(
@@ -224,6 +502,58 @@ async def get_stats():
             detail=f"Error getting stats: {str(e)}"
         )
 
+@app.get("/metrics")
+async def metrics():
+    """Pipeline, cache, upstream and queue metrics in Prometheus text format"""
+    global query_engine
+    
+    parts = [REGISTRY.render()]
+    
+    # Upstream status codes and circuit state, from the breakers' own counters
+    upstreams = upstream_stats()
+    parts.append(render_snapshot(
+        "chatbot_upstream_responses_total", "OpenAI responses by endpoint and status code", "counter",
+        ("endpoint", "status"),
+        {(path, code): count for path, stats in upstreams.items() for code, count in stats["status_codes"].items()}))
+    parts.append(render_snapshot(
+        "chatbot_upstream_circuit_open", "1 while the endpoint's circuit breaker is not closed", "gauge",
+        ("endpoint",),
+        {(path,): int(stats["circuit"]["state"] != "closed") for path, stats in upstreams.items()}))
+    
+    # Admission queue
+    queue = admission.stats()
+    parts.append(render_snapshot("chatbot_admission_active", "Chat requests running", "gauge",
+                                 (), {(): queue["active"]}))
+    parts.append(render_snapshot("chatbot_admission_queue_depth", "Chat requests waiting for a slot", "gauge",
+                                 (), {(): queue["queue_depth"]}))
+    parts.append(render_snapshot("chatbot_admission_rejected_total", "Chat requests turned away with 429",
+                                 "counter", (), {(): queue["rejected"]}))
+    
+    if query_engine:
+        # Cache hits and misses, from the caches' own counters
+        embedding_caches = query_engine.vector_store.embedding_manager.get_cache_stats()
+        caches = {
+            "query_embeddings": embedding_caches["query_embeddings"],
+            "document_embeddings": embedding_caches["document_embeddings"],
+            "answers": query_engine.answer_cache.stats()
+        }
+        caches = {name: stats for name, stats in caches.items() if stats}
+        parts.append(render_snapshot("chatbot_cache_hits_total", "Cache hits", "counter", ("cache",),
+                                     {(name,): stats["hits"] for name, stats in caches.items()}))
+        parts.append(render_snapshot("chatbot_cache_misses_total", "Cache misses", "counter", ("cache",),
+                                     {(name,): stats["misses"] for name, stats in caches.items()}))
+        parts.append(render_snapshot(
+            "chatbot_structured_answers_total", "Queries answered from structured data", "counter",
+            (), {(): query_engine.structured_index.stats()["hits"]}))
+        parts.append(render_snapshot(
+            "chatbot_index_generation", "Vector store snapshot generation being served", "gauge",
+            (), {(): query_engine.vector_store.persistence.generation or 0}))
+        parts.append(render_snapshot(
+            "chatbot_vector_store_documents", "Documents per collection", "gauge", ("collection",),
+            {(name,): count for name, count in query_engine.vector_store.get_collection_stats().items()}))
+    
+    return Response(content="".join(parts), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/test-intent/{query}")
 async def test_intent_classification(query: str):
     """Test intent classification for a query"""
@@ -235,10 +565,14 @@ async def test_intent_classification(query: str):
             detail="RAG system not available"
         )
     
-    intent = query_engine.classify_intent(query)
+    query_embedding = await query_engine.vector_store.embedding_manager.generate_single_embedding_async(query)
+    intent, confidence, collections = query_engine.route_intent(query, query_embedding)
     return {
         "query": query,
         "classified_intent": intent,
+        "confidence": round(confidence, 4),
+        "collections": collections,
+        "keyword_intent": query_engine.classify_intent(query),
         "suggested_actions": query_engine.get_suggested_actions(intent)
     }
 
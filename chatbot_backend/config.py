@@ -8,6 +8,30 @@ class Settings:
     # OpenAI Configuration
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
     
+    # Shared HTTP client for OpenAI calls (connection pool, keep-alive, optional HTTP/2)
+    OPENAI_HTTP2: bool = os.getenv("OPENAI_HTTP2", "True").lower() == "true"
+    OPENAI_POOL_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_POOL_MAX_CONNECTIONS", "20"))
+    OPENAI_POOL_MAX_KEEPALIVE: int = int(os.getenv("OPENAI_POOL_MAX_KEEPALIVE", "10"))
+    OPENAI_KEEPALIVE_EXPIRY: float = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+    OPENAI_CONNECT_TIMEOUT: float = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+    OPENAI_READ_TIMEOUT: float = float(os.getenv("OPENAI_READ_TIMEOUT", "30"))
+    OPENAI_WRITE_TIMEOUT: float = float(os.getenv("OPENAI_WRITE_TIMEOUT", "10"))
+    OPENAI_POOL_TIMEOUT: float = float(os.getenv("OPENAI_POOL_TIMEOUT", "5"))
+    # Per-stage read timeouts
+    EMBEDDING_READ_TIMEOUT: float = float(os.getenv("EMBEDDING_READ_TIMEOUT", "30"))
+    CHAT_READ_TIMEOUT: float = float(os.getenv("CHAT_READ_TIMEOUT", "30"))
+    # Circuit breaker: open after this many consecutive 429/5xx/transport
+    # failures and fail fast for OPENAI_BREAKER_RESET_TIMEOUT seconds
+    OPENAI_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("OPENAI_BREAKER_FAILURE_THRESHOLD", "5"))
+    OPENAI_BREAKER_RESET_TIMEOUT: float = float(os.getenv("OPENAI_BREAKER_RESET_TIMEOUT", "30"))
+    # Client-side request rate per endpoint (0 = only honour the API's rate-limit headers)
+    EMBEDDING_RATE_LIMIT_RPS: float = float(os.getenv("EMBEDDING_RATE_LIMIT_RPS", "50"))
+    EMBEDDING_RATE_LIMIT_BURST: int = int(os.getenv("EMBEDDING_RATE_LIMIT_BURST", "50"))
+    CHAT_RATE_LIMIT_RPS: float = float(os.getenv("CHAT_RATE_LIMIT_RPS", "10"))
+    CHAT_RATE_LIMIT_BURST: int = int(os.getenv("CHAT_RATE_LIMIT_BURST", "20"))
+    # Longest a request waits for the rate limiter before failing fast
+    OPENAI_RATE_LIMIT_MAX_WAIT: float = float(os.getenv("OPENAI_RATE_LIMIT_MAX_WAIT", "2"))
+    
     # React App URL for scraping
     REACT_APP_URL: str = os.getenv("REACT_APP_URL", "http://localhost:5173")
     
@@ -22,14 +46,107 @@ class Settings:
     # Embedding Model (OpenAI)
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
     
+    # On-disk embedding cache keyed by (model, sha256(text)); empty path disables it
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "./data/embedding_cache.sqlite3")
+    EMBEDDING_CACHE_MAX_ENTRIES: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+    
+    # Embedding requests: batches bounded by tokens and items, sent concurrently,
+    # each failed batch retried on its own
+    EMBEDDING_BATCH_MAX_TOKENS: int = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+    EMBEDDING_BATCH_MAX_ITEMS: int = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "256"))
+    EMBEDDING_MAX_INPUT_TOKENS: int = int(os.getenv("EMBEDDING_MAX_INPUT_TOKENS", "8191"))
+    EMBEDDING_MAX_CONCURRENCY: int = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+    EMBEDDING_MAX_RETRIES: int = int(os.getenv("EMBEDDING_MAX_RETRIES", "3"))
+    EMBEDDING_RETRY_BACKOFF: float = float(os.getenv("EMBEDDING_RETRY_BACKOFF", "0.5"))
+    
+    # In-process LRU cache for query embeddings
+    QUERY_EMBEDDING_CACHE_SIZE: int = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+    QUERY_EMBEDDING_CACHE_TTL: float = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+    
     # LLM Configuration
     LLM_MODEL: str = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
     MAX_TOKENS: int = int(os.getenv("MAX_TOKENS", "1000"))
+    # Prompt budget for retrieved documents; the overflowing document is trimmed
+    # if at least CONTEXT_MIN_TRIM_TOKENS of it fit, and the rest are dropped
+    CONTEXT_MAX_TOKENS: int = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+    CONTEXT_MIN_TRIM_TOKENS: int = int(os.getenv("CONTEXT_MIN_TRIM_TOKENS", "50"))
     TEMPERATURE: float = float(os.getenv("TEMPERATURE", "0.7"))
     
+    # Semantic answer cache: reuse a response when a query embedding is this
+    # similar to a cached one and retrieval returned the same documents
+    ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+    ANSWER_CACHE_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+    
+    # Looser match used only when the LLM cannot answer in time
+    ANSWER_CACHE_FALLBACK_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_FALLBACK_THRESHOLD", "0.9"))
+    
+    # Latency budget: every request answers within REQUEST_DEADLINE seconds,
+    # keeping DEADLINE_RESERVE seconds to produce a fallback answer
+    REQUEST_DEADLINE: float = float(os.getenv("REQUEST_DEADLINE", "10"))
+    DEADLINE_RESERVE: float = float(os.getenv("DEADLINE_RESERVE", "0.25"))
+    # Hedging: start a second chat completion once the first has run longer
+    # than the observed HEDGE_PERCENTILE latency (needs HEDGE_MIN_SAMPLES calls)
+    HEDGE_REQUESTS: bool = os.getenv("HEDGE_REQUESTS", "false").lower() == "true"
+    HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    HEDGE_MIN_SAMPLES: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    LATENCY_WINDOW: int = int(os.getenv("LATENCY_WINDOW", "200"))
+    
+    # Conversation memory per session_id: recent turns within SESSION_MAX_TOKENS,
+    # older ones folded into a summary of at most SESSION_SUMMARY_MAX_TOKENS
+    SESSION_BACKEND: str = os.getenv("SESSION_BACKEND", "memory")  # "memory" or "sqlite"
+    SESSION_DB_PATH: str = os.getenv("SESSION_DB_PATH", "./data/sessions.sqlite3")
+    SESSION_MAX_SESSIONS: int = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+    SESSION_TTL: float = float(os.getenv("SESSION_TTL", "1800"))
+    SESSION_MAX_TOKENS: int = int(os.getenv("SESSION_MAX_TOKENS", "1000"))
+    SESSION_SUMMARY_MAX_TOKENS: int = int(os.getenv("SESSION_SUMMARY_MAX_TOKENS", "200"))
+    
+    # Batch chat: most queries per /chat/batch request, concurrent chat
+    # completions per batch, and queries scored per matrix product
+    BATCH_MAX_QUERIES: int = int(os.getenv("BATCH_MAX_QUERIES", "1000"))
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+    SEARCH_BATCH_BLOCK: int = int(os.getenv("SEARCH_BATCH_BLOCK", "256"))
+    
+    # Admission control for the chat endpoints: requests running at once,
+    # requests waiting (in total and per client), and the longest wait
+    # before a request is turned away with 429
+    CHAT_MAX_CONCURRENCY: int = int(os.getenv("CHAT_MAX_CONCURRENCY", "32"))
+    CHAT_MAX_QUEUE: int = int(os.getenv("CHAT_MAX_QUEUE", "128"))
+    CHAT_MAX_QUEUE_PER_CLIENT: int = int(os.getenv("CHAT_MAX_QUEUE_PER_CLIENT", "8"))
+    CHAT_QUEUE_TIMEOUT: float = float(os.getenv("CHAT_QUEUE_TIMEOUT", "5"))
+    
+    # Answer price and job lookups from structured data, skipping the LLM
+    STRUCTURED_ANSWERS_ENABLED: bool = os.getenv("STRUCTURED_ANSWERS_ENABLED", "true").lower() == "true"
+    
+    # Intent routing: when the best collection centroid beats the runner-up by
+    # at least this cosine margin, only that collection is searched
+    INTENT_ROUTER_MIN_MARGIN: float = float(os.getenv("INTENT_ROUTER_MIN_MARGIN", "0.02"))
+    
     # Data directories
     DATA_DIR: str = "./data"
     SCRAPED_CONTENT_DIR: str = "./data/scraped_content"
     JOB_LISTINGS_DIR: str = "./data/job_listings"
+    
+    # Simple vector store (binary .npy segments + metadata sidecars)
+    VECTOR_STORE_DIR: str = os.getenv("VECTOR_STORE_DIR", "./data/vector_store")
+    # Fold the append-only log into a new snapshot once it holds this many rows
+    # (at least COMPACT_MIN_ROWS, or COMPACT_RATIO of the snapshot size)
+    VECTOR_STORE_COMPACT_RATIO: float = float(os.getenv("VECTOR_STORE_COMPACT_RATIO", "0.5"))
+    VECTOR_STORE_COMPACT_MIN_ROWS: int = int(os.getenv("VECTOR_STORE_COMPACT_MIN_ROWS", "1000"))
+    # Compact in-memory codes for the coarse scan: "none", "float16" or "int8".
+    # Candidates (n_results * RESCORE_FACTOR) are rescored exactly in float32
+    VECTOR_STORE_QUANTIZATION: str = os.getenv("VECTOR_STORE_QUANTIZATION", "none").lower()
+    VECTOR_STORE_RESCORE_FACTOR: int = int(os.getenv("VECTOR_STORE_RESCORE_FACTOR", "10"))
+    # IVF approximate search for collections with at least ANN_MIN_ROWS rows.
+    # ANN_N_LISTS=0 picks ~sqrt(rows) lists; raise ANN_N_PROBE for recall, lower it for latency
+    ANN_MIN_ROWS: int = int(os.getenv("ANN_MIN_ROWS", "20000"))
+    ANN_N_LISTS: int = int(os.getenv("ANN_N_LISTS", "0"))
+    ANN_N_PROBE: int = int(os.getenv("ANN_N_PROBE", "8"))
+    # Retrain centroids once a collection has grown by this factor since the last build
+    ANN_REBUILD_GROWTH: float = float(os.getenv("ANN_REBUILD_GROWTH", "2.0"))
+    # Several worker processes on one host share the index: writers take a file
+    # lock and publish full snapshots, every worker mmaps the current generation
+    # read-only and checks for a newer one every REFRESH_INTERVAL seconds
+    VECTOR_STORE_SHARED: bool = os.getenv("VECTOR_STORE_SHARED", "false").lower() == "true"
+    VECTOR_STORE_REFRESH_INTERVAL: float = float(os.getenv("VECTOR_STORE_REFRESH_INTERVAL", "5"))
 
 settings = Settings()
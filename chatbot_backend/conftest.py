@@ -0,0 +1,22 @@
+"""
+Pytest setup shared by every test under the backend, including test_backend.py
+"""
+import os
+import sys
+import pytest
+
+# Add backend directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import settings
+
+
+@pytest.fixture(scope="session", autouse=True)
+def isolated_data_paths(tmp_path_factory):
+    """Keep the on-disk caches, sessions and vector store of a test run out of ./data"""
+    root = tmp_path_factory.mktemp("data")
+    patch = pytest.MonkeyPatch()
+    patch.setattr(settings, "EMBEDDING_CACHE_PATH", str(root / "embedding_cache.sqlite3"))
+    patch.setattr(settings, "SESSION_DB_PATH", str(root / "sessions.sqlite3"))
+    patch.setattr(settings, "VECTOR_STORE_DIR", str(root / "vector_store"))
+    yield root
+    patch.undo()
@@ -0,0 +1,134 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index in pure NumPy
+
+Rows are clustered with spherical k-means; a query only scores the rows
+in the ``n_probe`` lists whose centroids are closest to it. Expects
+L2-normalized float32 rows, like the simple vector store keeps.
+
+Lists are only ever replaced, never written to, so a shallow ``copy()``
+can be changed while searches keep using the original.
+"""
+import copy
+import numpy as np
+from typing import Dict, Any, List, Mapping, Optional
+
+# Rows scored against the centroids at a time while assigning
+ASSIGN_BLOCK_ROWS = 8192
+
+
+class IVFIndex:
+    def __init__(self, n_lists: int, n_probe: int, kmeans_iterations: int = 10,
+                 training_rows_per_list: int = 64, seed: int = 0):
+        """Create an empty index with ``n_lists`` clusters"""
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.kmeans_iterations = kmeans_iterations
+        self.training_rows_per_list = training_rows_per_list
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[np.ndarray] = []
+        self.size = 0
+        self.built_size = 0
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (matrix / norms).astype(np.float32)
+
+    def _assign(self, matrix: np.ndarray) -> np.ndarray:
+        """Nearest centroid for every row, computed in blocks"""
+        assignments = np.empty(len(matrix), dtype=np.int32)
+        for start in range(0, len(matrix), ASSIGN_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+            assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    def build(self, matrix: np.ndarray):
+        """Train centroids on a sample of ``matrix`` and assign every row"""
+        rng = np.random.default_rng(self.seed)
+        n_lists = max(1, min(self.n_lists, len(matrix)))
+
+        sample_size = min(len(matrix), n_lists * self.training_rows_per_list)
+        sample = np.asarray(matrix[np.sort(rng.choice(len(matrix), size=sample_size, replace=False))],
+                            dtype=np.float32)
+
+        self.centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            assignments = np.argmax(sample @ self.centroids.T, axis=1)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=n_lists) == 0
+            # Re-seed empty clusters from random sample rows
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            self.centroids = self._normalize(sums)
+
+        assignments = self._assign(matrix)
+        order = np.argsort(assignments, kind="stable")
+        boundaries = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+        self.lists = [order[boundaries[i]:boundaries[i + 1]].astype(np.int64) for i in range(n_lists)]
+        self.size = len(matrix)
+        self.built_size = len(matrix)
+
+    def add(self, new_rows: np.ndarray):
+        """Assign rows appended after ``self.size`` to their nearest existing list"""
+        assignments = self._assign(new_rows)
+        row_ids = np.arange(self.size, self.size + len(new_rows), dtype=np.int64)
+        for list_id in np.unique(assignments):
+            self.lists[list_id] = np.concatenate([self.lists[list_id], row_ids[assignments == list_id]])
+        self.size += len(new_rows)
+
+    def remove(self, keep: np.ndarray):
+        """Drop the rows where the boolean mask ``keep`` is False and renumber the rest"""
+        new_ids = np.cumsum(keep, dtype=np.int64) - 1
+        self.lists = [new_ids[rows[keep[rows]]] for rows in self.lists]
+        self.size = int(keep.sum())
+
+    def copy(self) -> "IVFIndex":
+        """Copy whose lists can be added to or removed from without touching this index"""
+        index = copy.copy(self)
+        index.lists = list(self.lists)
+        return index
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """Arrays that fully describe the trained index (for persisting it)"""
+        sizes = [len(rows) for rows in self.lists]
+        return {
+            "centroids": self.centroids,
+            "offsets": np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)]).astype(np.int64),
+            "rows": (np.concatenate(self.lists) if self.lists else np.zeros(0)).astype(np.int64),
+            "params": np.array([self.n_lists, self.n_probe, self.kmeans_iterations,
+                                self.training_rows_per_list, self.seed, self.size, self.built_size],
+                               dtype=np.int64)
+        }
+
+    @classmethod
+    def from_state(cls, state: Mapping[str, np.ndarray]) -> "IVFIndex":
+        """Index restored from ``state()`` arrays, without retraining"""
+        n_lists, n_probe, iterations, rows_per_list, seed, size, built_size = state["params"].tolist()
+        index = cls(n_lists, n_probe, iterations, rows_per_list, seed)
+        index.centroids = np.asarray(state["centroids"], dtype=np.float32)
+        offsets = state["offsets"]
+        rows = np.asarray(state["rows"], dtype=np.int64)
+        index.lists = [rows[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        index.size = size
+        index.built_size = built_size
+        return index
+
+    def candidates(self, query: np.ndarray, n_probe: Optional[int] = None) -> np.ndarray:
+        """Sorted row indices from the lists closest to ``query``"""
+        n_probe = min(n_probe or self.n_probe, len(self.lists))
+        centroid_scores = self.centroids @ query
+        probed = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        return np.sort(np.concatenate([self.lists[i] for i in probed]))
+
+    def stats(self) -> Dict[str, Any]:
+        """Index shape for the stats endpoint"""
+        sizes = [len(rows) for rows in self.lists]
+        return {
+            "type": "ivf",
+            "n_lists": len(self.lists),
+            "n_probe": self.n_probe,
+            "indexed_rows": self.size,
+            "largest_list": max(sizes) if sizes else 0
+        }
@@ -0,0 +1,111 @@
+"""
+Semantic answer cache for the RAG query engine
+
+Keeps recent (query embedding, intent, retrieved document IDs, response)
+entries. A new query reuses a cached response when its embedding is close
+enough to a cached query and retrieval picked the same documents. Any
+change to the vector store's content invalidates the whole cache.
+"""
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_entries: int, threshold: float, embedding_dim: int):
+        """Cache up to ``max_entries`` answers, matched at cosine similarity >= ``threshold``"""
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._vectors = np.zeros((max_entries, embedding_dim), dtype=np.float32)
+        # slot -> entry, in least- to most-recently used order
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._store_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _check_version(self, store_version: int):
+        if store_version != self._store_version:
+            self._entries.clear()
+            self._free_slots = list(range(self.max_entries - 1, -1, -1))
+            self._store_version = store_version
+
+    def lookup(self, query_embedding: Sequence[float], intent: str, doc_ids: List[str],
+               store_version: int) -> Optional[str]:
+        """Cached response for a paraphrase of an earlier query, if any"""
+        vector = self._unit(query_embedding)
+        with self._lock:
+            self._check_version(store_version)
+            if vector is None or not self._entries:
+                self.misses += 1
+                return None
+
+            slots = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+            similarities = self._vectors[slots] @ vector
+            wanted = tuple(doc_ids)
+            for i in np.argsort(-similarities):
+                if similarities[i] < self.threshold:
+                    break
+                entry = self._entries[int(slots[i])]
+                if entry["intent"] == intent and entry["doc_ids"] == wanted:
+                    self._entries.move_to_end(int(slots[i]))
+                    self.hits += 1
+                    return entry["response"]
+
+            self.misses += 1
+            return None
+
+    def nearest(self, query_embedding: Sequence[float], intent: str, min_similarity: float,
+                store_version: int) -> Optional[str]:
+        """Best cached response for the intent at ``min_similarity`` or above, ignoring retrieved documents"""
+        vector = self._unit(query_embedding)
+        with self._lock:
+            self._check_version(store_version)
+            best, best_similarity = None, min_similarity
+            for slot, entry in self._entries.items():
+                if entry["intent"] != intent:
+                    continue
+                similarity = float(self._vectors[slot] @ vector) if vector is not None else -1.0
+                if similarity >= best_similarity:
+                    best, best_similarity = entry["response"], similarity
+            return best
+
+    def store(self, query_embedding: Sequence[float], intent: str, doc_ids: List[str],
+              response: str, store_version: int):
+        """Remember a generated response, evicting the least recently used entry when full"""
+        vector = self._unit(query_embedding)
+        if vector is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._check_version(store_version)
+            if not self._free_slots:
+                slot, _ = self._entries.popitem(last=False)
+                self._free_slots.append(slot)
+            slot = self._free_slots.pop()
+            self._vectors[slot] = vector
+            self._entries[slot] = {"intent": intent, "doc_ids": tuple(doc_ids), "response": response}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
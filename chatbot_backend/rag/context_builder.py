@@ -0,0 +1,51 @@
+"""
+Token-budgeted context assembly for chat completions
+
+Retrieved documents are packed in relevance order until the budget is
+spent; the document that crosses the budget is trimmed (when enough room
+is left to be useful) and everything after it is dropped.
+"""
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from rag.tokens import count_tokens, truncate_to_tokens
+
+# Tokens taken by the "- " bullet and newline around each document
+_DOC_OVERHEAD_TOKENS = 2
+
+
+def document_tokens(doc: Dict[str, Any]) -> int:
+    """Token count of a retrieved document, using the count cached at ingestion when present"""
+    cached = doc.get("token_count")
+    if cached is not None:
+        return cached
+    return count_tokens(doc["content"], settings.LLM_MODEL)
+
+
+def build_context(docs: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> Tuple[str, int]:
+    """Context string for ``docs`` (most relevant first) within ``max_tokens``, and the tokens it uses"""
+    if max_tokens is None:
+        max_tokens = settings.CONTEXT_MAX_TOKENS
+
+    ranked = sorted(docs, key=lambda doc: doc.get("similarity", 1 - doc.get("distance", 1)), reverse=True)
+    lines = []
+    used = 0
+    for doc in ranked:
+        remaining = max_tokens - used - _DOC_OVERHEAD_TOKENS
+        tokens = document_tokens(doc)
+        if tokens <= remaining:
+            lines.append(f"- {doc['content']}\n")
+            used += tokens + _DOC_OVERHEAD_TOKENS
+            continue
+
+        # Trim the document that crosses the budget, then drop the tail
+        if remaining >= settings.CONTEXT_MIN_TRIM_TOKENS:
+            lines.append(f"- {truncate_to_tokens(doc['content'], remaining, settings.LLM_MODEL)}...\n")
+            used += remaining + _DOC_OVERHEAD_TOKENS
+        break
+
+    return "".join(lines), used
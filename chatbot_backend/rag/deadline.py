@@ -0,0 +1,116 @@
+"""
+Per-request deadlines, observed-latency tracking and hedged upstream calls
+"""
+import time
+import weakref
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+
+# Attempts hedged_call cancelled because another attempt already answered
+_hedge_losers: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+
+
+def cancelled_as_hedge_loser() -> bool:
+    """Whether the running task was cancelled only because a parallel hedged attempt won"""
+    task = asyncio.current_task()
+    return task is not None and task in _hedge_losers
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        """A point in time ``seconds`` from now that a request must answer by"""
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self, reserve: float = 0.0) -> bool:
+        """True once less than ``reserve`` seconds are left"""
+        return self.remaining() <= reserve
+
+    def timeout(self, cap: float, reserve: float = 0.0) -> float:
+        """Time an upstream call may take: the remaining budget minus ``reserve``, at most ``cap``"""
+        return max(0.0, min(cap, self.remaining() - reserve))
+
+
+class LatencyTracker:
+    def __init__(self, window: int):
+        """Rolling window of the last ``window`` call latencies (seconds)"""
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent: float, min_samples: int = 1) -> Optional[float]:
+        """The ``percent``-th percentile latency, or None with fewer than ``min_samples`` samples"""
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
+    def stats(self):
+        with self._lock:
+            count = len(self._samples)
+        return {
+            "samples": count,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99)
+        }
+
+
+async def hedged_call(make_call: Callable[[], Awaitable[Any]], timeout: float,
+                      hedge_after: Optional[float] = None,
+                      accept: Callable[[Any], bool] = lambda result: True) -> Any:
+    """Run ``make_call()``, starting a second attempt if the first has not finished after ``hedge_after``.
+
+    The first accepted result wins and the other attempt is cancelled (see
+    ``cancelled_as_hedge_loser``). If no attempt yields an accepted result,
+    the last result (or error) is returned (raised). Raises
+    ``asyncio.TimeoutError`` once ``timeout`` seconds pass without an answer;
+    attempts cancelled then are timeouts, not hedge losers.
+    """
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + timeout
+    pending = {asyncio.ensure_future(make_call())}
+    hedged = hedge_after is None or hedge_after >= timeout
+    last: Optional[asyncio.Future] = None
+    won = False
+
+    try:
+        while pending:
+            wait_for = give_up_at - loop.time()
+            if not hedged:
+                wait_for = min(wait_for, hedge_after)
+            if wait_for <= 0 and hedged:
+                raise asyncio.TimeoutError()
+
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, wait_for),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                last = task
+                if task.exception() is None and accept(task.result()):
+                    won = True
+                    return task.result()
+
+            if not hedged and (not done or not pending):
+                # Slow (or failed) first attempt: fire the hedge
+                hedged = True
+                pending.add(asyncio.ensure_future(make_call()))
+    finally:
+        for task in pending:
+            if won:
+                _hedge_losers.add(task)
+            task.cancel()
+
+    if last is None:
+        raise asyncio.TimeoutError()
+    return last.result()
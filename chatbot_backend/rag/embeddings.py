@@ -3,13 +3,22 @@ OpenAI-based embedding generation for RAG system (no heavy ML dependencies)
 """
 import os
 import sys
-from typing import List, Dict, Any
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 import openai
 import numpy as np
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import settings
+from rag.embedding_cache import EmbeddingCache
+from rag.caching import TTLCache, SingleFlight, AsyncSingleFlight
+from rag.tokens import count_tokens, truncate_to_tokens
+from rag.http_client import post_openai, post_openai_async
+from rag.resilience import UpstreamUnavailable
+from rag.metrics import record_usage
 
 class EmbeddingManager:
     def __init__(self):
@@ -17,100 +26,302 @@ class EmbeddingManager:
         self.client = None  # Force direct API usage to avoid client library issues
         self.embedding_dim = 1536  # OpenAI ada-002 embedding dimension
         self.model_name = "text-embedding-ada-002"
+        
+        # Persistent cache so unchanged texts are never re-embedded
+        self.cache = None
+        if settings.EMBEDDING_CACHE_PATH:
+            try:
+                self.cache = EmbeddingCache(settings.EMBEDDING_CACHE_PATH,
+                                            settings.EMBEDDING_CACHE_MAX_ENTRIES)
+            except Exception as e:
+                print(f"⚠️ Embedding cache unavailable: {e}")
+        
+        # Repeated queries skip the API round trip; concurrent misses share one call
+        self.query_cache = TTLCache(settings.QUERY_EMBEDDING_CACHE_SIZE,
+                                    settings.QUERY_EMBEDDING_CACHE_TTL)
+        self.query_flight = SingleFlight()
+        self.async_query_flight = AsyncSingleFlight()
         print("✅ Embedding manager initialized with direct API calls")
     
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for a list of texts using OpenAI"""
+    def _parse_embeddings(self, response) -> Optional[List[List[float]]]:
+        """Embeddings from an API response in input order, or None on an error status"""
+        if response.status_code == 200:
+            result = response.json()
+            record_usage(self.model_name, result.get("usage"))
+            return [item['embedding'] for item in sorted(result['data'], key=lambda item: item['index'])]
+        print(f"❌ OpenAI API Error {response.status_code}: {response.text}")
+        return None
+    
+    def _request_embeddings(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Call the OpenAI embeddings API; returns None on failure (UpstreamUnavailable propagates)"""
         try:
             # Always use direct API calls (skip client library)
             print(f"🔗 Generating embeddings for {len(texts)} texts using direct API...")
-            import requests
-            headers = {
-                "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-                "Content-Type": "application/json"
+            data = {
+                "model": self.model_name,
+                "input": texts
             }
+            response = post_openai("/embeddings", data, read_timeout=settings.EMBEDDING_READ_TIMEOUT)
+            return self._parse_embeddings(response)
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            print(f"Error generating embeddings: {e}")
+        return None
+    
+    async def _request_embeddings_async(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Async counterpart of _request_embeddings"""
+        try:
+            print(f"🔗 Generating embeddings for {len(texts)} texts using direct API (async)...")
             data = {
                 "model": self.model_name,
                 "input": texts
             }
-            response = requests.post("https://api.openai.com/v1/embeddings", 
-                                   headers=headers, json=data, timeout=30)
-            if response.status_code == 200:
-                result = response.json()
-                embeddings = [item['embedding'] for item in result['data']]
-                print(f"✅ Successfully generated {len(embeddings)} embeddings")
-                return embeddings
-            else:
-                print(f"❌ OpenAI API Error {response.status_code}: {response.text}")
-                # Continue to fallback section below
-            
-            # Old fallback code (keeping for reference but shouldn't be reached)
-            if False:
-                # Use requests directly as fallback
-                import requests
-                headers = {
-                    "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-                    "Content-Type": "application/json"
-                }
-                data = {
-                    "model": self.model_name,
-                    "input": texts
-                }
-                response = requests.post("https://api.openai.com/v1/embeddings", 
-                                       headers=headers, json=data)
-                if response.status_code == 200:
-                    return [embedding['embedding'] for embedding in response.json()['data']]
-                else:
-                    raise Exception(f"Embedding API request failed: {response.text}")
+            response = await post_openai_async("/embeddings", data,
+                                               read_timeout=settings.EMBEDDING_READ_TIMEOUT)
+            return self._parse_embeddings(response)
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             print(f"Error generating embeddings: {e}")
-            # Return zero vectors as fallback
-            return [[0.0] * self.embedding_dim for _ in texts]
+        return None
     
-    def generate_single_embedding(self, text: str) -> List[float]:
-        """Generate embedding for a single text using OpenAI"""
+    def _make_batches(self, texts: List[str]) -> List[List[int]]:
+        """Group text indices into batches bounded by a token budget and an item cap"""
+        batches = []
+        current: List[int] = []
+        current_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = count_tokens(text, self.model_name)
+            if current and (current_tokens + tokens > settings.EMBEDDING_BATCH_MAX_TOKENS
+                            or len(current) >= settings.EMBEDDING_BATCH_MAX_ITEMS):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _request_batch_with_retries(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Embed one batch, retrying it alone with exponential backoff"""
+        for attempt in range(settings.EMBEDDING_MAX_RETRIES + 1):
+            if attempt:
+                time.sleep(settings.EMBEDDING_RETRY_BACKOFF * 2 ** (attempt - 1))
+                print(f"🔁 Retrying embedding batch of {len(texts)} texts (attempt {attempt + 1})")
+            try:
+                embeddings = self._request_embeddings(texts)
+            except UpstreamUnavailable as e:
+                # Retrying cannot help while the circuit is open
+                print(f"⛔ Embeddings unavailable: {e}")
+                return None
+            if embeddings is not None and len(embeddings) == len(texts):
+                return embeddings
+        return None
+    
+    async def _request_batch_with_retries_async(self, texts: List[str],
+                                                semaphore: asyncio.Semaphore) -> Optional[List[List[float]]]:
+        """Async counterpart of _request_batch_with_retries, bounded by ``semaphore``"""
+        async with semaphore:
+            for attempt in range(settings.EMBEDDING_MAX_RETRIES + 1):
+                if attempt:
+                    await asyncio.sleep(settings.EMBEDDING_RETRY_BACKOFF * 2 ** (attempt - 1))
+                    print(f"🔁 Retrying embedding batch of {len(texts)} texts (attempt {attempt + 1})")
+                try:
+                    embeddings = await self._request_embeddings_async(texts)
+                except UpstreamUnavailable as e:
+                    print(f"⛔ Embeddings unavailable: {e}")
+                    return None
+                if embeddings is not None and len(embeddings) == len(texts):
+                    return embeddings
+        return None
+    
+    def _plan_requests(self, texts: List[str]) -> Tuple[List[Optional[List[float]]], List[int],
+                                                         List[str], List[str], List[List[int]]]:
+        """Cache lookup plus batching of the distinct misses"""
+        cached = self.cache.get_many(self.model_name, texts) if self.cache else [None] * len(texts)
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
+        if self.cache:
+            print(f"💾 Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+        
+        # Each distinct text is sent once, clipped to the model's input limit
+        missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+        request_texts = [truncate_to_tokens(text, settings.EMBEDDING_MAX_INPUT_TOKENS, self.model_name)
+                         for text in missing_texts]
+        return cached, missing, missing_texts, request_texts, self._make_batches(request_texts)
+    
+    def _merge_batches(self, texts: List[str], cached: List[Optional[List[float]]], missing: List[int],
+                       missing_texts: List[str], batches: List[List[int]],
+                       batch_results: List[Optional[List[List[float]]]]) -> List[Optional[List[float]]]:
+        """Fill cache misses from the batch results (in input order) and cache the successes"""
+        by_text: Dict[str, List[float]] = {}
+        failed = 0
+        for batch, embeddings in zip(batches, batch_results):
+            if embeddings is None:
+                failed += len(batch)
+                continue
+            batch_texts = [missing_texts[i] for i in batch]
+            by_text.update(zip(batch_texts, embeddings))
+            if self.cache:
+                self.cache.put_many(self.model_name, batch_texts, embeddings)
+        if failed:
+            print(f"⚠️ {failed} texts could not be embedded after retries")
+        
+        for i in missing:
+            cached[i] = by_text.get(texts[i])
+        return cached
+    
+    def _embed_texts(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Embeddings in input order; None where the text could not be embedded"""
+        cached, missing, missing_texts, request_texts, batches = self._plan_requests(texts)
+        if not missing:
+            return cached
+        
+        # Fan the batches out with bounded concurrency; a failed batch only
+        # affects its own texts
+        workers = max(1, min(settings.EMBEDDING_MAX_CONCURRENCY, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            batch_results = list(pool.map(
+                lambda batch: self._request_batch_with_retries([request_texts[i] for i in batch]),
+                batches
+            ))
+        return self._merge_batches(texts, cached, missing, missing_texts, batches, batch_results)
+    
+    async def _embed_texts_async(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Async counterpart of _embed_texts"""
+        cached, missing, missing_texts, request_texts, batches = await asyncio.to_thread(
+            self._plan_requests, texts)
+        if not missing:
+            return cached
+        
+        semaphore = asyncio.Semaphore(max(1, settings.EMBEDDING_MAX_CONCURRENCY))
+        batch_results = await asyncio.gather(*(
+            self._request_batch_with_retries_async([request_texts[i] for i in batch], semaphore)
+            for batch in batches
+        ))
+        return await asyncio.to_thread(self._merge_batches, texts, cached, missing,
+                                       missing_texts, batches, list(batch_results))
+    
+    def _zero_fill(self, embeddings: List[Optional[List[float]]]) -> List[List[float]]:
+        # Return zero vectors as fallback
+        return [embedding if embedding is not None else [0.0] * self.embedding_dim
+                for embedding in embeddings]
+    
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for a list of texts using OpenAI (only cache misses hit the API)"""
+        return self._zero_fill(self._embed_texts(texts))
+    
+    async def generate_embeddings_async(self, texts: List[str]) -> List[List[float]]:
+        """Async counterpart of generate_embeddings"""
+        return self._zero_fill(await self._embed_texts_async(texts))
+    
+    def _request_single_embedding(self, text: str) -> Optional[List[float]]:
+        """Call the OpenAI embeddings API for one text; returns None on failure"""
         try:
             # Always use direct API calls (skip client library)
-            import requests
-            headers = {
-                "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-                "Content-Type": "application/json"
+            data = {
+                "model": self.model_name,
+                "input": [text]
             }
+            response = post_openai("/embeddings", data, read_timeout=settings.EMBEDDING_READ_TIMEOUT)
+            embeddings = self._parse_embeddings(response)
+            return embeddings[0] if embeddings else None
+        except Exception as e:
+            print(f"Error generating single embedding: {e}")
+        return None
+    
+    async def _request_single_embedding_async(self, text: str) -> Optional[List[float]]:
+        """Async counterpart of _request_single_embedding"""
+        try:
             data = {
                 "model": self.model_name,
                 "input": [text]
             }
-            response = requests.post("https://api.openai.com/v1/embeddings", 
-                                   headers=headers, json=data, timeout=30)
-            if response.status_code == 200:
-                result = response.json()
-                return result['data'][0]['embedding']
-            else:
-                print(f"❌ OpenAI API Error {response.status_code}: {response.text}")
-                # Continue to fallback section below
-            
-            # Old fallback code (keeping for reference but shouldn't be reached)
-            if False:
-                # Use requests directly as fallback
-                import requests
-                headers = {
-                    "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-                    "Content-Type": "application/json"
-                }
-                data = {
-                    "model": self.model_name,
-                    "input": [text]
-                }
-                response = requests.post("https://api.openai.com/v1/embeddings", 
-                                       headers=headers, json=data)
-                if response.status_code == 200:
-                    return response.json()['data'][0]['embedding']
-                else:
-                    raise Exception(f"Embedding API request failed: {response.text}")
+            response = await post_openai_async("/embeddings", data,
+                                               read_timeout=settings.EMBEDDING_READ_TIMEOUT)
+            embeddings = self._parse_embeddings(response)
+            return embeddings[0] if embeddings else None
         except Exception as e:
             print(f"Error generating single embedding: {e}")
+        return None
+    
+    def _query_cache_key(self, text: str) -> Tuple[str, str]:
+        """Queries differing only in case or whitespace share a cache entry"""
+        return self.model_name, " ".join(text.lower().split())
+    
+    def generate_single_embedding(self, text: str) -> List[float]:
+        """Generate embedding for a single text using OpenAI (cached, with concurrent misses coalesced)"""
+        key = self._query_cache_key(text)
+        embedding = self.query_cache.get(key)
+        if embedding is not None:
+            return embedding
+        
+        def fetch():
+            fetched = self._request_single_embedding(text)
+            if fetched is not None:
+                self.query_cache.set(key, fetched)
+            return fetched
+        
+        embedding = self.query_flight.do(key, fetch)
+        if embedding is None:
+            # Return zero vector as fallback
+            return [0.0] * self.embedding_dim
+        return embedding
+    
+    async def generate_query_embeddings_async(self, texts: List[str]) -> List[List[float]]:
+        """Embed many queries: query-cache hits are reused and the distinct misses go out in batched requests"""
+        keys = [self._query_cache_key(text) for text in texts]
+        embeddings: Dict[Tuple[str, str], Optional[List[float]]] = {key: self.query_cache.get(key) for key in keys}
+        # One request text per distinct cache key
+        misses = {key: text for key, text in zip(keys, texts) if embeddings[key] is None}
+        miss_keys = list(misses)
+        
+        if misses:
+            print(f"🔗 Embedding {len(misses)} of {len(texts)} queries in batches...")
+            request_texts = [truncate_to_tokens(misses[key], settings.EMBEDDING_MAX_INPUT_TOKENS, self.model_name)
+                             for key in miss_keys]
+            batches = self._make_batches(request_texts)
+            semaphore = asyncio.Semaphore(max(1, settings.EMBEDDING_MAX_CONCURRENCY))
+            batch_results = await asyncio.gather(*(
+                self._request_batch_with_retries_async([request_texts[i] for i in batch], semaphore)
+                for batch in batches
+            ))
+            for batch, results in zip(batches, batch_results):
+                if results is None:
+                    continue
+                for i, embedding in zip(batch, results):
+                    key = miss_keys[i]
+                    embeddings[key] = embedding
+                    self.query_cache.set(key, embedding)
+        
+        return self._zero_fill([embeddings[key] for key in keys])
+    
+    async def generate_single_embedding_async(self, text: str) -> List[float]:
+        """Async counterpart of generate_single_embedding (shares its cache)"""
+        key = self._query_cache_key(text)
+        embedding = self.query_cache.get(key)
+        if embedding is not None:
+            return embedding
+        
+        async def fetch():
+            fetched = await self._request_single_embedding_async(text)
+            if fetched is not None:
+                self.query_cache.set(key, fetched)
+            return fetched
+        
+        embedding = await self.async_query_flight.do(key, fetch)
+        if embedding is None:
             # Return zero vector as fallback
             return [0.0] * self.embedding_dim
+        return embedding
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the query and document embedding caches"""
+        return {
+            "query_embeddings": {**self.query_cache.stats(),
+                                 "coalesced": self.query_flight.coalesced + self.async_query_flight.coalesced},
+            "document_embeddings": self.cache.stats() if self.cache else None
+        }
     
     def prepare_documents_for_embedding(self, scraped_data: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Prepare documents from scraped data for embedding"""
@@ -220,10 +431,13 @@ class EmbeddingManager:
         texts = [doc["content"] for doc in documents]
         
         # Generate embeddings
-        embeddings = self.generate_embeddings(texts)
+        embeddings = self._embed_texts(texts)
         
-        # Add embeddings to documents
+        # Add embeddings to documents; documents whose batch failed are left
+        # without one (and skipped by the vector store) rather than given zero vectors
         for i, doc in enumerate(documents):
+            if embeddings[i] is None:
+                continue
             doc["embedding"] = embeddings[i]
             doc["embedding_dim"] = self.embedding_dim
         
@@ -0,0 +1,247 @@
+"""
+Shared, pooled HTTP client for all OpenAI API calls
+
+One long-lived client keeps TLS connections alive across requests (and
+multiplexes them over HTTP/2 when the ``h2`` package is installed) instead
+of paying a fresh handshake per call. Every call passes through the
+endpoint's circuit breaker and rate limiter (see rag.resilience).
+"""
+import os
+import sys
+import asyncio
+import time
+import weakref
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Dict, Optional
+import httpx
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from rag.resilience import UpstreamGuard, UpstreamUnavailable
+from rag.deadline import cancelled_as_hedge_loser
+
+OPENAI_API_BASE = "https://api.openai.com/v1"
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+# Async clients are bound to the event loop that created them: one per loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = \
+    weakref.WeakKeyDictionary()
+
+# Breaker + limiter per endpoint path, shared by sync and async calls
+_guards: Dict[str, UpstreamGuard] = {}
+_guards_lock = threading.Lock()
+
+
+def _http2_available() -> bool:
+    if not settings.OPENAI_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("ℹ️ HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1")
+        return False
+
+
+def _default_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=settings.OPENAI_CONNECT_TIMEOUT,
+        read=settings.OPENAI_READ_TIMEOUT,
+        write=settings.OPENAI_WRITE_TIMEOUT,
+        pool=settings.OPENAI_POOL_TIMEOUT
+    )
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.OPENAI_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY
+    )
+
+
+def openai_headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+
+def get_http_client() -> httpx.Client:
+    """The process-wide client, created on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    base_url=OPENAI_API_BASE,
+                    http2=_http2_available(),
+                    limits=_limits(),
+                    timeout=_default_timeout()
+                )
+    return _client
+
+
+def _request_timeout(read_timeout: Optional[float]) -> httpx.Timeout:
+    timeout = _default_timeout()
+    if read_timeout is None:
+        return timeout
+    return httpx.Timeout(connect=timeout.connect, read=read_timeout,
+                         write=timeout.write, pool=timeout.pool)
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """The async client for the running event loop, created on first use"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(
+            base_url=OPENAI_API_BASE,
+            http2=_http2_available(),
+            limits=_limits(),
+            timeout=_default_timeout()
+        )
+    return client
+
+
+async def aclose_async_http_client():
+    """Close the running event loop's async client, if it has one"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def run_async(coro: Awaitable[Any]) -> Any:
+    """``asyncio.run(coro)``, closing the async client the run's event loop used before it exits"""
+    async def run():
+        try:
+            return await coro
+        finally:
+            await aclose_async_http_client()
+    return asyncio.run(run())
+
+
+def get_guard(path: str) -> UpstreamGuard:
+    """Circuit breaker and rate limiter for an endpoint path"""
+    guard = _guards.get(path)
+    if guard is None:
+        with _guards_lock:
+            guard = _guards.get(path)
+            if guard is None:
+                if path == "/embeddings":
+                    rate, burst = settings.EMBEDDING_RATE_LIMIT_RPS, settings.EMBEDDING_RATE_LIMIT_BURST
+                else:
+                    rate, burst = settings.CHAT_RATE_LIMIT_RPS, settings.CHAT_RATE_LIMIT_BURST
+                guard = _guards[path] = UpstreamGuard(
+                    path, rate, burst,
+                    failure_threshold=settings.OPENAI_BREAKER_FAILURE_THRESHOLD,
+                    reset_timeout=settings.OPENAI_BREAKER_RESET_TIMEOUT,
+                    max_wait=settings.OPENAI_RATE_LIMIT_MAX_WAIT
+                )
+    return guard
+
+
+def upstream_stats() -> Dict[str, Any]:
+    """Breaker state, limiter state and response status counts per endpoint"""
+    with _guards_lock:
+        guards = dict(_guards)
+    return {path: guard.stats() for path, guard in guards.items()}
+
+
+def post_openai(path: str, payload: Dict[str, Any], read_timeout: Optional[float] = None) -> httpx.Response:
+    """POST JSON to an OpenAI endpoint (e.g. "/embeddings") over the shared client.
+    
+    Raises UpstreamUnavailable without sending when the endpoint's circuit is
+    open or its rate limit would hold the request too long.
+    """
+    guard = get_guard(path)
+    delay = guard.acquire()
+    if delay:
+        time.sleep(delay)
+    try:
+        response = get_http_client().post(path, headers=openai_headers(), json=payload,
+                                          timeout=_request_timeout(read_timeout))
+    except Exception:
+        guard.record_error()
+        raise
+    guard.record_response(response.status_code, response.headers)
+    return response
+
+
+async def post_openai_async(path: str, payload: Dict[str, Any],
+                            read_timeout: Optional[float] = None) -> httpx.Response:
+    """Async counterpart of post_openai over the shared async client"""
+    guard = get_guard(path)
+    delay = guard.acquire()
+    try:
+        if delay:
+            await asyncio.sleep(delay)
+        response = await get_async_http_client().post(path, headers=openai_headers(), json=payload,
+                                                      timeout=_request_timeout(read_timeout))
+    except asyncio.CancelledError:
+        if cancelled_as_hedge_loser():
+            # The other attempt answered; this one says nothing about the upstream
+            guard.release()
+        else:
+            # Deadline ran out (or the caller gave up) while the upstream hung
+            guard.record_error()
+        raise
+    except Exception:
+        guard.record_error()
+        raise
+    guard.record_response(response.status_code, response.headers)
+    return response
+
+
+@asynccontextmanager
+async def stream_openai_async(path: str, payload: Dict[str, Any], read_timeout: Optional[float] = None):
+    """Async context manager yielding a streamed response (for ``"stream": true`` requests).
+    
+    Error statuses count against the breaker straight away; a 200 counts as a
+    success only once the body has been read. Transport errors and timeouts
+    (a stream that stalls past its deadline) count as failures; a caller
+    that cancels or closes early, or fails on its own, records no verdict.
+    """
+    guard = get_guard(path)
+    delay = guard.acquire()
+    recorded = False
+    try:
+        if delay:
+            await asyncio.sleep(delay)
+        async with get_async_http_client().stream("POST", path, headers=openai_headers(), json=payload,
+                                                  timeout=_request_timeout(read_timeout)) as response:
+            if response.status_code != 200:
+                guard.record_response(response.status_code, response.headers)
+                recorded = True
+            yield response
+        if not recorded:
+            guard.record_response(response.status_code, response.headers)
+            recorded = True
+    except (httpx.HTTPError, asyncio.TimeoutError):
+        if not recorded:
+            guard.record_error()
+            recorded = True
+        raise
+    finally:
+        if not recorded:
+            # Cancelled, closed early or failed in the caller: nothing learned about the upstream
+            guard.release()
+
+
+def close_http_clients():
+    """Close the sync client's pooled connections"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+async def aclose_http_clients():
+    """Close the sync client and the running loop's async client (called on application shutdown)"""
+    close_http_clients()
+    await aclose_async_http_client()
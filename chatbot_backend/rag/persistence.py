@@ -0,0 +1,370 @@
+"""
+Binary on-disk format for the simple vector store
+
+Each collection is stored as a raw float32 ``.npy`` matrix that can be
+memory-mapped on load, plus a compact JSON sidecar with ids, documents,
+metadata and prompt token counts. A small manifest records the format version and row counts.
+
+Between snapshots, new documents are appended to a per-collection log
+(raw float32 rows plus one JSON record per batch, and tombstone records for
+removed ids) so an update costs I/O in proportion to the change, not the
+whole index. The log is replayed on load
+and folded into a fresh snapshot once it grows past the compaction
+threshold.
+
+Collections with an IVF index also store its centroids and inverted lists
+(``<name>.<generation>.ivf.npz``), so loading does not retrain it; log
+records replayed on load update the lists.
+"""
+import os
+import json
+import numpy as np
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+from rag.ann_index import IVFIndex
+from rag.segmented_matrix import append_rows, keep_rows
+
+FORMAT_VERSION = 1
+
+
+class VectorStorePersistence:
+    def __init__(self, directory: str, embedding_dim: int):
+        """Persist collections under ``directory``"""
+        self.directory = directory
+        self.embedding_dim = embedding_dim
+        self.manifest_file = os.path.join(directory, "manifest.json")
+        
+        # Generation of the snapshot on disk and rows appended to its logs since
+        self.generation: Optional[int] = None
+        self.base_rows = 0
+        self.log_rows = 0
+
+    def _vectors_file(self, name: str, generation: int) -> str:
+        return os.path.join(self.directory, f"{name}.{generation}.npy")
+
+    def _meta_file(self, name: str, generation: int) -> str:
+        return os.path.join(self.directory, f"{name}.{generation}.meta.json")
+
+    def _log_vectors_file(self, name: str, generation: int) -> str:
+        return os.path.join(self.directory, f"{name}.{generation}.log.f32")
+
+    def _log_records_file(self, name: str, generation: int) -> str:
+        return os.path.join(self.directory, f"{name}.{generation}.log.jsonl")
+
+    def _ann_file(self, name: str, generation: int) -> str:
+        return os.path.join(self.directory, f"{name}.{generation}.ivf.npz")
+
+    def _generation_files(self, name: str, generation: int) -> List[str]:
+        return [self._vectors_file(name, generation), self._meta_file(name, generation),
+                self._log_vectors_file(name, generation), self._log_records_file(name, generation),
+                self._ann_file(name, generation)]
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.manifest_file):
+            return None
+        with open(self.manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_json(path: str, data: Any):
+        """Write JSON atomically (temp file + rename)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _write_matrix(path: str, matrix: np.ndarray):
+        """Write a float32 matrix atomically (temp file + rename)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _write_arrays(path: str, arrays: Dict[str, np.ndarray]):
+        """Write named arrays as an .npz archive atomically (temp file + rename)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _load_ann(self, name: str, generation: int, rows: int) -> Optional[IVFIndex]:
+        """The collection's persisted IVF index, if it has one matching the snapshot"""
+        try:
+            with np.load(self._ann_file(name, generation)) as state:
+                index = IVFIndex.from_state(state)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Could not load IVF index for collection '{name}', it will be rebuilt: {e}")
+            return None
+        return index if index.size == rows else None
+
+    def exists(self) -> bool:
+        """Whether a binary snapshot has been written"""
+        return os.path.exists(self.manifest_file)
+
+    def current_generation(self) -> Optional[int]:
+        """Generation the manifest currently points at (another process may have published it)"""
+        try:
+            manifest = self._read_manifest()
+        except ValueError:
+            # Only possible mid-write on filesystems without atomic rename
+            return self.generation
+        return manifest["generation"] if manifest else None
+
+    @contextmanager
+    def writer_lock(self):
+        """Exclusive lock on the directory shared by every process writing to it (POSIX)"""
+        import fcntl
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "writer.lock"), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def save_snapshot(self, collections: Dict[str, Dict[str, Any]]):
+        """Write every collection as a new generation of files.
+
+        The manifest is switched over last, so a crash part-way through
+        leaves the previous snapshot intact.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        previous = self._read_manifest()
+        generation = previous["generation"] + 1 if previous else 1
+
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "generation": generation,
+            "embedding_dim": self.embedding_dim,
+            "collections": {}
+        }
+        for name, collection in collections.items():
+            self._write_matrix(self._vectors_file(name, generation), collection["embeddings"])
+            self._write_json(self._meta_file(name, generation), {
+                "ids": collection["ids"],
+                "hashes": collection["hashes"],
+                "documents": collection["documents"],
+                "metadatas": collection["metadatas"],
+                "token_counts": collection.get("token_counts"),
+                "token_model": collection.get("token_model")
+            })
+            manifest["collections"][name] = {"rows": len(collection["ids"])}
+            if collection.get("ann") is not None:
+                self._write_arrays(self._ann_file(name, generation), collection["ann"].state())
+                manifest["collections"][name]["ann"] = "ivf"
+
+        self._write_json(self.manifest_file, manifest)
+        self.generation = generation
+        self.base_rows = sum(info["rows"] for info in manifest["collections"].values())
+        self.log_rows = 0
+
+        # Old generation files (snapshot and logs) are unreachable now;
+        # open mmaps keep working on POSIX
+        if previous:
+            for name in previous["collections"]:
+                for path in self._generation_files(name, previous["generation"]):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def _append_record(self, name: str, record: Dict[str, Any]):
+        with open(self._log_records_file(name, self.generation), 'ab') as f:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _size(path: str) -> int:
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _undo_append(self, sizes: Dict[str, int]):
+        """Cut log files back to their sizes before a failed append, so no orphan bytes shift later rows"""
+        for path, size in sizes.items():
+            try:
+                if self._size(path) > size:
+                    os.truncate(path, size)
+            except OSError as e:
+                print(f"⚠️ Could not roll back {path}: {e}")
+
+    def append(self, name: str, ids: List[str], hashes: List[str], documents: List[str],
+               metadatas: List[Dict[str, Any]], embeddings: np.ndarray,
+               token_counts: Optional[List[int]] = None):
+        """Append a batch of new rows to a collection's log.
+
+        Vectors are written and fsynced before the JSON record that commits
+        them, so a crash can only leave uncommitted trailing bytes, which
+        recovery discards. If either write fails, both files are cut back to
+        where they were.
+        """
+        if self.generation is None:
+            raise RuntimeError("No snapshot to append to; call save_snapshot first")
+
+        vectors_file = self._log_vectors_file(name, self.generation)
+        records_file = self._log_records_file(name, self.generation)
+        sizes = {vectors_file: self._size(vectors_file), records_file: self._size(records_file)}
+        try:
+            with open(vectors_file, 'ab') as f:
+                f.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._append_record(name, {"op": "add", "rows": len(ids), "ids": ids, "hashes": hashes,
+                                       "documents": documents, "metadatas": metadatas,
+                                       "token_counts": token_counts})
+        except BaseException:
+            self._undo_append(sizes)
+            raise
+        self.log_rows += len(ids)
+
+    def append_tombstones(self, name: str, ids: List[str]):
+        """Record that ``ids`` were removed from a collection"""
+        if self.generation is None:
+            raise RuntimeError("No snapshot to append to; call save_snapshot first")
+
+        records_file = self._log_records_file(name, self.generation)
+        sizes = {records_file: self._size(records_file)}
+        try:
+            self._append_record(name, {"op": "delete", "rows": 0, "ids": ids})
+        except BaseException:
+            self._undo_append(sizes)
+            raise
+        self.log_rows += len(ids)
+
+    def needs_compaction(self, ratio: float, min_rows: int) -> bool:
+        """Whether the logs have grown enough to be folded into a new snapshot"""
+        return self.log_rows >= max(min_rows, ratio * self.base_rows)
+
+    def _replay_log(self, name: str, generation: int, collection: Dict[str, Any]) -> int:
+        """Apply committed log records to a loaded collection, truncating any torn tail"""
+        records_file = self._log_records_file(name, generation)
+        vectors_file = self._log_vectors_file(name, generation)
+        if not os.path.exists(records_file):
+            return 0
+
+        row_bytes = self.embedding_dim * np.dtype(np.float32).itemsize
+        vector_bytes = os.path.getsize(vectors_file) if os.path.exists(vectors_file) else 0
+        available_rows = vector_bytes // row_bytes
+
+        records = []
+        committed_rows = 0
+        committed_offset = 0
+        with open(records_file, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if committed_rows + record["rows"] > available_rows:
+                    break
+                records.append(record)
+                committed_rows += record["rows"]
+                committed_offset += len(line)
+
+        # Drop anything a crash left behind after the last committed record
+        if committed_offset != os.path.getsize(records_file):
+            print(f"⚠️ Discarding torn log tail for collection '{name}'")
+            os.truncate(records_file, committed_offset)
+        if vector_bytes != committed_rows * row_bytes:
+            os.truncate(vectors_file, committed_rows * row_bytes)
+
+        if not records:
+            return 0
+
+        vectors = np.zeros((0, self.embedding_dim), dtype=np.float32)
+        if committed_rows:
+            vectors = np.fromfile(vectors_file, dtype=np.float32,
+                                  count=committed_rows * self.embedding_dim)
+            vectors = vectors.reshape(committed_rows, self.embedding_dim)
+        offset = 0
+        for record in records:
+            index = collection.get("ann")
+            if record["op"] == "delete":
+                removed = set(record["ids"])
+                keep = np.array([doc_id not in removed for doc_id in collection["ids"]], dtype=bool)
+                collection["embeddings"] = keep_rows(collection["embeddings"], keep)
+                for key in ("ids", "hashes", "documents", "metadatas", "token_counts"):
+                    collection[key] = [value for value, kept in zip(collection[key], keep) if kept]
+                if index is not None:
+                    index.remove(keep)
+                continue
+
+            added = vectors[offset:offset + record["rows"]]
+            collection["embeddings"] = append_rows(collection["embeddings"], added)
+            if index is not None:
+                index.add(added)
+            offset += record["rows"]
+            collection["ids"].extend(record["ids"])
+            collection["hashes"].extend(record["hashes"])
+            collection["documents"].extend(record["documents"])
+            collection["metadatas"].extend(record["metadatas"])
+            collection["token_counts"].extend(record.get("token_counts") or [None] * record["rows"])
+
+        return committed_rows + sum(len(r["ids"]) for r in records if r["op"] == "delete")
+
+    def open_vectors(self, name: str) -> np.ndarray:
+        """Memory-map a collection's snapshot matrix (only complete while the log is empty)"""
+        manifest = self._read_manifest()
+        if manifest is None or not manifest["collections"].get(name, {}).get("rows"):
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        return np.load(self._vectors_file(name, manifest["generation"]), mmap_mode="r")
+
+    def load(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Load all collections, memory-mapping the snapshot matrices read-only and replaying the logs.
+
+        Collections saved with an IVF index come back with it under ``"ann"``.
+        """
+        manifest = self._read_manifest()
+        if manifest is None:
+            return None
+
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector store format: {manifest.get('format_version')}")
+        generation = manifest["generation"]
+
+        collections = {}
+        log_rows = 0
+        for name, info in manifest["collections"].items():
+            with open(self._meta_file(name, generation), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+
+            if info["rows"]:
+                embeddings = np.load(self._vectors_file(name, generation), mmap_mode="r")
+            else:
+                embeddings = np.zeros((0, manifest["embedding_dim"]), dtype=np.float32)
+
+            if embeddings.shape[0] != len(meta["ids"]):
+                raise ValueError(f"Collection '{name}' is corrupt: "
+                                 f"{embeddings.shape[0]} vectors for {len(meta['ids'])} documents")
+
+            collections[name] = {
+                "documents": meta["documents"],
+                "embeddings": embeddings,
+                "metadatas": meta["metadatas"],
+                "ids": meta["ids"],
+                # Snapshots written before content hashing have no hashes
+                "hashes": meta.get("hashes") or [None] * len(meta["ids"]),
+                # Older snapshots have no token counts; the vector store fills them in
+                "token_counts": meta.get("token_counts") or [None] * len(meta["ids"]),
+                "token_model": meta.get("token_model"),
+                "ann": self._load_ann(name, generation, info["rows"]) if info.get("ann") else None
+            }
+            log_rows += self._replay_log(name, generation, collections[name])
+
+        self.generation = generation
+        self.base_rows = sum(info["rows"] for info in manifest["collections"].values())
+        self.log_rows = log_rows
+        return collections
@@ -0,0 +1,52 @@
+"""
+Compact embedding codes for the simple vector store
+
+Vectors can be kept as float16 or as int8 with a per-vector scale. The
+coarse scan runs over the codes in fixed-size blocks so it never
+materializes a full float32 copy of the collection.
+"""
+import numpy as np
+from typing import Optional, Tuple
+
+QUANTIZATION_MODES = ("none", "float16", "int8")
+
+# Rows dequantized per block during the coarse scan
+SCAN_BLOCK_ROWS = 8192
+
+
+def quantize(matrix: np.ndarray, mode: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Encode a float32 matrix; returns (codes, per-row scales or None)"""
+    if mode == "float16":
+        return np.asarray(matrix, dtype=np.float16), None
+    if mode == "int8":
+        matrix = np.asarray(matrix, dtype=np.float32)
+        scales = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.zeros(0, dtype=np.float32)
+        scales = scales.astype(np.float32)
+        safe_scales = np.where(scales == 0, 1.0, scales)[:, None]
+        codes = np.clip(np.rint(matrix / safe_scales), -127, 127).astype(np.int8)
+        return codes, scales
+    raise ValueError(f"Unknown quantization mode: {mode}")
+
+
+def coarse_scores(codes: np.ndarray, scales: Optional[np.ndarray], query: np.ndarray,
+                  rows: Optional[np.ndarray] = None) -> np.ndarray:
+    """Approximate dot products between a float32 query and encoded rows"""
+    if rows is not None:
+        codes = codes[rows]
+        scales = scales[rows] if scales is not None else None
+
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+        block = codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+        scores[start:start + SCAN_BLOCK_ROWS] = block @ query
+    if scales is not None:
+        scores *= scales
+    return scores
+
+
+def code_bytes(codes: Optional[np.ndarray], scales: Optional[np.ndarray]) -> int:
+    """Memory held by the codes and scales"""
+    total = codes.nbytes if codes is not None else 0
+    if scales is not None:
+        total += scales.nbytes
+    return total
@@ -3,7 +3,13 @@ RAG Query Engine - Main component for processing user queries
 """
 import os
 import sys
-from typing import Dict, List, Any, Optional
+import json
+import time
+import hashlib
+import asyncio
+from contextlib import nullcontext
+from typing import Dict, List, Any, Optional, AsyncContextManager, AsyncIterator, Callable, Tuple
+import numpy as np
 import openai
 import re
 
@@ -11,6 +17,20 @@ import re
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import settings
 from rag.simple_vector_store import SimpleVectorStore
+from rag.http_client import post_openai_async, stream_openai_async, run_async
+from rag.answer_cache import SemanticAnswerCache
+from rag.structured_answers import StructuredAnswerIndex
+from rag.context_builder import build_context
+from rag.deadline import Deadline, LatencyTracker, hedged_call
+from rag.session_store import create_session_store
+from rag.metrics import stage, record_stage, record_usage
+
+# Collection holding the documents for each intent
+INTENT_COLLECTIONS = {"careers": "careers", "services": "services", "general": "general"}
+
+# Queries that lean on the previous turn ("what about Pune?", "and for AC?")
+FOLLOW_UP_PATTERN = re.compile(r"^(what|how) about\b|^(and|also|what if|same|instead)\b|^(it|that|those|these|them)\b")
+GREETINGS = {"hi", "hello", "hey", "thanks", "thank you", "ok", "okay", "bye"}
 
 class RAGQueryEngine:
     def __init__(self):
@@ -20,6 +40,23 @@ class RAGQueryEngine:
         # Initialize vector store
         self.vector_store = SimpleVectorStore()
         
+        # Reuse answers for paraphrased queries that retrieve the same documents
+        self.answer_cache = SemanticAnswerCache(
+            settings.ANSWER_CACHE_SIZE,
+            settings.ANSWER_CACHE_THRESHOLD,
+            self.vector_store.embedding_manager.embedding_dim
+        )
+        
+        # Conversation memory keyed by session_id
+        self.sessions = create_session_store()
+        
+        # Recent chat completion latencies, used to decide when to hedge
+        self.chat_latency = LatencyTracker(settings.LATENCY_WINDOW)
+        
+        # Exact answers for price and job lookups
+        self.structured_index = StructuredAnswerIndex()
+        self.structured_index.load_from_disk()
+        
         # Intent classification keywords
         self.intent_keywords = {
             "careers": [
@@ -42,16 +79,22 @@ class RAGQueryEngine:
                 "support", "help", "information", "details", "process", "works"
             ]
         }
+        # Whole-word matching, so "ac" does not match inside "contact"
+        self.intent_patterns = {
+            intent: re.compile(r"\b(" + "|".join(map(re.escape, keywords)) + r")\b")
+            for intent, keywords in self.intent_keywords.items()
+        }
+    
+    def keyword_scores(self, query: str) -> Dict[str, int]:
+        """Number of intent keywords appearing as whole words in the query"""
+        query_lower = query.lower()
+        return {intent: len(pattern.findall(query_lower)) for intent, pattern in self.intent_patterns.items()}
     
     def classify_intent(self, query: str) -> str:
         """Classify user query intent"""
-        query_lower = query.lower()
         
         # Count keyword matches for each intent
-        intent_scores = {}
-        for intent, keywords in self.intent_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in query_lower)
-            intent_scores[intent] = score
+        intent_scores = self.keyword_scores(query)
         
         # Get the intent with highest score
         if max(intent_scores.values()) == 0:
@@ -59,17 +102,59 @@ class RAGQueryEngine:
         
         return max(intent_scores, key=intent_scores.get)
     
-    def retrieve_relevant_docs(self, query: str, intent: str, n_results: int = 3) -> List[Dict[str, Any]]:
-        """Retrieve relevant documents from vector store"""
-        return self.vector_store.search_by_intent(query, intent, n_results)
+    def route_intent(self, query: str, query_embedding: List[float]) -> Tuple[str, float, List[str]]:
+        """Intent, confidence and collections to search, from the query embedding.
+        
+        The embedding is compared with each collection's centroid; confidence is
+        the cosine margin between the best and second-best intent. A confident
+        route searches one collection. Close calls are broken by keywords and
+        search the candidate intents' collections together.
+        """
+        centroids = self.vector_store.collection_centroids()
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        similarities = {
+            intent: float(centroids[collection] @ vector / norm)
+            for intent, collection in INTENT_COLLECTIONS.items()
+            if collection in centroids and norm
+        }
+        if not similarities:
+            # No usable embedding or empty store: keywords only
+            intent = self.classify_intent(query)
+            return intent, 0.0, self.vector_store.collections_for_intent(intent)
+        
+        ranked = sorted(similarities, key=similarities.get, reverse=True)
+        if len(ranked) == 1:
+            return ranked[0], 1.0, [INTENT_COLLECTIONS[ranked[0]]]
+        
+        confidence = similarities[ranked[0]] - similarities[ranked[1]]
+        if confidence >= settings.INTENT_ROUTER_MIN_MARGIN:
+            return ranked[0], confidence, [INTENT_COLLECTIONS[ranked[0]]]
+        
+        candidates = ranked[:2]
+        keyword_scores = self.keyword_scores(query)
+        keyword_intent = max(keyword_scores, key=keyword_scores.get)
+        if keyword_scores[keyword_intent] > 0 and keyword_intent not in candidates and keyword_intent in similarities:
+            candidates.append(keyword_intent)
+        intent = max(candidates, key=lambda i: (keyword_scores[i], similarities[i]))
+        return intent, confidence, [INTENT_COLLECTIONS[i] for i in candidates]
+    
+    def retrieve_relevant_docs(self, query: str, intent: str, n_results: int = 3,
+                               query_embedding: Optional[List[float]] = None,
+                               collection_names: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Retrieve relevant documents from vector store (the intent's collections unless given)"""
+        with stage("search"):
+            if collection_names is not None:
+                return self.vector_store.search(query, collection_names, n_results, query_embedding)
+            return self.vector_store.search_by_intent(query, intent, n_results, query_embedding)
     
-    def generate_response(self, query: str, context_docs: List[Dict[str, Any]], intent: str) -> str:
-        """Generate response using OpenAI with retrieved context"""
+    def _build_chat_request(self, query: str, context_docs: List[Dict[str, Any]], intent: str,
+                            session: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Chat completion payload for a query, its retrieved context and the session history"""
         
-        # Build context from retrieved documents
-        context = ""
-        for doc in context_docs:
-            context += f"- {doc['content']}\n"
+        # Pack retrieved documents into the context token budget
+        with stage("context"):
+            context, _ = build_context(context_docs)
         
         # Create intent-specific prompts
         if intent == "careers":
@@ -111,70 +196,128 @@ class RAGQueryEngine:
             
             Context information about the company:"""
         
-        # Construct the full prompt
-        full_prompt = f"""{system_prompt}
+        messages = [{"role": "system", "content": system_prompt}]
+        if session:
+            if session.get("summary"):
+                messages.append({"role": "system",
+                                 "content": f"Summary of the earlier conversation:\n{session['summary']}"})
+            for turn in session.get("turns", []):
+                messages.append({"role": "user", "content": turn["query"]})
+                messages.append({"role": "assistant", "content": turn["response"]})
+        messages.append({"role": "user", "content": f"Context: {context}\n\nQuestion: {query}"})
         
-{context}
-
-User Question: {query}
-
-Please provide a helpful, accurate response based on the context above. Be conversational and friendly."""
-
-        try:
-            # Always use direct API calls (skip client library)
-            print(f"🤖 Generating response using direct OpenAI Chat API...")
-            import requests
-            headers = {
-                "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            data = {
-                "model": settings.LLM_MODEL,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Context: {context}\n\nQuestion: {query}"}
-                ],
-                "max_tokens": settings.MAX_TOKENS,
-                "temperature": settings.TEMPERATURE
-            }
-            response = requests.post("https://api.openai.com/v1/chat/completions", 
-                                   headers=headers, json=data, timeout=30)
+        return {
+            "model": settings.LLM_MODEL,
+            "messages": messages,
+            "max_tokens": settings.MAX_TOKENS,
+            "temperature": settings.TEMPERATURE
+        }
+    
+    def _parse_chat_response(self, response, intent: str, query: str) -> str:
+        """Message text from a chat completion response, or the fallback on an error status"""
+        if response.status_code == 200:
+            result = response.json()
+            record_usage(settings.LLM_MODEL, result.get("usage"))
+            message = result["choices"][0]["message"]["content"].strip()
+            print(f"✅ Successfully generated response")
+            return message
+        print(f"❌ OpenAI Chat API Error {response.status_code}: {response.text}")
+        return self._get_fallback_response(intent, query)
+    
+    @staticmethod
+    def _chat_timeout(deadline: Optional[Deadline]) -> float:
+        """Read timeout for a chat call: the HTTP cap, shortened to fit the request deadline"""
+        if deadline is None:
+            return settings.CHAT_READ_TIMEOUT
+        return deadline.timeout(settings.CHAT_READ_TIMEOUT, settings.DEADLINE_RESERVE)
+    
+    async def generate_response_async(self, query: str, context_docs: List[Dict[str, Any]], intent: str,
+                                      deadline: Optional[Deadline] = None,
+                                      session: Optional[Dict[str, Any]] = None) -> str:
+        """Generate a response with OpenAI from the retrieved context; hedges slow calls when HEDGE_REQUESTS is on"""
+        timeout = self._chat_timeout(deadline)
+        if timeout <= 0:
+            print(f"⏱️ No time left for a chat completion, using fallback")
+            return self._get_fallback_response(intent, query)
+        
+        data = self._build_chat_request(query, context_docs, intent, session)
+        hedge_after = None
+        if settings.HEDGE_REQUESTS:
+            hedge_after = self.chat_latency.percentile(settings.HEDGE_PERCENTILE, settings.HEDGE_MIN_SAMPLES)
+        
+        async def attempt():
+            started = time.monotonic()
+            response = await post_openai_async("/chat/completions", data, read_timeout=timeout)
             if response.status_code == 200:
-                result = response.json()
-                message = result["choices"][0]["message"]["content"].strip()
-                print(f"✅ Successfully generated response")
-                return message
-            else:
-                print(f"❌ OpenAI Chat API Error {response.status_code}: {response.text}")
-                # Continue to fallback section below
-            
-            # Old fallback code (keeping for reference but shouldn't be reached)
-            if False:
-                import requests
-                headers = {
-                    "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-                    "Content-Type": "application/json"
-                }
-                data = {
-                    "model": settings.LLM_MODEL,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"Context: {context}\n\nQuestion: {query}"}
-                    ],
-                    "max_tokens": settings.MAX_TOKENS,
-                    "temperature": settings.TEMPERATURE
-                }
-                response = requests.post("https://api.openai.com/v1/chat/completions", 
-                                       headers=headers, json=data)
-                if response.status_code == 200:
-                    return response.json()["choices"][0]["message"]["content"].strip()
-                else:
-                    raise Exception(f"API request failed: {response.text}")
-            
+                self.chat_latency.record(time.monotonic() - started)
+            return response
+        
+        try:
+            print(f"🤖 Generating response using direct OpenAI Chat API (async)...")
+            with stage("llm"):
+                response = await hedged_call(attempt, timeout, hedge_after,
+                                             accept=lambda r: r.status_code == 200)
+            return self._parse_chat_response(response, intent, query)
+        except asyncio.TimeoutError:
+            print(f"⏱️ Chat completion missed the {timeout:.1f}s budget, using fallback")
+            return self._get_fallback_response(intent, query)
         except Exception as e:
             print(f"Error generating response: {e}")
             return self._get_fallback_response(intent, query)
     
+    async def stream_response_async(self, query: str, context_docs: List[Dict[str, Any]],
+                                    intent: str, deadline: Optional[Deadline] = None,
+                                    session: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Yield response text chunks as the upstream streams them (fallback text on failure).
+        
+        The first chunk has to arrive within the deadline; once the answer is
+        streaming it is allowed to finish.
+        """
+        timeout = self._chat_timeout(deadline)
+        data = {**self._build_chat_request(query, context_docs, intent, session), "stream": True}
+        streamed_any = False
+        started = time.perf_counter()
+        try:
+            if timeout <= 0:
+                raise asyncio.TimeoutError()
+            print(f"🤖 Streaming response from OpenAI Chat API...")
+            first_chunk_by = time.monotonic() + timeout
+            async with stream_openai_async("/chat/completions", data, read_timeout=timeout) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    print(f"❌ OpenAI Chat API Error {response.status_code}: {body.decode(errors='replace')}")
+                else:
+                    lines = response.aiter_lines()
+                    while True:
+                        try:
+                            if streamed_any:
+                                line = await lines.__anext__()
+                            else:
+                                line = await asyncio.wait_for(
+                                    lines.__anext__(), max(0.0, first_chunk_by - time.monotonic()))
+                        except StopAsyncIteration:
+                            break
+                        if not line.startswith("data:"):
+                            continue
+                        payload = line[len("data:"):].strip()
+                        if payload == "[DONE]":
+                            break
+                        choices = json.loads(payload).get("choices") or [{}]
+                        content = choices[0].get("delta", {}).get("content")
+                        if content:
+                            if not streamed_any:
+                                record_stage("llm_first_token", time.perf_counter() - started)
+                            streamed_any = True
+                            yield content
+        except asyncio.TimeoutError:
+            print(f"⏱️ No streamed answer within the {timeout:.1f}s budget, using fallback")
+        except Exception as e:
+            print(f"Error streaming response: {e}")
+        record_stage("llm", time.perf_counter() - started)
+        
+        if not streamed_any:
+            yield self._get_fallback_response(intent, query)
+    
     def _get_fallback_response(self, intent: str, query: str) -> str:
         """Provide fallback responses when OpenAI is unavailable"""
         
@@ -207,20 +350,10 @@ Here's how it works:
 We ensure all our service providers are verified and offer quality assurance. For more information, 
 feel free to explore our website or contact our support team."""
     
-    def process_query(self, query: str) -> Dict[str, Any]:
-        """Main method to process user query through RAG pipeline"""
-        
-        # Step 1: Classify intent
-        intent = self.classify_intent(query)
-        
-        # Step 2: Retrieve relevant documents
-        relevant_docs = self.retrieve_relevant_docs(query, intent)
-        
-        # Step 3: Generate response
-        response = self.generate_response(query, relevant_docs, intent)
-        
-        # Return structured result
-        result = {
+    def _build_result(self, query: str, intent: str, relevant_docs: List[Dict[str, Any]],
+                      response: str) -> Dict[str, Any]:
+        """Structured result returned by process_query"""
+        return {
             "query": query,
             "intent": intent,
             "response": response,
@@ -234,8 +367,305 @@ feel free to explore our website or contact our support team."""
             ],
             "num_sources": len(relevant_docs)
         }
+    
+    def _cached_answer(self, query_embedding: List[float], intent: str,
+                       relevant_docs: List[Dict[str, Any]]) -> Optional[str]:
+        """Previously generated answer for a near-identical query over the same documents"""
+        doc_ids = [doc["id"] for doc in relevant_docs]
+        response = self.answer_cache.lookup(query_embedding, intent, doc_ids, self.vector_store.version)
+        if response is not None:
+            print(f"♻️ Semantic answer cache hit ({intent})")
+        return response
+    
+    def _is_fallback(self, response: str, intent: str, query: str) -> bool:
+        return response == self._get_fallback_response(intent, query)
+    
+    def _best_fallback(self, query: str, query_embedding: List[float], intent: str) -> str:
+        """Closest cached answer for the intent when the LLM could not answer, else the static fallback"""
+        cached = self.answer_cache.nearest(query_embedding, intent, settings.ANSWER_CACHE_FALLBACK_THRESHOLD,
+                                           self.vector_store.version)
+        if cached is not None:
+            print(f"♻️ Answering from the semantic cache instead of the static fallback")
+            return cached
+        return self._get_fallback_response(intent, query)
+    
+    def _remember_answer(self, query: str, query_embedding: List[float], intent: str,
+                         relevant_docs: List[Dict[str, Any]], response: str):
+        """Cache a generated answer (fallback texts are not cached)"""
+        if self._is_fallback(response, intent, query):
+            return
+        doc_ids = [doc["id"] for doc in relevant_docs]
+        self.answer_cache.store(query_embedding, intent, doc_ids, response, self.vector_store.version)
+    
+    @staticmethod
+    def _has_history(session: Optional[Dict[str, Any]]) -> bool:
+        """Whether answers in this session depend on its conversation (so must not be shared via the answer cache)"""
+        return bool(session and (session.get("turns") or session.get("summary")))
+    
+    def _is_follow_up(self, query: str, session: Optional[Dict[str, Any]]) -> bool:
+        """Whether a query only makes sense after the session's previous turn"""
+        if not session or not session.get("turns"):
+            return False
+        text = " ".join(query.lower().strip(" ?!.").split())
+        if not text or text in GREETINGS:
+            return False
+        # General keywords are mostly question words ("what", "how"), so only topic keywords count
+        scores = self.keyword_scores(text)
+        topics = {intent: score for intent, score in scores.items() if intent != "general" and score}
+        if not topics:
+            # No topic of its own: "what about Pune?", or just "Pune?"
+            return FOLLOW_UP_PATTERN.search(text) is not None or len(text.split()) <= 3
+        # "and the salary?" continues a careers conversation; "what about AC repair?" changes topic
+        return FOLLOW_UP_PATTERN.search(text) is not None and max(topics, key=topics.get) == session.get("intent")
+    
+    @staticmethod
+    def _merge_docs(docs: List[Dict[str, Any]], previous_docs: List[Dict[str, Any]],
+                    limit: int) -> List[Dict[str, Any]]:
+        """New retrieval results first, then the previous turn's documents, without duplicates"""
+        merged, seen = [], set()
+        for doc in docs + previous_docs:
+            # Structured-answer sources have no id: tell them apart by content
+            key = doc.get("id") or hashlib.sha256(doc["content"].encode("utf-8")).hexdigest()
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(doc)
+        return merged[:limit]
+    
+    def _structured_answer(self, query: str, session: Optional[Dict[str, Any]],
+                           follow_up: bool) -> Optional[Dict[str, Any]]:
+        """Structured answer (intent, response, sources) for a price or job lookup, if the query is one"""
+        if not settings.STRUCTURED_ANSWERS_ENABLED:
+            return None
+        with stage("structured"):
+            answer = self.structured_index.answer(query)
+            if answer is None and follow_up:
+                answer = self.structured_index.answer_follow_up(session["context_query"], query)
+        if answer is not None:
+            print(f"⚡ Structured answer ({answer['intent']})")
+        return answer
+    
+    def _route(self, search_text: str, query_embedding: List[float], session: Optional[Dict[str, Any]],
+               follow_up: bool) -> Tuple[str, List[str]]:
+        """Intent and collections to search; follow-ups keep the previous turn's intent"""
+        with stage("intent"):
+            if follow_up:
+                return session["intent"], self.vector_store.collections_for_intent(session["intent"])
+            intent, _, collections = self.route_intent(search_text, query_embedding)
+            return intent, collections
+    
+    def process_query(self, query: str, deadline: Optional[Deadline] = None,
+                      session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Main method to process user query through RAG pipeline (blocking; for scripts)"""
+        return run_async(self.process_query_async(query, deadline, session_id))
+    
+    async def _embed_query_async(self, query: str, deadline: Deadline) -> List[float]:
+        """Query embedding, or a zero vector if it cannot be had within the deadline"""
+        embedding_manager = self.vector_store.embedding_manager
+        task = asyncio.ensure_future(embedding_manager.generate_single_embedding_async(query))
+        # Not cancelled on timeout: a late result still lands in the query embedding cache
+        with stage("embed"):
+            done, _ = await asyncio.wait({task}, timeout=deadline.timeout(settings.EMBEDDING_READ_TIMEOUT,
+                                                                          settings.DEADLINE_RESERVE))
+        if not done:
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            print(f"⏱️ Query embedding missed the deadline, falling back to keyword routing")
+            return [0.0] * embedding_manager.embedding_dim
+        return task.result()
+    
+    async def _retrieve_async(self, search_text: str, deadline: Deadline,
+                              session: Optional[Dict[str, Any]] = None, follow_up: bool = False):
+        """Intent, query embedding and retrieved documents, without blocking the event loop"""
+        
+        # Step 1: Embed the query upstream and route it to an intent
+        query_embedding = await self._embed_query_async(search_text, deadline)
+        intent, collections = self._route(search_text, query_embedding, session, follow_up)
+        
+        # Step 2: Search off the event loop
+        relevant_docs = await asyncio.to_thread(
+            self.retrieve_relevant_docs, search_text, intent, 3, query_embedding, collections)
+        if follow_up:
+            relevant_docs = self._merge_docs(relevant_docs, session.get("docs", []), 6)
+        return intent, query_embedding, relevant_docs
+    
+    async def _start_turn(self, query: str, deadline: Deadline,
+                          session_id: Optional[str]) -> Dict[str, Any]:
+        """Everything before generation: session, structured answer, retrieval and the answer cache.
         
-        return result
+        The returned turn carries ``response`` already when the query was
+        answered from structured data or the cache.
+        """
+        session = await self.sessions.get_async(session_id)
+        follow_up = self._is_follow_up(query, session)
+        search_text = f"{session['context_query']} {query}" if follow_up else query
+        turn = {"query": query, "session_id": session_id, "session": session,
+                "search_text": search_text, "query_embedding": None, "response": None,
+                # Answers shaped by one session's history stay out of the shared cache
+                "shared": not self._has_history(session)}
+        
+        # Step 0: Price and job lookups need neither embeddings nor the LLM
+        structured = self._structured_answer(query, session, follow_up)
+        if structured is not None:
+            turn.update(intent=structured["intent"], docs=structured["sources"], response=structured["response"])
+            return turn
+        
+        # Steps 1-2: Embed, route and retrieve
+        intent, query_embedding, relevant_docs = await self._retrieve_async(search_text, deadline,
+                                                                            session, follow_up)
+        turn.update(intent=intent, query_embedding=query_embedding, docs=relevant_docs)
+        
+        # Step 3: Reuse a cached answer
+        if turn["shared"]:
+            turn["response"] = self._cached_answer(query_embedding, intent, relevant_docs)
+        return turn
+    
+    def _generated_or_fallback(self, turn: Dict[str, Any], response: str) -> Tuple[str, bool]:
+        """The LLM's response and True, or the best fallback and False when the LLM could not answer"""
+        if self._is_fallback(response, turn["intent"], turn["query"]):
+            return self._best_fallback(turn["query"], turn["query_embedding"], turn["intent"]), False
+        return response, True
+    
+    async def _finish_turn(self, turn: Dict[str, Any], response: str, generated: bool) -> Dict[str, Any]:
+        """Cache a newly generated answer, record the turn in the session and build the result"""
+        if generated and turn["shared"]:
+            self._remember_answer(turn["query"], turn["query_embedding"], turn["intent"], turn["docs"], response)
+        await self.sessions.record_turn_async(turn["session_id"], turn["query"], response, turn["intent"],
+                                              turn["docs"], turn["search_text"])
+        return self._build_result(turn["query"], turn["intent"], turn["docs"], response)
+    
+    async def process_query_async(self, query: str, deadline: Optional[Deadline] = None,
+                                  session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Process a query without blocking the event loop (used by the API).
+        
+        The whole pipeline shares one deadline (REQUEST_DEADLINE by default);
+        when the LLM cannot answer in time, the closest cached answer or the
+        static fallback is returned instead. With a ``session_id`` the
+        conversation so far is sent along, and follow-up questions reuse the
+        previous turn's intent and documents.
+        """
+        if deadline is None:
+            deadline = Deadline(settings.REQUEST_DEADLINE)
+        turn = await self._start_turn(query, deadline, session_id)
+        if turn["response"] is not None:
+            return await self._finish_turn(turn, turn["response"], generated=False)
+        
+        # Step 4: Generate a new answer
+        response = await self.generate_response_async(query, turn["docs"], turn["intent"], deadline,
+                                                      turn["session"])
+        response, generated = self._generated_or_fallback(turn, response)
+        return await self._finish_turn(turn, response, generated)
+    
+    async def stream_query_async(self, query: str, deadline: Optional[Deadline] = None,
+                                 session_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Process a query as a stream of events.
+        
+        A ``meta`` event (intent, sources, suggested actions) is sent as soon as
+        retrieval finishes, then ``token`` events while the answer is
+        generated, then ``done`` with the full response.
+        """
+        if deadline is None:
+            deadline = Deadline(settings.REQUEST_DEADLINE)
+        turn = await self._start_turn(query, deadline, session_id)
+        intent = turn["intent"]
+        yield {"event": "meta", "data": {
+            "intent": intent,
+            "sources": self._build_result(query, intent, turn["docs"], "")["sources"],
+            "suggested_actions": self.get_suggested_actions(intent)
+        }}
+        
+        if turn["response"] is not None:
+            await self._finish_turn(turn, turn["response"], generated=False)
+            yield {"event": "token", "data": {"content": turn["response"]}}
+            yield {"event": "done", "data": {"response": turn["response"]}}
+            return
+        
+        chunks = []
+        generated = True
+        async for chunk in self.stream_response_async(query, turn["docs"], intent, deadline, turn["session"]):
+            if not chunks:
+                chunk, generated = self._generated_or_fallback(turn, chunk)
+            chunks.append(chunk)
+            yield {"event": "token", "data": {"content": chunk}}
+        
+        response = "".join(chunks)
+        await self._finish_turn(turn, response, generated)
+        yield {"event": "done", "data": {"response": response}}
+    
+    async def process_queries_async(self, queries: List[str],
+                                    slot: Optional[Callable[[], AsyncContextManager]] = None) -> List[Dict[str, Any]]:
+        """Process many independent queries, sharing embedding and retrieval work; results in input order.
+        
+        Structured lookups are answered directly; the rest are embedded in
+        batched requests, retrieved with one matrix product per collection
+        and answered with at most BATCH_MAX_CONCURRENCY chat completions in
+        flight, each under its own REQUEST_DEADLINE. Each completion runs
+        inside ``slot()`` when given (e.g. an admission slot); a query whose
+        slot cannot be had gets the fallback answer.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        
+        # Step 0: Price and job lookups need neither embeddings nor the LLM
+        pending = []
+        for i, query in enumerate(queries):
+            structured = self._structured_answer(query, None, False)
+            if structured is not None:
+                results[i] = self._build_result(query, structured["intent"], structured["sources"],
+                                                structured["response"])
+            else:
+                pending.append(i)
+        if not pending:
+            return results
+        
+        # Step 1: Embed all remaining queries together and route each one
+        with stage("embed"):
+            embeddings = await self.vector_store.embedding_manager.generate_query_embeddings_async(
+                [queries[i] for i in pending])
+        with stage("intent"):
+            routes = [self.route_intent(queries[i], embedding) for i, embedding in zip(pending, embeddings)]
+        
+        # Step 2: One retrieval pass for the whole batch
+        with stage("search"):
+            retrieved = await asyncio.to_thread(
+                self.vector_store.search_many, embeddings, [collections for _, _, collections in routes], 3)
+        
+        # Step 3: Cached answers, then bounded-concurrency completions
+        semaphore = asyncio.Semaphore(max(1, settings.BATCH_MAX_CONCURRENCY))
+        
+        async def answer(i: int, query_embedding: List[float], intent: str, relevant_docs: List[Dict[str, Any]]):
+            query = queries[i]
+            response = self._cached_answer(query_embedding, intent, relevant_docs)
+            if response is None:
+                async with semaphore:
+                    try:
+                        async with (slot() if slot is not None else nullcontext()):
+                            response = await self.generate_response_async(query, relevant_docs, intent,
+                                                                          Deadline(settings.REQUEST_DEADLINE))
+                    except Exception as e:
+                        print(f"⚠️ No slot for batch query, using fallback: {e}")
+                        response = self._get_fallback_response(intent, query)
+                if self._is_fallback(response, intent, query):
+                    response = self._best_fallback(query, query_embedding, intent)
+                else:
+                    self._remember_answer(query, query_embedding, intent, relevant_docs, response)
+            results[i] = self._build_result(query, intent, relevant_docs, response)
+        
+        await asyncio.gather(*(
+            answer(i, embedding, intent, docs)
+            for i, embedding, (intent, _, _), docs in zip(pending, embeddings, routes, retrieved)
+        ))
+        return results
+    
+    def process_queries(self, queries: List[str]) -> List[Dict[str, Any]]:
+        """Blocking counterpart of process_queries_async (for scripts and offline evaluation)"""
+        return run_async(self.process_queries_async(queries))
+    
+    def refresh_index(self) -> bool:
+        """Pick up an index generation another worker published (shared mode); True if one was loaded"""
+        if not self.vector_store.refresh_from_disk():
+            return False
+        # The writer's scrape also refreshed the structured data files
+        self.structured_index.load_from_disk()
+        return True
     
     def get_suggested_actions(self, intent: str) -> List[str]:
         """Get suggested actions based on intent"""
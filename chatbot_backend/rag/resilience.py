@@ -0,0 +1,226 @@
+"""
+Circuit breaker and token-bucket rate limiter for the OpenAI endpoints
+
+Each endpoint ("/embeddings", "/chat/completions") gets an UpstreamGuard.
+Requests take a token from the bucket before they are sent; 429 responses
+and rate-limit headers pause the bucket for as long as the API asks. After
+repeated 429/5xx/transport failures the breaker opens and requests fail
+fast with UpstreamUnavailable (callers turn that into their fallbacks)
+until a single half-open probe succeeds.
+"""
+import re
+import time
+import threading
+from typing import Any, Dict, Mapping, Optional
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream whose circuit is open or whose rate limit is exhausted"""
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        """Open after ``failure_threshold`` consecutive failures, probe again after ``reset_timeout`` seconds"""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_for = reset_timeout
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now (in half-open state, only one probe at a time)"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.open_for:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.open_for - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print("✅ Upstream recovered, closing circuit")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"⛔ Opening circuit after {self.failures} upstream failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.open_for = max(self.reset_timeout, retry_after or 0.0)
+            self._probe_in_flight = False
+
+    def release(self):
+        """A request ended without an outcome (e.g. it was cancelled)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "rejected": self.rejected,
+            "retry_after": round(self.retry_after(), 3)
+        }
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        """``rate`` requests per second with bursts of ``burst``; a rate of 0 only honours server pauses"""
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Take a token; returns how many seconds to wait before sending"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            pause = max(0.0, self._paused_until - now)
+            if self.rate <= 0:
+                return pause
+            self._tokens -= 1
+            deficit = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(pause, deficit)
+
+    def refund(self):
+        with self._lock:
+            if self.rate > 0:
+                self._tokens = min(self.burst, self._tokens + 1)
+
+    def pause(self, seconds: float):
+        """Send nothing for ``seconds`` (e.g. from a Retry-After header)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "rate": self.rate,
+                "tokens": round(max(0.0, self._tokens), 2) if self.rate > 0 else None,
+                "paused_for": round(max(0.0, self._paused_until - now), 3)
+            }
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds in an OpenAI reset header ("20ms", "1s", "6m0s") or a Retry-After value ("2", "0.5")"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _UNIT_SECONDS[unit] for amount, unit in parts)
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Delay the server asked for, from Retry-After-Ms / Retry-After"""
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    return parse_duration(headers.get("retry-after"))
+
+
+class UpstreamGuard:
+    def __init__(self, name: str, rate: float, burst: int, failure_threshold: int,
+                 reset_timeout: float, max_wait: float):
+        """Breaker plus limiter for one upstream endpoint"""
+        self.name = name
+        self.max_wait = max_wait
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.limiter = TokenBucket(rate, burst)
+        self.status_codes: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Seconds to wait before sending, or UpstreamUnavailable if the request should not be sent"""
+        delay = self.limiter.reserve()
+        if delay > self.max_wait:
+            self.limiter.refund()
+            raise UpstreamUnavailable(f"{self.name} rate limited for another {delay:.1f}s")
+        if not self.breaker.allow():
+            self.limiter.refund()
+            raise UpstreamUnavailable(
+                f"{self.name} circuit open for another {self.breaker.retry_after():.1f}s")
+        return delay
+
+    def record_response(self, status_code: int, headers: Mapping[str, str]):
+        with self._lock:
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+
+        # Quota exhausted: wait for the window the API reports before sending more
+        for kind in ("requests", "tokens"):
+            if headers.get(f"x-ratelimit-remaining-{kind}") == "0":
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    self.limiter.pause(reset)
+
+        if status_code == 429 or status_code >= 500:
+            retry_after = retry_after_seconds(headers)
+            if status_code == 429:
+                self.limiter.pause(retry_after if retry_after is not None else 1.0)
+            self.breaker.record_failure(retry_after)
+        else:
+            # 4xx other than 429 are request errors, not upstream health problems
+            self.breaker.record_success()
+
+    def record_error(self):
+        """Transport error or timeout"""
+        self.breaker.record_failure()
+
+    def release(self):
+        self.breaker.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            status_codes = {str(code): count for code, count in sorted(self.status_codes.items())}
+        return {
+            "circuit": self.breaker.stats(),
+            "rate_limit": self.limiter.stats(),
+            "status_codes": status_codes
+        }
@@ -0,0 +1,121 @@
+"""
+Row matrix over a memory-mapped snapshot plus a small in-RAM segment
+
+Appending to (or deleting from) an mmap'd float32 matrix with NumPy copies
+the whole matrix into private memory. A ``SegmentedMatrix`` instead keeps
+the snapshot mapped, remembers which of its rows are still live, and holds
+appended rows in a separate in-RAM segment until the next snapshot folds
+them in. It supports the few operations the vector store needs: ``len``,
+row indexing and slicing, ``@`` against query vectors, and ``mean``.
+
+Like the collections that hold them, instances are never changed in place;
+``append`` and ``keep`` return new ones.
+"""
+import numpy as np
+from typing import Any, Optional
+
+# Live snapshot rows gathered at a time for a full scan
+SCAN_BLOCK_ROWS = 65536
+
+
+class SegmentedMatrix:
+    def __init__(self, base: np.ndarray, live: Optional[np.ndarray] = None,
+                 tail: Optional[np.ndarray] = None):
+        """Rows ``base[live]`` (all of ``base`` when ``live`` is None) followed by ``tail``"""
+        self.base = base
+        self.live = live
+        self.tail = tail if tail is not None else np.zeros((0, base.shape[1]), dtype=np.float32)
+        self.base_rows = len(base) if live is None else len(live)
+        self.shape = (self.base_rows + len(self.tail), base.shape[1])
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the float32 rows, as for an ndarray"""
+        return self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+    @property
+    def resident_nbytes(self) -> int:
+        """Private memory held beside the mapping: the appended rows and the live-row index"""
+        return self.tail.nbytes + (self.live.nbytes if self.live is not None else 0)
+
+    def append(self, rows: np.ndarray) -> "SegmentedMatrix":
+        """A matrix with ``rows`` added at the end (only the in-RAM segment is copied)"""
+        return SegmentedMatrix(self.base, self.live, np.vstack([self.tail, rows]).astype(np.float32))
+
+    def keep(self, keep: np.ndarray) -> "SegmentedMatrix":
+        """A matrix with only the rows where the boolean mask ``keep`` is set"""
+        live = self.live if self.live is not None else np.arange(len(self.base), dtype=np.int64)
+        return SegmentedMatrix(self.base, live[keep[:self.base_rows]], self.tail[keep[self.base_rows:]])
+
+    def _base_block(self, start: int, stop: int) -> np.ndarray:
+        if self.live is None:
+            return np.asarray(self.base[start:stop], dtype=np.float32)
+        return np.asarray(self.base[self.live[start:stop]], dtype=np.float32)
+
+    def __getitem__(self, key: Any) -> np.ndarray:
+        """Rows by integer, slice, integer array or boolean mask, copied into a float32 ndarray"""
+        if isinstance(key, (int, np.integer)):
+            return self[np.array([key])][0]
+        if isinstance(key, slice):
+            indices = np.arange(len(self))[key]
+        else:
+            indices = np.asarray(key)
+            if indices.dtype == bool:
+                indices = np.flatnonzero(indices)
+            indices = np.where(indices < 0, indices + len(self), indices)
+
+        rows = np.empty((len(indices), self.shape[1]), dtype=np.float32)
+        in_base = indices < self.base_rows
+        base_indices = indices[in_base]
+        if self.live is not None:
+            base_indices = self.live[base_indices]
+        rows[in_base] = self.base[base_indices]
+        rows[~in_base] = self.tail[indices[~in_base] - self.base_rows]
+        return rows
+
+    def __matmul__(self, other: np.ndarray) -> np.ndarray:
+        """Products of every row with a vector (or the columns of a matrix)"""
+        if self.live is None:
+            parts = [np.asarray(self.base @ other)]
+        else:
+            parts = [self._base_block(start, start + SCAN_BLOCK_ROWS) @ other
+                     for start in range(0, self.base_rows, SCAN_BLOCK_ROWS)]
+        parts.append(self.tail @ other)
+        return np.concatenate(parts).astype(np.float32, copy=False)
+
+    def mean(self, axis: int = 0) -> np.ndarray:
+        """Mean row (only ``axis=0`` is supported)"""
+        if axis != 0:
+            raise ValueError("SegmentedMatrix only averages over rows")
+        total = np.zeros(self.shape[1], dtype=np.float64)
+        for start in range(0, self.base_rows, SCAN_BLOCK_ROWS):
+            total += self._base_block(start, start + SCAN_BLOCK_ROWS).sum(axis=0)
+        total += self.tail.sum(axis=0)
+        return (total / max(1, len(self))).astype(np.float32)
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        """Materialize every row (used when writing a snapshot)"""
+        rows = self[slice(None)]
+        return rows if dtype is None else rows.astype(dtype, copy=False)
+
+
+def append_rows(matrix: Any, rows: np.ndarray) -> Any:
+    """``matrix`` with ``rows`` appended; a memory-mapped matrix is never copied into RAM"""
+    if isinstance(matrix, SegmentedMatrix):
+        return matrix.append(rows)
+    if isinstance(matrix, np.memmap):
+        return SegmentedMatrix(matrix).append(rows)
+    return np.vstack([matrix, rows])
+
+
+def keep_rows(matrix: Any, keep: np.ndarray) -> Any:
+    """The rows of ``matrix`` where the boolean mask ``keep`` is set, without copying a mapped matrix"""
+    if isinstance(matrix, SegmentedMatrix):
+        return matrix.keep(keep)
+    if isinstance(matrix, np.memmap):
+        return SegmentedMatrix(matrix).keep(keep)
+    return np.asarray(matrix)[keep]
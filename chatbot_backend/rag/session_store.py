@@ -0,0 +1,240 @@
+"""
+Per-session conversation memory
+
+Each session keeps its most recent turns under a token budget; older turns
+are folded into a rolling summary capped at its own budget, so an idle
+session never holds more than a bounded amount of text. The last intent
+and retrieved documents are kept so follow-up questions can reuse them.
+
+Storage is pluggable: InMemorySessionBackend (LRU + TTL, per process) or
+SQLiteSessionBackend (shared by workers on one host, survives restarts).
+Recording a turn is one atomic read-modify-write on either backend; the
+``*_async`` methods keep SQLite I/O off the event loop.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from rag.caching import TTLCache
+from rag.tokens import count_tokens, truncate_to_tokens
+
+# Fields of a retrieved document worth keeping for follow-ups
+_DOC_FIELDS = ("id", "content", "metadata", "distance", "collection", "similarity", "token_count")
+
+# Follow-ups chain onto the previous query text; keep only its tail
+_MAX_CONTEXT_QUERY_CHARS = 400
+
+
+class InMemorySessionBackend:
+    # Calls never wait on I/O, so they can run on the event loop
+    blocking = False
+
+    def __init__(self, max_sessions: int, ttl_seconds: float):
+        """Sessions in this process, least recently used evicted first, expired after ``ttl_seconds`` idle"""
+        self._cache = TTLCache(max_sessions, ttl_seconds)
+        self._update_lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self._cache.get(session_id)
+
+    def put(self, session_id: str, state: Dict[str, Any]):
+        self._cache.set(session_id, state)
+
+    def update(self, session_id: str, change: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]):
+        """Replace a session's state with ``change(current state)``, atomically"""
+        with self._update_lock:
+            current = self._cache.get(session_id)
+            # Copy so readers holding the current state never see it change
+            self._cache.set(session_id, change(json.loads(json.dumps(current)) if current else None))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class SQLiteSessionBackend:
+    # Every call is a query (and usually a commit): run it off the event loop
+    blocking = True
+
+    def __init__(self, path: str, max_sessions: int, ttl_seconds: float):
+        """Sessions in a SQLite database at ``path``, bounded like the in-memory backend"""
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)")
+        self._conn.commit()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM sessions WHERE session_id = ? AND last_used >= ?",
+                (session_id, time.time() - self.ttl_seconds)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, session_id: str, state: Dict[str, Any]):
+        self.update(session_id, lambda current: state)
+
+    def update(self, session_id: str, change: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]):
+        """Replace a session's state with ``change(current state)`` in one write transaction.
+        
+        BEGIN IMMEDIATE takes SQLite's write lock before the read, so
+        concurrent updates of a session (from any thread or worker process)
+        apply one after the other instead of overwriting each other.
+        """
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                row = self._conn.execute(
+                    "SELECT state FROM sessions WHERE session_id = ? AND last_used >= ?",
+                    (session_id, now - self.ttl_seconds)
+                ).fetchone()
+                state = json.dumps(change(json.loads(row[0]) if row else None), ensure_ascii=False)
+                updated = self._conn.execute(
+                    "UPDATE sessions SET state = ?, last_used = ? WHERE session_id = ?",
+                    (state, now, session_id)
+                ).rowcount
+                if not updated:
+                    self._conn.execute(
+                        "INSERT INTO sessions (session_id, state, last_used) VALUES (?, ?, ?)",
+                        (session_id, state, now)
+                    )
+                self._conn.execute("DELETE FROM sessions WHERE last_used < ?", (now - self.ttl_seconds,))
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()
+                if count > self.max_sessions:
+                    self._conn.execute(
+                        "DELETE FROM sessions WHERE rowid IN "
+                        "(SELECT rowid FROM sessions ORDER BY last_used ASC LIMIT ?)",
+                        (count - self.max_sessions,)
+                    )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()
+        return {"backend": "sqlite", "entries": count, "max_entries": self.max_sessions}
+
+
+class SessionStore:
+    def __init__(self, backend, max_tokens: int, summary_max_tokens: int):
+        """Conversation memory on ``backend``: recent turns within ``max_tokens``, older ones summarized"""
+        self.backend = backend
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+
+    @staticmethod
+    def _turn_tokens(turn: Dict[str, Any]) -> int:
+        """Tokens in a turn's query and response, counted once and kept on the turn"""
+        if "tokens" not in turn:
+            turn["tokens"] = (count_tokens(turn["query"], settings.LLM_MODEL)
+                              + count_tokens(turn["response"], settings.LLM_MODEL))
+        return turn["tokens"]
+
+    def get(self, session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Session state: ``summary``, ``turns`` (query/response/intent and cached token count), last ``intent`` and ``docs``"""
+        if not session_id:
+            return None
+        return self.backend.get(session_id)
+
+    async def get_async(self, session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """get, without blocking the event loop on a database backend"""
+        if not session_id or not self.backend.blocking:
+            return self.get(session_id)
+        return await asyncio.to_thread(self.get, session_id)
+
+    def _compact(self, state: Dict[str, Any]):
+        """Fold the oldest turns into the rolling summary until the rest fit the budget.
+        
+        Turns carry their token counts and the summary is trimmed by running
+        per-line counts, so each call is linear in the history it touches.
+        """
+        turns = state["turns"]
+        total = sum(self._turn_tokens(turn) for turn in turns)
+        if len(turns) <= 1 or total <= self.max_tokens:
+            return
+        
+        lines = [line for line in state["summary"].split("\n") if line]
+        line_tokens = [count_tokens(line, settings.LLM_MODEL) for line in lines]
+        folded = 0
+        while len(turns) - folded > 1 and total > self.max_tokens:
+            oldest = turns[folded]
+            folded += 1
+            total -= self._turn_tokens(oldest)
+            # Extractive summary: the question and the start of the answer
+            answer = truncate_to_tokens(" ".join(oldest["response"].split()), 40, settings.LLM_MODEL)
+            lines.append(f"User asked: {oldest['query']} | Answer: {answer}")
+            line_tokens.append(count_tokens(lines[-1], settings.LLM_MODEL))
+        del turns[:folded]
+        
+        # Keep the most recent part of the summary (about one token per line break)
+        summary_tokens = sum(line_tokens) + len(lines) - 1
+        first = 0
+        while len(lines) - first > 1 and summary_tokens > self.summary_max_tokens:
+            summary_tokens -= line_tokens[first] + 1
+            first += 1
+        state["summary"] = truncate_to_tokens("\n".join(lines[first:]), self.summary_max_tokens, settings.LLM_MODEL)
+
+    def record_turn(self, session_id: Optional[str], query: str, response: str, intent: str,
+                    docs: List[Dict[str, Any]], context_query: Optional[str] = None):
+        """Append a turn and remember its intent, retrieved documents and the query text it was searched with"""
+        if not session_id:
+            return
+        kept_docs = [{field: doc[field] for field in _DOC_FIELDS if field in doc} for doc in docs]
+
+        def add_turn(state: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            state = state or {"summary": "", "turns": []}
+            state["turns"].append({"query": query, "response": response, "intent": intent})
+            state["intent"] = intent
+            state["context_query"] = (context_query or query)[-_MAX_CONTEXT_QUERY_CHARS:]
+            state["docs"] = kept_docs
+            self._compact(state)
+            return state
+
+        # Read-modify-write in one step, so concurrent requests on a session don't lose turns
+        self.backend.update(session_id, add_turn)
+
+    async def record_turn_async(self, session_id: Optional[str], query: str, response: str, intent: str,
+                                docs: List[Dict[str, Any]], context_query: Optional[str] = None):
+        """record_turn, without blocking the event loop on a database backend"""
+        if not session_id or not self.backend.blocking:
+            self.record_turn(session_id, query, response, intent, docs, context_query)
+            return
+        await asyncio.to_thread(self.record_turn, session_id, query, response, intent, docs, context_query)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.backend.stats()
+
+
+def create_session_store() -> SessionStore:
+    """Session store on the backend chosen by SESSION_BACKEND ("memory" or "sqlite")"""
+    if settings.SESSION_BACKEND == "sqlite":
+        backend = SQLiteSessionBackend(settings.SESSION_DB_PATH, settings.SESSION_MAX_SESSIONS,
+                                       settings.SESSION_TTL)
+    else:
+        backend = InMemorySessionBackend(settings.SESSION_MAX_SESSIONS, settings.SESSION_TTL)
+    return SessionStore(backend, settings.SESSION_MAX_TOKENS, settings.SESSION_SUMMARY_MAX_TOKENS)
@@ -5,13 +5,23 @@ No external dependencies - just uses NumPy for similarity calculations
 import os
 import sys
 import json
+import time
+import hashlib
+import threading
 import numpy as np
+from contextlib import contextmanager
 from typing import List, Dict, Any, Optional, Tuple
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import settings
 from rag.embeddings import EmbeddingManager
+from rag.persistence import VectorStorePersistence
+from rag import quantization
+from rag.ann_index import IVFIndex
+from rag.segmented_matrix import SegmentedMatrix, append_rows, keep_rows
+from rag.tokens import count_tokens
+from rag.metrics import SEARCH_SECONDS
 
 class SimpleVectorStore:
     def __init__(self):
@@ -21,151 +31,628 @@ class SimpleVectorStore:
         # Initialize embedding manager
         self.embedding_manager = EmbeddingManager()
         
-        # In-memory storage
+        # Optional compact codes used for the coarse scan
+        self.quantization = settings.VECTOR_STORE_QUANTIZATION
+        if self.quantization not in quantization.QUANTIZATION_MODES:
+            print(f"⚠️ Unknown quantization mode '{self.quantization}', using 'none'")
+            self.quantization = "none"
+        
+        # In-memory storage: each collection keeps its embeddings as one
+        # contiguous float32 matrix whose rows are L2-normalized on insert
         self.collections = {
-            "general": {"documents": [], "embeddings": [], "metadatas": [], "ids": []},
-            "services": {"documents": [], "embeddings": [], "metadatas": [], "ids": []},
-            "careers": {"documents": [], "embeddings": [], "metadatas": [], "ids": []}
+            name: self._empty_collection()
+            for name in ("general", "services", "careers")
         }
         
-        # Data persistence
-        self.data_file = os.path.join(settings.DATA_DIR, "vector_store.json")
-        self._load_from_disk()
+        # Bumped on every content change so dependent caches can invalidate
+        self.version = 0
+        # Writers build changed collections on copies and publish them with one
+        # assignment to ``self.collections``; readers never take a lock
+        self._write_lock = threading.RLock()
+        self._writer_depth = 0
+        self._centroids: Optional[Dict[str, np.ndarray]] = None
+        self._centroids_version = -1
+        
+        # Data persistence (binary snapshot; the JSON file is only read for migration)
+        self.persistence = VectorStorePersistence(settings.VECTOR_STORE_DIR,
+                                                  self.embedding_manager.embedding_dim)
+        self.legacy_data_file = os.path.join(settings.DATA_DIR, "vector_store.json")
+        
+        # Shared mode: worker processes map the same snapshot files read-only
+        # and only one of them writes at a time (see exclusive_write)
+        self.shared = settings.VECTOR_STORE_SHARED
+        if self.shared:
+            with self.persistence.writer_lock():
+                self._load_from_disk()
+                if self.persistence.log_rows:
+                    # Fold log rows into the snapshot so they are shared too
+                    self._save_to_disk()
+        else:
+            self._load_from_disk()
+    
+    def _empty_collection(self) -> Dict[str, Any]:
+        """Create an empty collection"""
+        collection = {
+            "documents": [],
+            "embeddings": np.zeros((0, self.embedding_manager.embedding_dim), dtype=np.float32),
+            "metadatas": [],
+            "ids": [],
+            "hashes": [],
+            "token_counts": [],
+            "token_model": settings.LLM_MODEL,
+            "ann": None
+        }
+        self._encode_collection(collection)
+        return collection
+    
+    @staticmethod
+    def _count_collection_tokens(collection: Dict[str, Any]):
+        """Cache each document's prompt token count alongside it, counting only those not stored yet"""
+        counts = collection.get("token_counts") or []
+        if collection.get("token_model") != settings.LLM_MODEL or len(counts) != len(collection["documents"]):
+            counts = [None] * len(collection["documents"])
+        collection["token_counts"] = [
+            count if count is not None else count_tokens(doc, settings.LLM_MODEL)
+            for count, doc in zip(counts, collection["documents"])
+        ]
+        collection["token_model"] = settings.LLM_MODEL
     
-    def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
-        """Calculate cosine similarity between two vectors"""
-        vec1 = np.array(vec1)
-        vec2 = np.array(vec2)
+    def _encode_collection(self, collection: Dict[str, Any]):
+        """(Re)build the quantized codes for a whole collection"""
+        if self.quantization == "none":
+            collection["codes"], collection["scales"] = None, None
+            return
+        collection["codes"], collection["scales"] = quantization.quantize(
+            collection["embeddings"], self.quantization)
+    
+    @staticmethod
+    def _normalize_rows(vectors: Any) -> np.ndarray:
+        """Return vectors as a float32 matrix with unit-length rows (zero rows stay zero)"""
+        matrix = np.array(vectors, dtype=np.float32, ndmin=2)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+        return matrix
+    
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest scores, best first"""
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        if k < len(scores):
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+    
+    def _update_ann_index(self, collection: Dict[str, Any], new_rows: int = 0):
+        """Build, extend, keep or drop a collection's IVF index depending on its size.
+        
+        An index covering all but the ``new_rows`` last rows is extended; it is
+        only retrained once the collection has grown or shrunk by
+        ANN_REBUILD_GROWTH since it was built (or ANN_N_LISTS changed).
+        """
+        matrix = collection["embeddings"]
+        rows = len(matrix)
+        index = collection.get("ann")
         
-        dot_product = np.dot(vec1, vec2)
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
+        if rows < settings.ANN_MIN_ROWS:
+            collection["ann"] = None
+            return
         
-        if norm1 == 0 or norm2 == 0:
-            return 0.0
+        if (index is not None and index.size == rows - new_rows
+                and index.built_size / settings.ANN_REBUILD_GROWTH <= rows
+                < index.built_size * settings.ANN_REBUILD_GROWTH
+                and settings.ANN_N_LISTS in (0, index.n_lists)):
+            if new_rows:
+                index.add(matrix[-new_rows:])
+            index.n_probe = settings.ANN_N_PROBE
+            return
         
-        return dot_product / (norm1 * norm2)
+        n_lists = settings.ANN_N_LISTS or int(np.sqrt(rows))
+        print(f"🧭 Building IVF index over {rows} rows ({n_lists} lists)...")
+        index = IVFIndex(n_lists, settings.ANN_N_PROBE)
+        index.build(matrix)
+        collection["ann"] = index
     
     def _save_to_disk(self):
-        """Save vector store to disk"""
+        """Save a full snapshot of the vector store to disk"""
         try:
-            os.makedirs(settings.DATA_DIR, exist_ok=True)
-            with open(self.data_file, 'w') as f:
-                json.dump(self.collections, f, indent=2)
-            print(f"✅ Vector store saved to {self.data_file}")
+            self.persistence.save_snapshot(self.collections)
+            print(f"✅ Vector store saved to {settings.VECTOR_STORE_DIR}")
         except Exception as e:
             print(f"⚠️ Could not save vector store: {e}")
+            return
+        
+        # Serve float32 rows from the fresh snapshot's mmap instead of private
+        # memory; with quantization on only rescoring candidates get paged in
+        for name, collection in self.collections.items():
+            collection["embeddings"] = self.persistence.open_vectors(name)
+    
+    def _append_to_disk(self, collection_name: str, count: int) -> bool:
+        """Persist only the last ``count`` rows of a collection via the append-only log; False on failure"""
+        try:
+            if self.persistence.generation is None:
+                # Nothing on disk yet: the first snapshot already includes these rows
+                self._save_to_disk()
+                return True
+            
+            collection = self.collections[collection_name]
+            self.persistence.append(
+                collection_name,
+                collection["ids"][-count:],
+                collection["hashes"][-count:],
+                collection["documents"][-count:],
+                collection["metadatas"][-count:],
+                collection["embeddings"][-count:],
+                collection["token_counts"][-count:]
+            )
+            return True
+        except Exception as e:
+            print(f"⚠️ Could not append to vector store log: {e}")
+            return False
+    
+    def _tombstone_on_disk(self, collection_name: str, ids: List[str]) -> bool:
+        """Persist the removal of ``ids`` via the append-only log; False on failure"""
+        try:
+            if self.persistence.generation is None:
+                self._save_to_disk()
+                return True
+            self.persistence.append_tombstones(collection_name, ids)
+            return True
+        except Exception as e:
+            print(f"⚠️ Could not append to vector store log: {e}")
+            return False
+    
+    def _compact_if_needed(self):
+        """Rewrite the snapshot once the append-only log has grown large enough"""
+        if self.persistence.needs_compaction(settings.VECTOR_STORE_COMPACT_RATIO,
+                                             settings.VECTOR_STORE_COMPACT_MIN_ROWS):
+            print(f"🗜️ Compacting vector store log ({self.persistence.log_rows} rows)...")
+            self._save_to_disk()
+    
+    def _prepare_loaded(self, loaded: Dict[str, Dict[str, Any]]):
+        """Derive the per-process parts (token counts, codes) of loaded collections; a persisted IVF index is reused"""
+        for collection in loaded.values():
+            self._count_collection_tokens(collection)
+            self._encode_collection(collection)
+            self._update_ann_index(collection)
     
     def _load_from_disk(self):
         """Load vector store from disk"""
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r') as f:
-                    self.collections = json.load(f)
-                print(f"✅ Vector store loaded from {self.data_file}")
+            loaded = self.persistence.load()
+            if loaded is not None:
+                self._prepare_loaded(loaded)
+                self.collections.update(loaded)
+                print(f"✅ Vector store loaded from {settings.VECTOR_STORE_DIR}")
+            elif os.path.exists(self.legacy_data_file):
+                self._migrate_legacy_json()
             else:
                 print("ℹ️ No existing vector store found, starting fresh")
         except Exception as e:
             print(f"⚠️ Could not load vector store: {e}")
     
-    def add_documents(self, documents: List[Dict[str, Any]]):
-        """Add documents to appropriate collections"""
-        print(f"Adding {len(documents)} documents to vector store...")
+    def _migrate_legacy_json(self):
+        """One-shot conversion of the old indent=2 JSON store to the binary format"""
+        print(f"🔄 Migrating {self.legacy_data_file} to binary format...")
+        with open(self.legacy_data_file, 'r') as f:
+            loaded = json.load(f)
+        
+        for name, collection in loaded.items():
+            embeddings = collection.get("embeddings") or []
+            self.collections[name] = {
+                "documents": collection.get("documents", []),
+                "embeddings": (self._normalize_rows(embeddings) if embeddings
+                               else self._empty_collection()["embeddings"]),
+                "metadatas": collection.get("metadatas", []),
+                "ids": collection.get("ids", []),
+                "hashes": [None] * len(collection.get("ids", []))
+            }
+            self._count_collection_tokens(self.collections[name])
+            self._encode_collection(self.collections[name])
+            self._update_ann_index(self.collections[name])
         
-        # Group documents by type
-        doc_groups = {
-            "general": [],
-            "services": [],
-            "careers": []
+        self.persistence.save_snapshot(self.collections)
+        os.replace(self.legacy_data_file, f"{self.legacy_data_file}.migrated")
+        print(f"✅ Vector store migrated to {settings.VECTOR_STORE_DIR}")
+    
+    @staticmethod
+    def _collection_for(doc: Dict[str, Any]) -> str:
+        """Collection a prepared document belongs to"""
+        doc_type = doc["metadata"].get("type", "general")
+        if doc_type == "service":
+            return "services"
+        if doc_type == "career":
+            return "careers"
+        return "general"
+    
+    @staticmethod
+    def _content_hash(doc: Dict[str, Any]) -> str:
+        """Hash of everything stored for a document except its embedding"""
+        payload = json.dumps([doc["content"], doc["metadata"]], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _document_id(self, collection_name: str, doc: Dict[str, Any]) -> str:
+        """Stable ID from the document's natural key, or its content when it has none"""
+        metadata = doc["metadata"]
+        natural_key = {
+            "careers": metadata.get("job_id"),
+            "services": metadata.get("service_name"),
+            "general": metadata.get("category")
+        }.get(collection_name)
+        key = f"key:{natural_key}" if natural_key else f"content:{self._content_hash(doc)}"
+        return f"{collection_name}_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}"
+    
+    def filter_changed_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Documents that are new or differ from what is stored (the ones worth embedding)"""
+        changed = []
+        stored = {
+            name: dict(zip(collection["ids"], collection["hashes"]))
+            for name, collection in self.collections.items()
         }
+        for doc in documents:
+            collection_name = self._collection_for(doc)
+            doc_id = self._document_id(collection_name, doc)
+            if stored[collection_name].get(doc_id) != self._content_hash(doc):
+                changed.append(doc)
+        return changed
+    
+    @staticmethod
+    def _copy_collection(collection: Dict[str, Any]) -> Dict[str, Any]:
+        """Private copy of a collection that can be changed while readers use the original.
+        
+        Matrices (and the IVF index's lists) are replaced rather than written
+        to, so they are shared; only the Python lists are copied.
+        """
+        staged = dict(collection)
+        # Sampled recall describes the old contents
+        staged.pop("recall", None)
+        for key in ("ids", "hashes", "documents", "metadatas", "token_counts"):
+            staged[key] = list(collection[key])
+        if collection.get("ann") is not None:
+            staged["ann"] = collection["ann"].copy()
+        return staged
+    
+    @contextmanager
+    def exclusive_write(self):
+        """Serialize writers: threads of this process, and in shared mode all worker processes.
+        
+        In shared mode the newest published generation is loaded first, so the
+        change builds on what other workers wrote.
+        """
+        with self._write_lock:
+            if not self.shared or self._writer_depth:
+                self._writer_depth += 1
+                try:
+                    yield
+                finally:
+                    self._writer_depth -= 1
+                return
+            
+            with self.persistence.writer_lock():
+                self._writer_depth += 1
+                try:
+                    self.refresh_from_disk()
+                    yield
+                finally:
+                    self._writer_depth -= 1
+    
+    def refresh_from_disk(self) -> bool:
+        """Swap in a newer generation published by another process; returns whether one was loaded"""
+        if self.persistence.current_generation() in (None, self.persistence.generation):
+            return False
+        
+        with self._write_lock:
+            if self.persistence.current_generation() in (None, self.persistence.generation):
+                return False
+            try:
+                loaded = self.persistence.load()
+            except (OSError, ValueError) as e:
+                # Replaced by an even newer generation while reading; the next check gets that one
+                print(f"⚠️ Could not load published vector store generation: {e}")
+                return False
+            if loaded is None:
+                return False
+            self._prepare_loaded(loaded)
+            self._publish({**self.collections, **loaded})
+        
+        print(f"🔄 Loaded vector store generation {self.persistence.generation}")
+        return True
+    
+    def _publish(self, collections: Dict[str, Dict[str, Any]]):
+        """Swap in a new set of collections (one reference assignment) and invalidate caches"""
+        self.collections = collections
+        self.version += 1
+    
+    def add_documents(self, documents: List[Dict[str, Any]], prune: bool = False):
+        """Upsert documents into their collections.
+        
+        Unchanged documents are skipped, changed ones replaced. With
+        ``prune=True`` the batch is treated as the full content of every
+        collection it touches, and stored documents missing from it are
+        tombstoned. Changes are built on copies and swapped in together, so
+        concurrent searches see either the old or the new contents.
+        """
+        with self.exclusive_write():
+            self._add_documents(documents, prune)
+    
+    def _add_documents(self, documents: List[Dict[str, Any]], prune: bool):
+        print(f"Adding {len(documents)} documents to vector store...")
+        
+        # Group documents by collection, keyed by their stable IDs (last one wins)
+        doc_groups = {name: {} for name in self.collections}
         
         for doc in documents:
-            doc_type = doc["metadata"].get("type", "general")
-            print(f"Processing document type: {doc_type} - {doc['metadata'].get('title', doc['content'][:50])}")
-            if doc_type == "service":
-                doc_groups["services"].append(doc)
-            elif doc_type == "career":
-                doc_groups["careers"].append(doc)
-            else:
-                doc_groups["general"].append(doc)
+            collection_name = self._collection_for(doc)
+            print(f"Processing document type: {doc['metadata'].get('type', 'general')} - "
+                  f"{doc['metadata'].get('title', doc['content'][:50])}")
+            doc_groups[collection_name][self._document_id(collection_name, doc)] = doc
         
-        # Add each group to its respective collection
+        staged = dict(self.collections)
+        changes = []
         for collection_name, docs in doc_groups.items():
-            if docs:
-                self._add_to_collection(collection_name, docs)
+            if not docs:
+                continue
+            
+            collection = self.collections[collection_name]
+            stored = dict(zip(collection["ids"], collection["hashes"]))
+            
+            new_docs = []
+            for doc_id, doc in docs.items():
+                content_hash = self._content_hash(doc)
+                if stored.get(doc_id) == content_hash:
+                    continue
+                if doc.get("embedding") is None:
+                    print(f"⚠️ Skipping document without embedding: {doc_id}")
+                    continue
+                new_docs.append({**doc, "id": doc_id, "content_hash": content_hash})
+            
+            # Replaced and (when pruning) vanished documents are tombstoned first
+            replaced = [doc["id"] for doc in new_docs if doc["id"] in stored]
+            pruned = [doc_id for doc_id in stored if doc_id not in docs] if prune else []
+            if replaced or pruned or new_docs:
+                collection = staged[collection_name] = self._copy_collection(collection)
+                if replaced or pruned:
+                    self._remove_from_collection(collection, collection_name, replaced + pruned)
+                if new_docs:
+                    self._add_to_collection(collection, collection_name, new_docs)
+                changes.append((collection_name, replaced + pruned, len(new_docs)))
+            
+            print(f"{collection_name}: {len(new_docs) - len(replaced)} new, {len(replaced)} updated, "
+                  f"{len(docs) - len(new_docs)} unchanged, {len(pruned)} removed")
+        
+        if not changes:
+            print("No changes to the vector store")
+            return
         
-        # Save to disk
-        self._save_to_disk()
+        self._publish(staged)
+        
+        # Persist after the swap: the log describes exactly what readers now see
+        if self.persistence.generation is None or self.shared:
+            # Nothing on disk yet, or other workers map the snapshot: write a full generation
+            self._save_to_disk()
+        else:
+            logged = True
+            for collection_name, removed_ids, added in changes:
+                if removed_ids:
+                    logged = self._tombstone_on_disk(collection_name, removed_ids)
+                if logged and added:
+                    logged = self._append_to_disk(collection_name, added)
+                if not logged:
+                    break
+            if logged:
+                self._compact_if_needed()
+            else:
+                # The log no longer matches memory: write everything as a new generation
+                print("💾 Log append failed, writing a full snapshot instead")
+                self._save_to_disk()
         print("Documents added successfully!")
     
-    def _add_to_collection(self, collection_name: str, documents: List[Dict[str, Any]]):
-        """Add documents to a specific collection"""
+    def _add_to_collection(self, collection: Dict[str, Any], collection_name: str,
+                           documents: List[Dict[str, Any]]):
+        """Add documents (already carrying ``id`` and ``content_hash``) to a staged collection"""
         if not documents:
             return
         
-        collection = self.collections[collection_name]
-        
-        for i, doc in enumerate(documents):
-            doc_id = f"{collection_name}_{len(collection['ids'])}_{i}"
-            
-            collection["ids"].append(doc_id)
-            collection["embeddings"].append(doc["embedding"])
+        for doc in documents:
+            collection["ids"].append(doc["id"])
+            collection["hashes"].append(doc["content_hash"])
             collection["metadatas"].append(doc["metadata"])
             collection["documents"].append(doc["content"])
+            collection["token_counts"].append(count_tokens(doc["content"], settings.LLM_MODEL))
+        
+        new_rows = self._normalize_rows([doc["embedding"] for doc in documents])
+        # Rows appended to a memory-mapped snapshot go to an in-RAM segment (see segmented_matrix)
+        collection["embeddings"] = append_rows(collection["embeddings"], new_rows)
+        if self.quantization != "none":
+            codes, scales = quantization.quantize(new_rows, self.quantization)
+            collection["codes"] = np.concatenate([collection["codes"], codes])
+            if scales is not None:
+                collection["scales"] = np.concatenate([collection["scales"], scales])
+        self._update_ann_index(collection, len(documents))
         
         print(f"Added {len(documents)} documents to {collection_name} collection")
     
+    def _remove_from_collection(self, collection: Dict[str, Any], collection_name: str, ids: List[str]):
+        """Drop rows by ID from a staged collection (a memory-mapped matrix only drops them from its live rows)"""
+        removed = set(ids)
+        keep = np.array([doc_id not in removed for doc_id in collection["ids"]], dtype=bool)
+        
+        collection["embeddings"] = keep_rows(collection["embeddings"], keep)
+        for key in ("ids", "hashes", "documents", "metadatas", "token_counts"):
+            collection[key] = [value for value, kept in zip(collection[key], keep) if kept]
+        if collection["codes"] is not None:
+            collection["codes"] = collection["codes"][keep]
+            if collection["scales"] is not None:
+                collection["scales"] = collection["scales"][keep]
+        # Removed rows leave their IVF lists; the rest are renumbered without retraining
+        if collection.get("ann") is not None:
+            collection["ann"].remove(keep)
+        self._update_ann_index(collection)
+        
+        print(f"Removed {int((~keep).sum())} documents from {collection_name} collection")
+    
+    def _score_collection(self, collection: Dict[str, Any], query_vector: np.ndarray,
+                          k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k row indices of a collection and their cosine similarities, best first"""
+        matrix = collection["embeddings"]
+        if not len(matrix):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        
+        # Large collections only score the rows in the closest IVF lists; fall
+        # back to the exhaustive scan when the probed lists are too small
+        rows = None
+        if collection.get("ann") is not None:
+            rows = collection["ann"].candidates(query_vector)
+            if len(rows) < k:
+                rows = None
+        
+        if collection["codes"] is None:
+            # One matrix-vector product scores the whole collection (or the probed rows)
+            if rows is None:
+                similarities = matrix @ query_vector
+                top = self._top_k(similarities, k)
+                return top, similarities[top]
+            similarities = matrix[rows] @ query_vector
+            top = self._top_k(similarities, k)
+            return rows[top], similarities[top]
+        
+        # Coarse scan over the compact codes, then exact float32 rescoring of a
+        # small candidate set (sorted so mmap reads stay sequential)
+        coarse = quantization.coarse_scores(collection["codes"], collection["scales"], query_vector, rows)
+        candidates = self._top_k(coarse, k * settings.VECTOR_STORE_RESCORE_FACTOR)
+        candidates = np.sort(candidates if rows is None else rows[candidates])
+        exact = matrix[candidates] @ query_vector
+        top = self._top_k(exact, k)
+        return candidates[top], exact[top]
+    
     def search(self, query: str, collection_names: Optional[List[str]] = None, 
-               n_results: int = 5) -> List[Dict[str, Any]]:
-        """Search for relevant documents across collections"""
+               n_results: int = 5, query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Search for relevant documents across collections (pass ``query_embedding`` to skip embedding)"""
         
+        # One snapshot for the whole search, even if a rebuild is swapped in meanwhile
+        collections = self.collections
         if collection_names is None:
-            collection_names = list(self.collections.keys())
+            collection_names = list(collections.keys())
         
         # Generate embedding for query
-        query_embedding = self.embedding_manager.generate_single_embedding(query)
+        if query_embedding is None:
+            query_embedding = self.embedding_manager.generate_single_embedding(query)
+        query_vector = self._normalize_rows(query_embedding)[0]
+        if not query_vector.any():
+            # Zero vector (embedding failed): it matches nothing, so return nothing
+            return []
         
         all_results = []
         
         for collection_name in collection_names:
-            if collection_name not in self.collections:
+            if collection_name not in collections:
                 continue
                 
-            collection = self.collections[collection_name]
-            
-            if not collection["embeddings"]:
-                continue
+            collection = collections[collection_name]
             
-            # Calculate similarities
-            for i, doc_embedding in enumerate(collection["embeddings"]):
-                similarity = self._cosine_similarity(query_embedding, doc_embedding)
-                distance = 1 - similarity  # Convert similarity to distance
-                
-                result = {
-                    "content": collection["documents"][i],
-                    "metadata": collection["metadatas"][i],
-                    "distance": distance,
-                    "collection": collection_name,
-                    "similarity": similarity
-                }
-                all_results.append(result)
+            # Only the per-collection top-k winners are turned into result dicts
+            started = time.perf_counter()
+            indices, similarities = self._score_collection(collection, query_vector, n_results)
+            all_results.extend(self._results(collection, collection_name, indices, similarities))
+            SEARCH_SECONDS.observe(time.perf_counter() - started, collection_name)
         
         # Sort by similarity (highest first)
         all_results.sort(key=lambda x: x["similarity"], reverse=True)
         
         return all_results[:n_results]
     
-    def search_by_intent(self, query: str, intent: str, n_results: int = 3) -> List[Dict[str, Any]]:
-        """Search for documents based on classified intent"""
+    @staticmethod
+    def _results(collection: Dict[str, Any], collection_name: str, indices: np.ndarray,
+                 similarities: np.ndarray) -> List[Dict[str, Any]]:
+        """Result dicts for scored rows of a collection"""
+        return [
+            {
+                "id": collection["ids"][i],
+                "content": collection["documents"][i],
+                "token_count": collection["token_counts"][i],
+                "metadata": collection["metadatas"][i],
+                "distance": 1 - similarity,  # Convert similarity to distance
+                "collection": collection_name,
+                "similarity": similarity
+            }
+            for i, similarity in zip(indices.tolist(), similarities.tolist())
+        ]
+    
+    def search_many(self, query_embeddings: List[List[float]], collection_names: List[List[str]],
+                    n_results: int = 5) -> List[List[Dict[str, Any]]]:
+        """Search for many queries at once, each in its own collections, results in query order.
+        
+        Queries are grouped by collection and scored with one matrix-matrix
+        product per collection (in blocks of SEARCH_BATCH_BLOCK queries);
+        quantized or IVF-indexed collections are scored query by query.
+        """
+        collections = self.collections
+        query_vectors = self._normalize_rows(query_embeddings)
+        all_results: List[List[Dict[str, Any]]] = [[] for _ in query_embeddings]
+        
+        by_collection: Dict[str, List[int]] = {}
+        for q, names in enumerate(collection_names):
+            if not query_vectors[q].any():
+                continue  # failed embedding: matches nothing
+            for name in names:
+                if name in collections:
+                    by_collection.setdefault(name, []).append(q)
+        
+        for name, queries in by_collection.items():
+            collection = collections[name]
+            matrix = collection["embeddings"]
+            if not len(matrix):
+                continue
+            if collection["codes"] is not None or collection.get("ann") is not None:
+                for q in queries:
+                    indices, similarities = self._score_collection(collection, query_vectors[q], n_results)
+                    all_results[q].extend(self._results(collection, name, indices, similarities))
+                continue
+            
+            for start in range(0, len(queries), settings.SEARCH_BATCH_BLOCK):
+                block = queries[start:start + settings.SEARCH_BATCH_BLOCK]
+                scores = (matrix @ query_vectors[block].T).T
+                for row, q in enumerate(block):
+                    top = self._top_k(scores[row], n_results)
+                    all_results[q].extend(self._results(collection, name, top, scores[row][top]))
         
+        for results in all_results:
+            results.sort(key=lambda x: x["similarity"], reverse=True)
+            del results[n_results:]
+        return all_results
+    
+    @staticmethod
+    def collections_for_intent(intent: str) -> List[str]:
+        """Collections searched for a classified intent"""
         if intent == "careers":
-            collections = ["careers"]
+            return ["careers"]
         elif intent == "services":
-            collections = ["services"]
-        else:
-            collections = ["general", "services"]  # For general queries
-        
-        return self.search(query, collections, n_results)
+            return ["services"]
+        return ["general", "services"]  # For general queries
+    
+    def collection_centroids(self) -> Dict[str, np.ndarray]:
+        """Unit-length mean embedding of each non-empty collection (recomputed after content changes)"""
+        # Version first: the collections read after it are at least that new
+        version = self.version
+        if self._centroids is None or self._centroids_version != version:
+            centroids = {}
+            for name, collection in self.collections.items():
+                if len(collection["embeddings"]) == 0:
+                    continue
+                centroid = np.asarray(collection["embeddings"].mean(axis=0), dtype=np.float32)
+                norm = np.linalg.norm(centroid)
+                if norm:
+                    centroids[name] = centroid / norm
+            self._centroids = centroids
+            self._centroids_version = version
+        return self._centroids
+    
+    def search_by_intent(self, query: str, intent: str, n_results: int = 3,
+                         query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Search for documents based on classified intent"""
+        return self.search(query, self.collections_for_intent(intent), n_results, query_embedding)
     
     def get_collection_stats(self) -> Dict[str, int]:
         """Get statistics about collections"""
@@ -174,29 +661,86 @@ class SimpleVectorStore:
             stats[name] = len(collection["documents"])
         return stats
     
+    def _sampled_recall(self, collection: Dict[str, Any], k: int, sample_size: int) -> float:
+        """Recall@k of the approximate search against exact search, cached until the collection changes"""
+        cached = collection.setdefault("recall", {})
+        if (k, sample_size) in cached:
+            return cached[(k, sample_size)]
+        
+        # Perturbed stored vectors stand in for queries
+        matrix = collection["embeddings"]
+        rows = len(matrix)
+        rng = np.random.default_rng(0)
+        sample = rng.choice(rows, size=min(sample_size, rows), replace=False)
+        queries = self._normalize_rows(
+            matrix[np.sort(sample)] + rng.normal(scale=0.02, size=(len(sample), matrix.shape[1])))
+        hits = 0
+        for query_vector in queries:
+            exact = set(self._top_k(matrix @ query_vector, k).tolist())
+            approx = set(self._score_collection(collection, query_vector, k)[0].tolist())
+            hits += len(exact & approx) / min(k, rows)
+        cached[(k, sample_size)] = round(hits / len(queries), 4)
+        return cached[(k, sample_size)]
+    
+    def get_storage_stats(self, k: int = 5, sample_size: int = 32) -> Dict[str, Any]:
+        """Memory per document and, for quantized or ANN-indexed collections, sampled recall@k vs exact search.
+        
+        Recall takes full scans, so it is measured once per collection version;
+        call this off the event loop.
+        """
+        stats = {}
+        for name, collection in self.collections.items():
+            matrix = collection["embeddings"]
+            rows = len(matrix)
+            code_bytes = quantization.code_bytes(collection["codes"], collection["scales"])
+            # An mmap'd float32 matrix only stays out of RAM when the codes do the scanning;
+            # rows appended since the snapshot are always resident
+            memory_mapped = isinstance(matrix, (np.memmap, SegmentedMatrix))
+            float32_resident = matrix.nbytes
+            if memory_mapped and collection["codes"] is not None:
+                float32_resident = matrix.resident_nbytes if isinstance(matrix, SegmentedMatrix) else 0
+            collection_stats = {
+                "documents": rows,
+                "quantization": self.quantization,
+                "bytes_per_document": (code_bytes + float32_resident) / rows if rows else 0,
+                "float32_memory_mapped": memory_mapped
+            }
+            
+            if collection.get("ann") is not None:
+                collection_stats["ann"] = collection["ann"].stats()
+            
+            if (collection["codes"] is not None or collection.get("ann") is not None) and rows:
+                collection_stats[f"recall_at_{k}"] = self._sampled_recall(collection, k, sample_size)
+            
+            stats[name] = collection_stats
+        return stats
+    
     def clear_all_collections(self):
         """Clear all collections"""
-        for collection in self.collections.values():
-            collection["documents"] = []
-            collection["embeddings"] = []
-            collection["metadatas"] = []
-            collection["ids"] = []
-        
-        self._save_to_disk()
+        with self.exclusive_write():
+            self._publish({name: self._empty_collection() for name in self.collections})
+            self._save_to_disk()
         print("All collections cleared")
     
     def populate_from_scraped_data(self, scraped_data: Dict[str, Any]):
-        """Populate vector store from scraped data"""
+        """Populate vector store from scraped data (searches keep using the old contents until the swap)"""
+        with self.exclusive_write():
+            self._populate(scraped_data)
+    
+    def _populate(self, scraped_data: Dict[str, Any]):
         print("Populating vector store from scraped data...")
         
         # Prepare documents for embedding
         documents = self.embedding_manager.prepare_documents_for_embedding(scraped_data)
         
-        # Generate embeddings
-        documents_with_embeddings = self.embedding_manager.create_embeddings_for_documents(documents)
+        # Only new or changed documents need embeddings
+        changed = self.filter_changed_documents(documents)
+        print(f"{len(changed)} of {len(documents)} documents are new or changed")
+        if changed:
+            self.embedding_manager.create_embeddings_for_documents(changed)
         
-        # Add to vector store
-        self.add_documents(documents_with_embeddings)
+        # Upsert; documents that disappeared from the scrape are tombstoned
+        self.add_documents(documents, prune=True)
         
         # Print statistics
         stats = self.get_collection_stats()
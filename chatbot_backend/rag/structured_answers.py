@@ -0,0 +1,275 @@
+"""
+Deterministic answers for price and job lookups
+
+Questions such as "How much does plumbing cost?" or "list engineering jobs
+in Bangalore" are answered straight from the structured scraped data
+(``startingPrice``/``subServices`` and the job listing fields), without an
+embedding or chat completion call.
+"""
+import os
+import re
+import sys
+import json
+from typing import Any, Dict, List, Optional
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+
+PRICE_PATTERN = re.compile(r"\b(price|prices|pricing|cost|costs|charge|charges|rate|rates|fee|fees|how much)\b")
+JOB_PATTERN = re.compile(r"\b(jobs?|openings?|positions?|roles?|vacanc(?:y|ies)|hiring)\b")
+# Job questions only get the listing when they ask for one ("list/show/any/which/open ... jobs")
+LISTING_PATTERN = re.compile(r"\b(list|show|any|which|open|openings|available|vacanc(?:y|ies)|hiring|"
+                             r"are there|do you have|browse|find)\b")
+# Details a price list or job listing does not answer ("how much experience ...", "salary for ...")
+DETAIL_PATTERN = re.compile(r"\b(salary|salaries|pay|ctc|experience|requirements?|qualifications?|"
+                            r"eligib\w*|skills?|interviews?)\b")
+
+# Everyday words for each service beyond its title and sub-service names
+SERVICE_ALIASES = {
+    "electrician": ["electrical", "electric", "electricity", "wiring"],
+    "plumber": ["plumbing", "plumbers", "pipe", "pipes", "tap", "leak"],
+    "painter": ["painting", "painters", "paint"],
+    "carpenter": ["carpentry", "carpenters", "furniture", "woodwork"],
+    "house cleaning": ["cleaning", "cleaner", "cleaners", "housekeeping"],
+    "ac service": ["ac", "air conditioner", "air conditioning"]
+}
+
+DEPARTMENT_ALIASES = {
+    "engineering": ["engineer", "engineers", "developer", "developers", "software"],
+    "human resources": ["hr"],
+    "data & analytics": ["data", "analytics", "analyst", "analysts"],
+    "it": ["IT"]
+}
+
+LOCATION_ALIASES = {
+    "bangalore": ["bengaluru"],
+    "gurgaon": ["gurugram"],
+    "delhi": ["new delhi"]
+}
+
+# Longest job list written out in full
+MAX_LISTED_JOBS = 10
+
+
+def _phrase_pattern(phrases: List[str], ignore_case: bool = True) -> re.Pattern:
+    alternatives = "|".join(re.escape(phrase) for phrase in sorted(set(phrases), key=len, reverse=True))
+    return re.compile(rf"\b({alternatives})\b", re.IGNORECASE if ignore_case else 0)
+
+
+class StructuredAnswerIndex:
+    def __init__(self):
+        """In-memory index over services and job listings"""
+        self.services: List[Dict[str, Any]] = []
+        self.jobs: List[Dict[str, Any]] = []
+        self._service_patterns: List[tuple] = []
+        self._department_patterns: List[tuple] = []
+        self._location_patterns: List[tuple] = []
+        self.hits = 0
+
+    def load(self, scraped_data: Dict[str, Any]):
+        """(Re)build the index from scraped data as produced by WebsiteScraper.
+        
+        The new patterns are built first and assigned at the end, so lookups
+        running meanwhile keep using the previous index.
+        """
+        services = list(scraped_data.get("services", []))
+        jobs = list(scraped_data.get("job_listings", []))
+
+        service_patterns = []
+        for service in services:
+            title = service.get("title", "")
+            phrases = [title] + list(service.get("subServices", []))
+            phrases += SERVICE_ALIASES.get(title.lower(), [])
+            service_patterns.append((service, _phrase_pattern([p for p in phrases if p])))
+
+        department_patterns = []
+        for department in sorted({job.get("department", "") for job in jobs} - {""}):
+            aliases = DEPARTMENT_ALIASES.get(department.lower(), [])
+            if len(department) <= 2:
+                # Short names like "IT" only match when written in capitals
+                pattern = _phrase_pattern([department] + aliases, ignore_case=False)
+            else:
+                pattern = _phrase_pattern([department] + aliases)
+            department_patterns.append((department, pattern))
+
+        location_patterns = []
+        for location in sorted({job.get("location", "") for job in jobs} - {""}):
+            city = location.split(",")[0].strip()
+            location_patterns.append(
+                (location, _phrase_pattern([city] + LOCATION_ALIASES.get(city.lower(), [])))
+            )
+
+        self.services, self.jobs = services, jobs
+        self._service_patterns = service_patterns
+        self._department_patterns = department_patterns
+        self._location_patterns = location_patterns
+
+        print(f"📇 Structured index: {len(self.services)} services, {len(self.jobs)} jobs")
+
+    def load_from_disk(self):
+        """Load the last scraped services and jobs, if present"""
+        scraped_data: Dict[str, Any] = {}
+        sources = {
+            "services": [os.path.join(settings.SCRAPED_CONTENT_DIR, "services.json")],
+            "job_listings": [os.path.join(settings.SCRAPED_CONTENT_DIR, "job_listings.json"),
+                             os.path.join(settings.DATA_DIR, "complete_jobs_data.json")]
+        }
+        for key, paths in sources.items():
+            for path in paths:
+                if os.path.exists(path):
+                    try:
+                        with open(path, "r", encoding="utf-8") as f:
+                            scraped_data[key] = json.load(f)
+                        break
+                    except Exception as e:
+                        print(f"Error loading structured data from {path}: {e}")
+        self.load(scraped_data)
+
+    def _matching(self, patterns: List[tuple], query: str) -> List[Any]:
+        return [item for item, pattern in patterns if pattern.search(query)]
+
+    def _filters(self, query: str) -> Dict[str, Any]:
+        """What a query asks about: price or jobs, and which services, departments and locations"""
+        query_lower = query.lower()
+        return {
+            "price": PRICE_PATTERN.search(query_lower) is not None,
+            "all_services": re.search(r"\bservices?\b", query_lower) is not None,
+            "services": self._matching(self._service_patterns, query),
+            "jobs": JOB_PATTERN.search(query_lower) is not None,
+            "listing": LISTING_PATTERN.search(query_lower) is not None,
+            "details": DETAIL_PATTERN.search(query_lower) is not None,
+            "departments": self._matching(self._department_patterns, query),
+            "locations": self._matching(self._location_patterns, query),
+            "remote": re.search(r"\bremote\b", query_lower) is not None
+        }
+
+    def _answer_filters(self, filters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Salary, experience or requirement questions need more than a list
+        if filters["details"]:
+            return None
+
+        if (filters["price"] and not filters["jobs"]
+                and (filters["services"] or filters["all_services"])):
+            self.hits += 1
+            return self._price_answer(filters["services"] or self.services)
+
+        if (filters["jobs"] and filters["listing"] and not filters["price"]
+                and (filters["departments"] or filters["locations"] or filters["remote"])):
+            self.hits += 1
+            return self._jobs_answer(filters["departments"], filters["locations"], filters["remote"])
+
+        return None
+
+    def answer(self, query: str) -> Optional[Dict[str, Any]]:
+        """Intent, response and source documents for a price or job lookup, or None"""
+        return self._answer_filters(self._filters(query))
+
+    def answer_follow_up(self, previous_query: str, query: str) -> Optional[Dict[str, Any]]:
+        """Answer a follow-up ("what about Pune?") to an earlier lookup.
+
+        Services, departments and locations named in the follow-up replace
+        the earlier ones; everything else carries over.
+        """
+        filters = self._filters(previous_query)
+        follow_up = self._filters(query)
+        for key in ("services", "departments", "locations"):
+            if follow_up[key]:
+                filters[key] = follow_up[key]
+        for key in ("remote", "listing", "details"):
+            filters[key] = filters[key] or follow_up[key]
+        return self._answer_filters(filters)
+
+    @staticmethod
+    def _service_doc(service: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "content": (f"Service: {service.get('title', '')}. "
+                        f"Sub-services: {', '.join(service.get('subServices', []))}. "
+                        f"Starting price: {service.get('startingPrice', '')}. "
+                        f"Description: {service.get('description', '')}"),
+            "metadata": {
+                "type": "service",
+                "service_name": service.get("title", ""),
+                "starting_price": service.get("startingPrice", ""),
+                "category": "service_details"
+            },
+            "distance": 0.0
+        }
+
+    @staticmethod
+    def _job_doc(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "content": (f"Job: {job.get('title', '')} at {job.get('department', '')} department. "
+                        f"Location: {job.get('location', '')}. Experience: {job.get('experience', '')}. "
+                        f"Salary: {job.get('salary', '')}. Type: {job.get('type', '')}."),
+            "metadata": {
+                "type": "career",
+                "job_id": job.get("id", ""),
+                "title": job.get("title", ""),
+                "department": job.get("department", ""),
+                "location": job.get("location", ""),
+                "experience": job.get("experience", "")
+            },
+            "distance": 0.0
+        }
+
+    def _price_answer(self, services: List[Dict[str, Any]]) -> Dict[str, Any]:
+        lines = []
+        for service in services:
+            line = f"• {service.get('title', '')} (starting from {service.get('startingPrice', 'N/A')})"
+            if service.get("subServices"):
+                line += f": {', '.join(service['subServices'])}"
+            lines.append(line)
+
+        if len(services) == 1:
+            intro = f"Here's the pricing for our {services[0].get('title', '')} service:"
+        else:
+            intro = "Here's the starting pricing for our services:"
+        response = (f"{intro}\n\n" + "\n".join(lines) +
+                    "\n\nFinal prices depend on the job. Select a service and your preferred time slot to book.")
+        return {
+            "intent": "services",
+            "response": response,
+            "sources": [self._service_doc(service) for service in services]
+        }
+
+    def _jobs_answer(self, departments: List[str], locations: List[str], remote: bool) -> Dict[str, Any]:
+        jobs = [
+            job for job in self.jobs
+            if (not departments or job.get("department") in departments)
+            and (not locations or job.get("location") in locations)
+            and (not remote or job.get("isRemote"))
+        ]
+
+        filters = []
+        if departments:
+            filters.append(" / ".join(departments))
+        if remote:
+            filters.append("remote")
+        noun = "job" if len(jobs) == 1 else "jobs"
+        description = " ".join(filters + [noun])
+        if locations:
+            description += " in " + " / ".join(location.split(",")[0] for location in locations)
+
+        if not jobs:
+            response = (f"We don't have any open {description} right now. "
+                        f"Please check our careers page for new openings or contact our HR team.")
+        else:
+            lines = [
+                f"• {job.get('title', '')} ({job.get('department', '')}) - {job.get('location', '')}, "
+                f"{job.get('experience', '')} experience, {job.get('salary', '')}"
+                for job in jobs[:MAX_LISTED_JOBS]
+            ]
+            if len(jobs) > MAX_LISTED_JOBS:
+                lines.append(f"...and {len(jobs) - MAX_LISTED_JOBS} more on our careers page.")
+            response = (f"We have {len(jobs)} open {description}:\n\n" + "\n".join(lines) +
+                        "\n\nYou can apply through our careers page.")
+
+        return {
+            "intent": "careers",
+            "response": response,
+            "sources": [self._job_doc(job) for job in jobs[:MAX_LISTED_JOBS]]
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"services": len(self.services), "jobs": len(self.jobs), "hits": self.hits}
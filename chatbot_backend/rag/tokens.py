@@ -0,0 +1,66 @@
+"""
+Token counting helpers (tiktoken when available, a character estimate otherwise)
+"""
+import time
+from functools import lru_cache
+from typing import Dict
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken is in requirements.txt
+    tiktoken = None
+
+# Rough characters-per-token ratio for English text, used without tiktoken
+_CHARS_PER_TOKEN = 4
+
+
+# Seconds before loading a failed encoding (e.g. a failed download) is tried again
+_RETRY_AFTER = 60.0
+_failed_at: Dict[str, float] = {}
+
+
+@lru_cache(maxsize=8)
+def _load_encoding(model: str):
+    """tiktoken encoding for ``model``; raises when it cannot be loaded, so failures are not cached"""
+    if tiktoken is None:
+        raise RuntimeError("tiktoken is not installed")
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Model tiktoken does not know
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _encoding(model: str):
+    """Encoding for ``model``, or None (character estimate) while it cannot be loaded"""
+    failed_at = _failed_at.get(model)
+    if failed_at is not None and time.monotonic() - failed_at < _RETRY_AFTER:
+        return None
+    try:
+        encoding = _load_encoding(model)
+    except Exception as e:
+        if failed_at is None:
+            print(f"⚠️ Could not load tiktoken encoding for {model}, estimating token counts: {e}")
+        _failed_at[model] = time.monotonic()
+        return None
+    _failed_at.pop(model, None)
+    return encoding
+
+
+def count_tokens(text: str, model: str = "text-embedding-ada-002") -> int:
+    """Number of tokens ``text`` encodes to for ``model``"""
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // _CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "text-embedding-ada-002") -> str:
+    """Cut ``text`` down to at most ``max_tokens`` tokens"""
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[:max_tokens * _CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
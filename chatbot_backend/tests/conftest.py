@@ -0,0 +1,65 @@
+"""
+Shared pytest setup for the backend tests
+"""
+import os
+import sys
+import pytest
+import numpy as np
+
+# Add backend directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Point every on-disk store at a temporary directory"""
+    monkeypatch.setattr(settings, "VECTOR_STORE_DIR", str(tmp_path / "vector_store"))
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_PATH", "")
+    monkeypatch.setattr(settings, "SESSION_DB_PATH", str(tmp_path / "sessions.sqlite3"))
+    return tmp_path
+
+
+@pytest.fixture
+def engine(data_dir, monkeypatch):
+    """Query engine over an empty store, with embedding, search and generation stubbed out"""
+    monkeypatch.chdir(data_dir)
+    monkeypatch.setattr(settings, "SESSION_BACKEND", "memory")
+    from rag.query_engine import RAGQueryEngine
+    engine = RAGQueryEngine()
+    engine.generated = []
+    docs = [{"id": "doc-1", "content": "Servecure connects you with home service professionals",
+             "metadata": {"type": "general"}, "distance": 0.2}]
+
+    async def embed(query, deadline):
+        return [1.0] + [0.0] * (engine.vector_store.embedding_manager.embedding_dim - 1)
+
+    async def generate(query, context_docs, intent, deadline=None, session=None):
+        engine.generated.append((query, session))
+        return f"answer #{len(engine.generated)} to {query}"
+
+    monkeypatch.setattr(engine, "_embed_query_async", embed)
+    monkeypatch.setattr(engine, "retrieve_relevant_docs", lambda *args, **kwargs: list(docs))
+    monkeypatch.setattr(engine, "generate_response_async", generate)
+    return engine
+
+
+def make_docs(count, kind="general", seed=0, dim=1536, prefix="doc"):
+    """Prepared documents with random embeddings, as the embedding manager produces them"""
+    rng = np.random.default_rng(seed)
+    key = {"general": "category", "service": "service_name", "career": "job_id"}[kind]
+    return [
+        {
+            "content": f"{prefix} {i} about home services",
+            "metadata": {"type": kind, key: f"{prefix}-{i}"},
+            "embedding": rng.normal(size=dim).astype(np.float32).tolist()
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def new_store(data_dir):
+    """Factory for vector stores over the temporary directory (a second call reloads from disk)"""
+    from rag.simple_vector_store import SimpleVectorStore
+    return SimpleVectorStore
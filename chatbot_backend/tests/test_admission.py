@@ -0,0 +1,87 @@
+"""
+Admission control: bounded concurrency, fair queueing and fast rejection
+"""
+import asyncio
+import pytest
+
+from api.admission import AdmissionController, AdmissionRejected
+
+
+def controller(**overrides):
+    options = {"max_concurrent": 1, "max_queue": 10, "max_queue_per_client": 5, "queue_timeout": 1.0}
+    options.update(overrides)
+    return AdmissionController(**options)
+
+
+def test_waiters_are_served_round_robin_across_clients():
+    async def run():
+        admission = controller()
+        await admission.acquire("holder")
+        order = []
+
+        async def request(client, name):
+            await admission.acquire(client)
+            order.append(name)
+            admission.release(0.01)
+
+        # A noisy client queues three requests before a quiet one queues its first
+        tasks = [asyncio.ensure_future(request("noisy", f"noisy-{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(request("quiet", "quiet-0")))
+        await asyncio.sleep(0)
+        admission.release(0.01)
+        await asyncio.gather(*tasks)
+        return order, admission
+
+    order, admission = asyncio.run(run())
+    assert order == ["noisy-0", "quiet-0", "noisy-1", "noisy-2"]
+    assert admission.active == 0 and admission.queued == 0
+
+
+def test_full_queues_reject_with_retry_after():
+    async def run():
+        admission = controller(max_queue=2, max_queue_per_client=1)
+        await admission.acquire("a")
+        waiting = asyncio.ensure_future(admission.acquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as per_client:
+            await admission.acquire("b")
+        asyncio.ensure_future(admission.acquire("c"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as total:
+            await admission.acquire("d")
+        waiting.cancel()
+        return per_client.value, total.value, admission
+
+    per_client, total, admission = asyncio.run(run())
+    assert per_client.retry_after >= 1 and total.retry_after >= 1
+    assert admission.rejected == 2
+
+
+def test_queue_timeout_rejects_and_frees_the_place():
+    async def run():
+        admission = controller(queue_timeout=0.01)
+        await admission.acquire("a")
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("b")
+        admission.release()
+        return admission
+
+    admission = asyncio.run(run())
+    assert admission.queued == 0 and admission.active == 0 and not admission._queues
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def run():
+        admission = controller()
+        await admission.acquire("a")
+        waiter = asyncio.ensure_future(admission.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert admission.queued == 0
+        admission.release()
+        return admission
+
+    assert asyncio.run(run()).active == 0
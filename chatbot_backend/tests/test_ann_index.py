@@ -0,0 +1,79 @@
+"""
+IVF index: recall against exact search, incremental changes and the on-disk round trip
+"""
+import numpy as np
+import pytest
+
+from rag.ann_index import IVFIndex
+from rag.persistence import VectorStorePersistence
+
+DIM = 32
+
+
+def clustered_rows(count, clusters=20, seed=0):
+    """Unit rows scattered around ``clusters`` random directions, like topical documents"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, DIM))
+    rows = centres[rng.integers(clusters, size=count)] + rng.normal(scale=0.3, size=(count, DIM))
+    return (rows / np.linalg.norm(rows, axis=1, keepdims=True)).astype(np.float32)
+
+
+def recall_at(index, matrix, queries, k):
+    hits = 0
+    for query in queries:
+        exact = set(np.argsort(-(matrix @ query))[:k].tolist())
+        rows = index.candidates(query)
+        approx = set(rows[np.argsort(-(matrix[rows] @ query))[:k]].tolist())
+        hits += len(exact & approx)
+    return hits / (k * len(queries))
+
+
+@pytest.fixture
+def matrix():
+    return clustered_rows(2000)
+
+
+def test_probing_a_few_lists_keeps_recall_high(matrix):
+    index = IVFIndex(n_lists=16, n_probe=4)
+    index.build(matrix)
+    queries = clustered_rows(50, seed=1)
+
+    assert recall_at(index, matrix, queries, 10) >= 0.9
+    assert np.mean([len(index.candidates(q)) for q in queries]) < len(matrix) / 2
+    # Probing every list is exact search
+    index.n_probe = 16
+    assert recall_at(index, matrix, queries, 10) == 1.0
+
+
+def test_added_and_removed_rows_keep_every_row_in_one_list(matrix):
+    index = IVFIndex(n_lists=16, n_probe=16)
+    index.build(matrix[:1500])
+    index.add(matrix[1500:])
+    keep = np.ones(2000, dtype=bool)
+    keep[::7] = False
+    index.remove(keep)
+
+    rows = np.sort(np.concatenate(index.lists))
+    assert index.size == keep.sum()
+    assert np.array_equal(rows, np.arange(keep.sum()))
+    assert recall_at(index, matrix[keep], clustered_rows(20, seed=2), 10) == 1.0
+
+
+def test_index_round_trips_through_the_snapshot_files(matrix, tmp_path):
+    index = IVFIndex(n_lists=16, n_probe=4)
+    index.build(matrix)
+    collection = {
+        "ids": [str(i) for i in range(len(matrix))], "hashes": [None] * len(matrix),
+        "documents": [""] * len(matrix), "metadatas": [{}] * len(matrix),
+        "token_counts": [1] * len(matrix), "token_model": "m", "embeddings": matrix, "ann": index
+    }
+    persistence = VectorStorePersistence(str(tmp_path), DIM)
+    persistence.save_snapshot({"general": collection})
+    assert (tmp_path / "general.1.ivf.npz").exists()
+
+    loaded = VectorStorePersistence(str(tmp_path), DIM).load()["general"]["ann"]
+    assert isinstance(loaded, IVFIndex)
+    assert (loaded.n_lists, loaded.n_probe, loaded.size, loaded.built_size) == (16, 4, 2000, 2000)
+    assert np.array_equal(loaded.centroids, index.centroids)
+    for query in clustered_rows(10, seed=3):
+        assert np.array_equal(loaded.candidates(query), index.candidates(query))
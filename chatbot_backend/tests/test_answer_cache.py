@@ -0,0 +1,69 @@
+"""
+Semantic answer cache: paraphrases hit, other documents, intents or store versions miss
+"""
+import numpy as np
+
+from rag.answer_cache import SemanticAnswerCache
+
+
+def unit(*values, dim=8):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[:len(values)] = values
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def filled_cache(max_entries=4, threshold=0.9):
+    cache = SemanticAnswerCache(max_entries, threshold, 8)
+    cache.store(unit(1, 0), "general", ["doc-1", "doc-2"], "About us", store_version=1)
+    return cache
+
+
+def test_paraphrase_with_the_same_documents_hits():
+    cache = filled_cache()
+    assert cache.lookup(unit(1, 0.2), "general", ["doc-1", "doc-2"], store_version=1) == "About us"
+    assert cache.stats()["hits"] == 1
+
+
+def test_lookup_misses_below_threshold_or_on_other_intent_or_documents():
+    cache = filled_cache()
+    assert cache.lookup(unit(1, 1), "general", ["doc-1", "doc-2"], store_version=1) is None  # cos ~0.71
+    assert cache.lookup(unit(1, 0), "services", ["doc-1", "doc-2"], store_version=1) is None
+    assert cache.lookup(unit(1, 0), "general", ["doc-2", "doc-1"], store_version=1) is None
+    assert cache.lookup([0.0] * 8, "general", ["doc-1", "doc-2"], store_version=1) is None
+    assert cache.stats()["misses"] == 4 and cache.stats()["hit_rate"] == 0.0
+
+
+def test_store_version_change_empties_the_cache():
+    cache = filled_cache()
+    assert cache.lookup(unit(1, 0), "general", ["doc-1", "doc-2"], store_version=2) is None
+    assert cache.stats()["entries"] == 0
+    # Entries stored under the old version are gone for good
+    assert cache.lookup(unit(1, 0), "general", ["doc-1", "doc-2"], store_version=1) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticAnswerCache(2, 0.99, 8)
+    cache.store(unit(1), "general", ["a"], "first", store_version=1)
+    cache.store(unit(0, 1), "general", ["b"], "second", store_version=1)
+    assert cache.lookup(unit(1), "general", ["a"], store_version=1) == "first"  # now most recent
+    cache.store(unit(0, 0, 1), "general", ["c"], "third", store_version=1)
+
+    assert cache.lookup(unit(0, 1), "general", ["b"], store_version=1) is None
+    assert cache.lookup(unit(1), "general", ["a"], store_version=1) == "first"
+    assert cache.lookup(unit(0, 0, 1), "general", ["c"], store_version=1) == "third"
+    assert cache.stats()["entries"] == 2
+
+
+def test_nearest_ignores_documents_but_not_intent():
+    cache = filled_cache()
+    cache.store(unit(1, 1), "general", ["doc-3"], "Contact us", store_version=1)
+    assert cache.nearest(unit(1, 0.1), "general", 0.5, store_version=1) == "About us"
+    assert cache.nearest(unit(1, 0.9), "general", 0.5, store_version=1) == "Contact us"
+    assert cache.nearest(unit(1, 0), "services", 0.5, store_version=1) is None
+    assert cache.nearest(unit(0, 0, 1), "general", 0.5, store_version=1) is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = SemanticAnswerCache(0, 0.9, 8)
+    cache.store(unit(1), "general", ["a"], "answer", store_version=1)
+    assert cache.lookup(unit(1), "general", ["a"], store_version=1) is None
@@ -0,0 +1,89 @@
+"""
+Batch queries: input order kept, structured lookups skip the pipeline, work shared across the batch
+"""
+import asyncio
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from config import settings
+from api import main
+
+SCRAPED = {
+    "services": [{"title": "Plumber", "startingPrice": "₹199", "subServices": ["Tap repair"]}],
+    "job_listings": []
+}
+
+
+@pytest.fixture
+def batch_engine(engine, monkeypatch):
+    """The stub engine with batched embedding and search recorded"""
+    engine.structured_index.load(SCRAPED)
+    dim = engine.vector_store.embedding_manager.embedding_dim
+    engine.embedded, engine.searched = [], []
+
+    async def embed_many(queries):
+        engine.embedded.append(list(queries))
+        return [[1.0] + [0.0] * (dim - 1) for _ in queries]
+
+    def search_many(embeddings, collections, k):
+        engine.searched.append(len(embeddings))
+        return [[{"id": f"doc-{i}", "content": "Servecure", "metadata": {"type": "general"}, "distance": 0.2}]
+                for i in range(len(embeddings))]
+
+    monkeypatch.setattr(engine.vector_store.embedding_manager, "generate_query_embeddings_async", embed_many)
+    monkeypatch.setattr(engine.vector_store, "search_many", search_many)
+    return engine
+
+
+QUERIES = ["Tell me about your company", "How much does plumbing cost?", "How do I contact support"]
+
+
+def test_results_keep_input_order_and_share_one_embed_and_search(batch_engine):
+    results = batch_engine.process_queries(QUERIES)
+
+    assert [result["query"] for result in results] == QUERIES
+    assert "₹199" in results[1]["response"] and results[1]["intent"] == "services"
+    assert results[0]["response"].endswith("to Tell me about your company")
+    assert results[2]["response"].endswith("to How do I contact support")
+    # The price lookup never reached the embedding, search or LLM stages
+    assert batch_engine.embedded == [[QUERIES[0], QUERIES[2]]]
+    assert batch_engine.searched == [2]
+    assert [query for query, _ in batch_engine.generated] == [QUERIES[0], QUERIES[2]]
+
+
+def test_all_structured_batch_does_no_embedding(batch_engine):
+    results = batch_engine.process_queries(["How much does plumbing cost?"])
+    assert "₹199" in results[0]["response"]
+    assert batch_engine.embedded == [] and batch_engine.generated == []
+
+
+def test_query_without_a_slot_gets_the_fallback_alone(batch_engine):
+    calls = []
+
+    class Slot:
+        async def __aenter__(self):
+            calls.append(None)
+            if len(calls) == 1:
+                raise RuntimeError("server busy")
+
+        async def __aexit__(self, *exc_info):
+            return False
+
+    results = asyncio.run(batch_engine.process_queries_async(QUERIES, slot=Slot))
+
+    assert len(calls) == 2 and len(batch_engine.generated) == 1
+    generated = [results[i]["response"].startswith("answer #") for i in (0, 2)]
+    assert sorted(generated) == [False, True]
+    assert "₹199" in results[1]["response"]
+
+
+def test_endpoint_rejects_oversized_batches(batch_engine, monkeypatch):
+    monkeypatch.setattr(main, "query_engine", batch_engine)
+    monkeypatch.setattr(settings, "BATCH_MAX_QUERIES", 2)
+    request = Request({"type": "http", "method": "POST", "path": "/", "headers": [], "client": ("10.0.0.1", 5000)})
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.chat_batch(main.ChatBatchRequest(queries=QUERIES), request))
+    assert error.value.status_code == 413
+    assert batch_engine.embedded == []
@@ -0,0 +1,145 @@
+"""
+Chat endpoints: the SSE event sequence, and admission slots returned however a response ends
+"""
+import json
+import asyncio
+import pytest
+from starlette.requests import ClientDisconnect, Request
+
+from api import main
+from api.admission import AdmissionController
+
+
+@pytest.fixture
+def app_engine(engine, monkeypatch):
+    monkeypatch.setattr(main, "query_engine", engine)
+    monkeypatch.setattr(main, "admission", AdmissionController(2, 4, 4, 1.0))
+    return engine
+
+
+def http_request():
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": [], "client": ("10.0.0.1", 5000)})
+
+
+def sse_events(response):
+    """Run a streaming response to the end; its (event, data) pairs in order"""
+    async def run():
+        sent = []
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+
+        await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        return b"".join(message.get("body", b"") for message in sent).decode()
+
+    events = []
+    for block in asyncio.run(run()).strip().split("\n\n"):
+        name, data = block.split("\n")
+        assert name.startswith("event: ") and data.startswith("data: ")
+        events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def stream_chat(text, session_id=None):
+    message = main.ChatMessage(message=text, session_id=session_id)
+    return asyncio.run(main.chat_stream(message, http_request()))
+
+
+def test_stream_sends_meta_then_tokens_then_done(app_engine, monkeypatch):
+    async def stream_response(query, context_docs, intent, deadline=None, session=None):
+        for chunk in ("Servecure ", "connects ", "you"):
+            yield chunk
+
+    monkeypatch.setattr(app_engine, "stream_response_async", stream_response)
+    response = stream_chat("Tell me about your company", session_id="erin")
+    assert response.media_type == "text/event-stream"
+    assert response.headers["cache-control"] == "no-cache"
+
+    events = sse_events(response)
+    assert [name for name, _ in events] == ["meta", "token", "token", "token", "done"]
+    meta = events[0][1]
+    assert meta["session_id"] == "erin" and meta["intent"] and meta["sources"]
+    assert "suggested_actions" in meta
+    assert [data["content"] for _, data in events[1:-1]] == ["Servecure ", "connects ", "you"]
+    assert events[-1][1] == {"response": "Servecure connects you"}
+
+
+def test_stream_failure_after_meta_ends_with_an_error_event(app_engine, monkeypatch):
+    async def stream_response(query, context_docs, intent, deadline=None, session=None):
+        yield "Servecure "
+        raise RuntimeError("upstream went away")
+
+    monkeypatch.setattr(app_engine, "stream_response_async", stream_response)
+    events = sse_events(stream_chat("Tell me about your company"))
+
+    assert [name for name, _ in events] == ["meta", "token", "error"]
+    assert "upstream" not in events[-1][1]["detail"]
+    assert main.admission.active == 0
+
+
+def test_stream_frees_its_slot_when_the_body_never_starts(app_engine):
+    async def run():
+        response = await main.chat_stream(main.ChatMessage(message="Tell me about your company"), http_request())
+        assert main.admission.active == 1
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            raise OSError("connection reset")
+
+        with pytest.raises(ClientDisconnect):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+
+    asyncio.run(run())
+    assert main.admission.active == 0
+
+
+def test_stream_frees_its_slot_once_after_streaming(app_engine):
+    async def run():
+        response = await main.chat_stream(main.ChatMessage(message="Tell me about your company"), http_request())
+        sent = []
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+
+        await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        return sent
+
+    sent = asyncio.run(run())
+    assert b"event: done" in b"".join(message.get("body", b"") for message in sent)
+    assert main.admission.active == 0
+    assert main.admission.service_times.stats()["samples"] == 1
+
+
+def test_batch_takes_a_slot_per_chat_completion(app_engine, monkeypatch):
+    vector_store = app_engine.vector_store
+    dim = vector_store.embedding_manager.embedding_dim
+
+    async def embed_many(queries):
+        return [[1.0] + [0.0] * (dim - 1) for _ in queries]
+
+    monkeypatch.setattr(vector_store.embedding_manager, "generate_query_embeddings_async", embed_many)
+    monkeypatch.setattr(vector_store, "search_many", lambda embeddings, collections, k: [[] for _ in embeddings])
+    active = []
+    generate = app_engine.generate_response_async
+
+    async def generate_counted(*args, **kwargs):
+        active.append(main.admission.active)
+        await asyncio.sleep(0.01)
+        return await generate(*args, **kwargs)
+
+    monkeypatch.setattr(app_engine, "generate_response_async", generate_counted)
+    queries = [f"Tell me about topic {i}" for i in range(5)]
+    response = asyncio.run(main.chat_batch(main.ChatBatchRequest(queries=queries), http_request()))
+
+    assert len(response.results) == 5
+    assert len(active) == 5 and max(active) == 2  # bounded by the admission budget, not one slot per batch
+    assert main.admission.admitted == 5
+    assert main.admission.active == 0
@@ -0,0 +1,89 @@
+"""
+Deadlines, latency percentiles and hedged calls
+"""
+import time
+import asyncio
+import pytest
+
+from rag.deadline import Deadline, LatencyTracker, hedged_call
+
+
+def test_deadline_timeout_keeps_the_reserve():
+    deadline = Deadline(1.0)
+    assert 0.7 < deadline.timeout(cap=5.0, reserve=0.25) <= 0.75
+    assert deadline.timeout(cap=0.1) == 0.1
+    assert not deadline.expired()
+    assert Deadline(0.0).expired()
+
+
+def test_latency_percentiles_need_enough_samples():
+    tracker = LatencyTracker(window=100)
+    assert tracker.percentile(95) is None
+    for ms in range(1, 101):
+        tracker.record(ms / 1000)
+    assert tracker.percentile(50) == pytest.approx(0.051)
+    assert tracker.percentile(95, min_samples=200) is None
+
+
+def attempts(*plans):
+    """make_call for hedged_call: each attempt sleeps, then returns its value (or raises it)"""
+    plans = iter(plans)
+    started = []
+
+    async def make_call():
+        delay, value = next(plans)
+        started.append(time.monotonic())
+        await asyncio.sleep(delay)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    return make_call, started
+
+
+def test_slow_first_attempt_is_hedged():
+    make_call, started = attempts((10, "slow"), (0.01, "fast"))
+    assert asyncio.run(hedged_call(make_call, timeout=1, hedge_after=0.02)) == "fast"
+    assert len(started) == 2
+
+
+def test_fast_first_attempt_is_not_hedged():
+    make_call, started = attempts((0.001, "first"), (0.001, "second"))
+    assert asyncio.run(hedged_call(make_call, timeout=1, hedge_after=0.5)) == "first"
+    assert len(started) == 1
+
+
+def test_rejected_result_fires_the_hedge_at_once():
+    make_call, started = attempts((0.0, 500), (0.0, 200))
+    result = asyncio.run(hedged_call(make_call, timeout=1, hedge_after=0.5, accept=lambda r: r == 200))
+    assert result == 200
+    assert started[1] - started[0] < 0.25
+
+
+def test_last_error_is_raised_when_no_attempt_succeeds():
+    make_call, _ = attempts((0.0, RuntimeError("first")), (0.0, RuntimeError("second")))
+    with pytest.raises(RuntimeError, match="second"):
+        asyncio.run(hedged_call(make_call, timeout=1, hedge_after=0.5))
+
+
+def test_timeout_without_an_answer():
+    make_call, _ = attempts((10, "late"), (10, "late"))
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(hedged_call(make_call, timeout=0.05, hedge_after=0.01))
+
+
+def test_hung_completion_falls_back_within_the_deadline(engine, monkeypatch):
+    from rag import http_client
+    from rag.query_engine import RAGQueryEngine
+
+    class HangingClient:
+        async def post(self, path, **kwargs):
+            await asyncio.Event().wait()
+
+    monkeypatch.setattr(http_client, "_guards", {})
+    monkeypatch.setattr(http_client, "get_async_http_client", lambda: HangingClient())
+    started = time.monotonic()
+    response = asyncio.run(RAGQueryEngine.generate_response_async(
+        engine, "How much is a plumber?", [], "services", Deadline(0.4)))
+    assert response == engine._get_fallback_response("services", "How much is a plumber?")
+    assert time.monotonic() - started < 0.4
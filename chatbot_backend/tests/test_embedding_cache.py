@@ -0,0 +1,35 @@
+"""
+On-disk document embedding cache
+"""
+import time
+import pytest
+
+from rag.embedding_cache import EmbeddingCache
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache" / "embeddings.sqlite3")
+
+
+def test_round_trip_per_model_survives_reopen(cache_path):
+    cache = EmbeddingCache(cache_path, max_entries=10)
+    cache.put_many("model-a", ["hello", "world"], [[0.5, 1.0], [2.0, -1.0]])
+    assert cache.get_many("model-a", ["world", "missing", "hello"]) == [[2.0, -1.0], None, [0.5, 1.0]]
+    assert cache.get_many("model-b", ["hello"]) == [None]
+    cache.close()
+
+    reopened = EmbeddingCache(cache_path, max_entries=10)
+    assert reopened.get_many("model-a", ["hello"]) == [[0.5, 1.0]]
+    assert reopened.stats()["hits"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(cache_path, monkeypatch):
+    cache = EmbeddingCache(cache_path, max_entries=2)
+    clock = iter(range(100))
+    monkeypatch.setattr(time, "time", lambda: next(clock))
+    cache.put_many("m", ["a"], [[1.0]])
+    cache.put_many("m", ["b"], [[2.0]])
+    cache.get_many("m", ["a"])  # "b" is now the least recently used
+    cache.put_many("m", ["c"], [[3.0]])
+    assert cache.get_many("m", ["a", "b", "c"]) == [[1.0], None, [3.0]]
@@ -0,0 +1,91 @@
+"""
+Document embedding requests: token-budget batching, bounded retries and input order
+"""
+import asyncio
+import threading
+import pytest
+
+from config import settings
+from rag import embeddings
+from rag.embeddings import EmbeddingManager
+from rag.resilience import UpstreamUnavailable
+
+
+@pytest.fixture
+def manager(data_dir, monkeypatch):
+    """Embedding manager counting one token per word, answering with [len(text)] vectors"""
+    monkeypatch.setattr(settings, "EMBEDDING_BATCH_MAX_TOKENS", 10)
+    monkeypatch.setattr(settings, "EMBEDDING_BATCH_MAX_ITEMS", 3)
+    monkeypatch.setattr(settings, "EMBEDDING_MAX_RETRIES", 2)
+    monkeypatch.setattr(settings, "EMBEDDING_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(embeddings, "count_tokens", lambda text, model: len(text.split()))
+    monkeypatch.setattr(embeddings, "truncate_to_tokens", lambda text, limit, model: text)
+    manager = EmbeddingManager()
+    manager.requests = []
+    manager.failures = {}  # text -> failed attempts left (-1: always fails)
+    lock = threading.Lock()
+
+    def request(texts):
+        with lock:
+            manager.requests.append(list(texts))
+            for text in texts:
+                if manager.failures.get(text, 0):
+                    manager.failures[text] -= 1
+                    return None
+        return [[float(len(text))] for text in texts]
+
+    async def request_async(texts):
+        return request(texts)
+
+    monkeypatch.setattr(manager, "_request_embeddings", request)
+    monkeypatch.setattr(manager, "_request_embeddings_async", request_async)
+    return manager
+
+
+def test_batches_respect_the_token_budget_and_item_cap(manager):
+    texts = ["one two three four", "five six seven", "eight nine", "ten", "a b c d e f g h i j k l", "m"]
+    assert manager._make_batches(texts) == [[0, 1, 2], [3], [4], [5]]
+
+
+def test_results_come_back_in_input_order_with_duplicates_sent_once(manager):
+    texts = ["aa", "b", "cccc", "aa", "ddd", "ee"]
+    assert manager.generate_embeddings(texts) == [[2.0], [1.0], [4.0], [2.0], [3.0], [2.0]]
+    sent = [text for request in manager.requests for text in request]
+    assert sorted(sent) == ["aa", "b", "cccc", "ddd", "ee"]
+    assert all(len(request) <= 3 for request in manager.requests)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_a_failed_batch_is_retried_alone(manager, use_async):
+    manager.failures = {"bad": 1, "worse": -1}
+    texts = ["ok one", "ok two", "x", "bad", "y", "z", "worse"]  # batches of three items
+    if use_async:
+        result = asyncio.run(manager._embed_texts_async(texts))
+    else:
+        result = manager._embed_texts(texts)
+
+    # "bad" succeeds on its retry; "worse" gives up after EMBEDDING_MAX_RETRIES, losing only its batch
+    assert result == [[6.0], [6.0], [1.0], [3.0], [1.0], [1.0], None]
+    retried = [request for request in manager.requests if "bad" in request]
+    assert len(retried) == 2 and retried[0] == retried[1]
+    assert sum("worse" in request for request in manager.requests) == 3
+    assert sum("ok one" in request for request in manager.requests) == 1
+
+
+def test_open_circuit_stops_retries(manager, monkeypatch):
+    calls = []
+
+    def unavailable(texts):
+        calls.append(texts)
+        raise UpstreamUnavailable("circuit open", 30)
+
+    monkeypatch.setattr(manager, "_request_embeddings", unavailable)
+    assert manager._embed_texts(["a", "b"]) == [None, None]
+    assert len(calls) == 1
+
+
+def test_documents_whose_batch_failed_get_no_embedding(manager):
+    manager.failures = {"broken": -1}
+    contents = ["fine", "also fine", "still fine", "broken"]
+    docs = manager.create_embeddings_for_documents([{"content": c, "metadata": {}} for c in contents])
+    assert [doc.get("embedding") for doc in docs] == [[4.0], [9.0], [10.0], None]
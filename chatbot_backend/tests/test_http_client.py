@@ -0,0 +1,80 @@
+"""
+Pooled OpenAI clients: one async client per event loop, closed with its loop
+"""
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+from rag import http_client
+
+
+async def current_client():
+    return http_client.get_async_http_client()
+
+
+def test_run_async_closes_the_loops_client():
+    client = http_client.run_async(current_client())
+    assert client.is_closed
+    assert not http_client._async_clients
+
+
+def test_each_loop_keeps_its_own_client():
+    async def main_loop():
+        mine = http_client.get_async_http_client()
+        # A blocking helper in a worker thread runs its own loop meanwhile
+        other = await asyncio.to_thread(http_client.run_async, current_client())
+        assert other is not mine and other.is_closed
+        assert http_client.get_async_http_client() is mine and not mine.is_closed
+        await http_client.aclose_http_clients()
+        return mine
+
+    assert asyncio.run(main_loop()).is_closed
+
+
+class RecordingClient(httpx.Client):
+    """httpx.Client answering locally; remembers every instance made"""
+    made = []
+
+    def __init__(self, **kwargs):
+        super().__init__(transport=httpx.MockTransport(self.answer), **kwargs)
+        self.paths = []
+        RecordingClient.made.append(self)
+
+    def answer(self, request):
+        self.paths.append(request.url.path)
+        return httpx.Response(200, json={"ok": True})
+
+
+@pytest.fixture
+def recording_client(monkeypatch):
+    http_client.close_http_clients()
+    RecordingClient.made = []
+    monkeypatch.setattr(httpx, "Client", RecordingClient)
+    yield RecordingClient
+    http_client.close_http_clients()
+
+
+def test_calls_share_one_sync_client(recording_client):
+    threads = [threading.Thread(target=http_client.post_openai, args=("/pool-test", {"n": n}))
+               for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    (client,) = recording_client.made
+    assert client.paths == ["/v1/pool-test"] * 8
+    assert http_client.get_guard("/pool-test") is http_client.get_guard("/pool-test")
+
+
+def test_closing_drops_the_pool_and_the_next_call_opens_a_new_one(recording_client):
+    http_client.post_openai("/pool-test", {})
+    first = http_client.get_http_client()
+    http_client.close_http_clients()
+    assert first.is_closed
+
+    http_client.post_openai("/pool-test", {})
+    assert http_client.get_http_client() is not first
+    assert len(recording_client.made) == 2
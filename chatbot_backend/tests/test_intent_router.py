@@ -0,0 +1,79 @@
+"""
+Intent routing by centroid similarity, with keyword tie-breaks below the margin
+"""
+import numpy as np
+import pytest
+
+from config import settings
+
+AXES = {"careers": 0, "services": 1, "general": 2}
+
+
+@pytest.fixture
+def router(engine, monkeypatch):
+    dim = engine.vector_store.embedding_manager.embedding_dim
+    centroids = {}
+    for name, axis in AXES.items():
+        centroids[name] = np.zeros(dim, dtype=np.float32)
+        centroids[name][axis] = 1.0
+    monkeypatch.setattr(engine.vector_store, "collection_centroids", lambda: centroids)
+    monkeypatch.setattr(settings, "INTENT_ROUTER_MIN_MARGIN", 0.05)
+    engine.dim = dim
+    return engine
+
+
+def embedding(dim, **weights):
+    vector = np.zeros(dim, dtype=np.float32)
+    for name, weight in weights.items():
+        vector[AXES[name]] = weight
+    return vector.tolist()
+
+
+def test_confident_route_searches_one_collection(router):
+    # Keywords say general; the embedding is clearly closest to services
+    intent, confidence, collections = router.route_intent(
+        "what about it", embedding(router.dim, services=1.0, general=0.3))
+    assert intent == "services" and collections == ["services"]
+    assert confidence >= settings.INTENT_ROUTER_MIN_MARGIN
+
+
+def test_close_call_is_broken_by_keywords_and_searches_both(router):
+    intent, confidence, collections = router.route_intent(
+        "any job openings", embedding(router.dim, services=1.0, careers=0.98))
+    assert confidence < settings.INTENT_ROUTER_MIN_MARGIN
+    assert intent == "careers"
+    assert collections == ["services", "careers"]
+
+
+def test_close_call_without_keywords_keeps_the_closest(router):
+    intent, _, collections = router.route_intent("hmm", embedding(router.dim, services=1.0, careers=0.98))
+    assert intent == "services" and collections == ["services", "careers"]
+
+
+def test_keyword_intent_outside_the_top_two_is_added(router):
+    intent, _, collections = router.route_intent(
+        "electrician price", embedding(router.dim, careers=1.0, general=0.99, services=0.1))
+    assert intent == "services"
+    assert collections == ["careers", "general", "services"]
+
+
+def test_margin_setting_decides_what_is_confident(router, monkeypatch):
+    query_embedding = embedding(router.dim, services=1.0, careers=0.9)
+    assert router.route_intent("any job openings", query_embedding)[2] == ["services"]
+    monkeypatch.setattr(settings, "INTENT_ROUTER_MIN_MARGIN", 0.2)
+    intent, _, collections = router.route_intent("any job openings", query_embedding)
+    assert intent == "careers" and collections == ["services", "careers"]
+
+
+@pytest.mark.parametrize("use_zero_embedding", [True, False])
+def test_falls_back_to_keywords_without_centroids_or_embedding(router, monkeypatch, use_zero_embedding):
+    if use_zero_embedding:
+        query_embedding = [0.0] * router.dim
+    else:
+        monkeypatch.setattr(router.vector_store, "collection_centroids", lambda: {})
+        query_embedding = embedding(router.dim, services=1.0)
+
+    assert router.route_intent("any job openings", query_embedding) == (
+        "careers", 0.0, router.vector_store.collections_for_intent("careers"))
+    assert router.route_intent("hmm", query_embedding) == (
+        "general", 0.0, router.vector_store.collections_for_intent("general"))
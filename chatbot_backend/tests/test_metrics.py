@@ -0,0 +1,112 @@
+"""
+Prometheus metrics: text format, per-request stage timings and the /metrics endpoint
+"""
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+
+from api import main
+from rag.metrics import (MetricsRegistry, record_usage, render_snapshot, server_timing_header, stage,
+                         start_request_timings, LLM_TOKENS)
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("test_seconds", "Test latency", ("stage",), buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.7, 3.0):
+        latency.observe(seconds, "embed")
+
+    assert registry.render().splitlines() == [
+        "# HELP test_seconds Test latency",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="embed",le="0.1"} 1',
+        'test_seconds_bucket{stage="embed",le="1"} 3',
+        'test_seconds_bucket{stage="embed",le="+Inf"} 4',
+        'test_seconds_sum{stage="embed"} 4.25',
+        'test_seconds_count{stage="embed"} 4'
+    ]
+
+
+def test_registry_reuses_metrics_and_skips_empty_ones():
+    registry = MetricsRegistry()
+    requests = registry.counter("test_total", "Test counter", ("route",))
+    assert registry.counter("test_total", "Test counter", ("route",)) is requests
+    registry.gauge("test_idle", "Never set")
+    requests.inc(1, 'say "hi"\n')
+    requests.inc(2, 'say "hi"\n')
+
+    assert registry.render().splitlines() == [
+        "# HELP test_total Test counter",
+        "# TYPE test_total counter",
+        'test_total{route="say \\"hi\\"\\n"} 3'
+    ]
+    assert render_snapshot("test_empty", "Nothing", "gauge", (), {}) == ""
+
+
+def test_stages_add_up_per_request():
+    async def request():
+        timings = start_request_timings()
+        with stage("search"):
+            pass
+        with stage("search"):
+            pass
+        with stage("generate"):
+            await asyncio.sleep(0.01)
+        return timings
+
+    timings = asyncio.run(request())
+    assert list(timings) == ["search", "generate"] and timings["generate"] >= 0.01
+    assert server_timing_header({"embed": 0.0412, "search": 0.0008}) == "embed;dur=41.2, search;dur=0.8"
+
+
+def test_usage_counts_prompt_and_completion_tokens():
+    record_usage("test-model", {"prompt_tokens": 120, "completion_tokens": 30, "total_tokens": 150})
+    record_usage("test-model", None)
+    samples = LLM_TOKENS.samples()
+    assert 'chatbot_llm_tokens_total{model="test-model",type="prompt"} 120' in samples
+    assert 'chatbot_llm_tokens_total{model="test-model",type="completion"} 30' in samples
+
+
+@pytest.fixture
+def client(engine, monkeypatch):
+    monkeypatch.setattr(main, "query_engine", engine)
+    return TestClient(main.app)
+
+
+def metric_lines(text):
+    """Sample lines by metric family, checking every family has HELP and TYPE first"""
+    families, current = {}, None
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            current = line.split()[2]
+            families[current] = []
+        elif line.startswith("# TYPE "):
+            assert line.split()[2] == current
+        else:
+            assert current is not None and line.startswith(current)
+            families[current].append(line)
+    return families
+
+
+def test_metrics_endpoint_reports_pipeline_caches_and_routes(client):
+    assert client.post("/chat", json={"message": "Tell me about your company"}).status_code == 200
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    families = metric_lines(response.text)
+    assert any('method="POST",route="/chat",status="200"' in line
+               for line in families["chatbot_http_requests_total"])
+    assert any('stage="intent"' in line for line in families["chatbot_stage_duration_seconds"])
+    assert 'chatbot_cache_misses_total{cache="answers"} 1' in families["chatbot_cache_misses_total"]
+    assert families["chatbot_admission_active"] == ["chatbot_admission_active 0"]
+    assert "chatbot_index_generation" in families
+
+
+def test_metrics_endpoint_works_before_the_index_is_ready(client, monkeypatch):
+    monkeypatch.setattr(main, "query_engine", None)
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    families = metric_lines(response.text)
+    assert "chatbot_admission_queue_depth" in families
+    assert "chatbot_cache_hits_total" not in families
@@ -0,0 +1,72 @@
+"""
+Probes during background startup: /livez answers at once, /readyz only once the index is loaded
+"""
+import time
+import threading
+import pytest
+from fastapi.testclient import TestClient
+
+from api import main
+
+
+@pytest.fixture
+def starting_app(engine, monkeypatch):
+    """The app with engine construction held until ``gate`` is set (or failing with ``error``)"""
+    monkeypatch.setattr(main, "query_engine", None)
+    monkeypatch.setattr(main, "startup_state",
+                        {"phase": "starting", "started_at": time.time(), "ready_at": None, "error": None})
+    gate = threading.Event()
+    failure = []
+
+    def build_engine():
+        assert gate.wait(5)
+        if failure:
+            raise failure[0]
+        return engine
+
+    monkeypatch.setattr(main, "RAGQueryEngine", build_engine)
+    monkeypatch.setattr(main, "populate_if_empty", lambda engine, on_phase: on_phase("embedding"))
+    return gate, failure
+
+
+def wait_for(client, path, status):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        response = client.get(path)
+        if response.status_code == status:
+            return response
+        time.sleep(0.01)
+    raise AssertionError(f"{path} never returned {status}")
+
+
+def test_ready_only_after_the_index_loads(starting_app):
+    gate, _ = starting_app
+    with TestClient(main.app) as client:
+        assert client.get("/livez").json() == {"status": "alive"}
+        not_ready = client.get("/readyz")
+        assert not_ready.status_code == 503
+        assert not_ready.json()["status"] == "not_ready" and not_ready.json()["phase"] == "loading_index"
+        assert client.get("/health").json()["status"] == "starting"
+        assert client.post("/chat", json={"message": "hello there"}).status_code == 503
+
+        gate.set()
+        ready = wait_for(client, "/readyz", 200).json()
+        assert ready["status"] == "ready" and ready["phase"] == "ready" and ready["ready_at"]
+        assert client.get("/livez").status_code == 200
+        assert client.post("/chat", json={"message": "Tell me about your company"}).status_code == 200
+
+
+def test_failed_startup_stays_unready_but_alive(starting_app):
+    gate, failure = starting_app
+    failure.append(RuntimeError("index file is corrupt"))
+    with TestClient(main.app) as client:
+        gate.set()
+        deadline = time.monotonic() + 5
+        while main.startup_state["phase"] != "failed" and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        not_ready = client.get("/readyz")
+        assert not_ready.status_code == 503
+        assert not_ready.json()["phase"] == "failed" and not_ready.json()["error"] == "index file is corrupt"
+        assert client.get("/health").json()["status"] == "unhealthy"
+        assert client.get("/livez").status_code == 200
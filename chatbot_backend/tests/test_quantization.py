@@ -0,0 +1,50 @@
+"""
+Compact embedding codes and quantized search with float32 rescoring
+"""
+import numpy as np
+import pytest
+
+from config import settings
+from conftest import make_docs
+from rag import quantization
+
+
+@pytest.mark.parametrize("mode, tolerance", [("float16", 1e-3), ("int8", 2e-2)])
+def test_coarse_scores_approximate_exact_scores(mode, tolerance):
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(50, 64)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    query = matrix[7]
+
+    codes, scales = quantization.quantize(matrix, mode)
+    scores = quantization.coarse_scores(codes, scales, query)
+    assert np.abs(scores - matrix @ query).max() < tolerance
+    assert np.allclose(quantization.coarse_scores(codes, scales, query, np.array([3, 7])), scores[[3, 7]])
+
+
+def test_int8_keeps_zero_rows_zero():
+    codes, scales = quantization.quantize(np.zeros((2, 4), dtype=np.float32), "int8")
+    assert not codes.any() and not scales.any()
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        quantization.quantize(np.zeros((1, 4), dtype=np.float32), "int4")
+
+
+@pytest.mark.parametrize("mode", ["float16", "int8"])
+def test_quantized_search_matches_exact_search(new_store, monkeypatch, mode):
+    docs = make_docs(60)
+    exact_store = new_store()
+    exact_store.add_documents(docs)
+    queries = [doc["embedding"] for doc in make_docs(5, seed=3)]
+    expected = [[r["id"] for r in exact_store.search("", ["general"], 5, q)] for q in queries]
+
+    monkeypatch.setattr(settings, "VECTOR_STORE_QUANTIZATION", mode)
+    store = new_store()  # reloads the same documents and encodes them
+    assert store.collections["general"]["codes"] is not None
+    results = [store.search("", ["general"], 5, q) for q in queries]
+    assert [[r["id"] for r in result] for result in results] == expected
+    # Similarities come from the float32 rescoring, not the codes
+    exact_top = exact_store.search("", ["general"], 1, queries[0])[0]["similarity"]
+    assert results[0][0]["similarity"] == pytest.approx(exact_top, abs=1e-6)
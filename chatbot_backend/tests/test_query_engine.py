@@ -0,0 +1,67 @@
+"""
+Query pipeline behaviour: answer cache sharing and session memory
+"""
+import asyncio
+
+
+def ask(engine, query, session_id=None):
+    return asyncio.run(engine.process_query_async(query, session_id=session_id))["response"]
+
+
+def test_answers_without_history_are_shared(engine):
+    first = ask(engine, "Tell me about your company")
+    assert ask(engine, "Tell me about your company") == first
+    assert len(engine.generated) == 1
+
+
+def test_session_answers_do_not_leak_into_other_sessions(engine):
+    ask(engine, "What services do you offer?", session_id="alice")
+    personal = ask(engine, "Tell me about your company", session_id="alice")
+
+    # Bob asks the same (non follow-up) question without alice's history
+    other = ask(engine, "Tell me about your company", session_id="bob")
+    assert other != personal
+    assert engine.generated[-1] == ("Tell me about your company", None)
+
+
+def test_session_with_history_does_not_reuse_shared_answers(engine):
+    shared = ask(engine, "Tell me about your company")
+    ask(engine, "What services do you offer?", session_id="alice")
+    assert ask(engine, "Tell me about your company", session_id="alice") != shared
+
+
+def stream(engine, query, session_id=None):
+    async def collect():
+        return [event async for event in engine.stream_query_async(query, session_id=session_id)]
+    return asyncio.run(collect())
+
+
+def test_process_query_runs_the_async_pipeline(engine):
+    result = engine.process_query("Tell me about your company", session_id="carol")
+    assert result["response"] == "answer #1 to Tell me about your company"
+    assert result["num_sources"] == 1
+    assert engine.sessions.get("carol")["turns"][-1]["response"] == result["response"]
+
+
+def test_stream_shares_the_answer_cache_and_session_steps(engine, monkeypatch):
+    async def stream_response(query, context_docs, intent, deadline=None, session=None):
+        for chunk in ("streamed ", "answer"):
+            yield chunk
+
+    monkeypatch.setattr(engine, "stream_response_async", stream_response)
+    events = stream(engine, "Tell me about your company", session_id="dave")
+    assert [e["event"] for e in events] == ["meta", "token", "token", "done"]
+    assert events[-1]["data"]["response"] == "streamed answer"
+    assert engine.sessions.get("dave")["turns"][-1]["response"] == "streamed answer"
+
+    # Cached for queries without history, whichever path generated it
+    assert ask(engine, "Tell me about your company") == "streamed answer"
+    assert not engine.generated
+
+
+def test_merge_keeps_distinct_documents_without_ids():
+    from rag.query_engine import RAGQueryEngine
+    structured = [{"content": "Plumber: ₹399", "metadata": {}}, {"content": "Painter: ₹499", "metadata": {}}]
+    retrieved = [{"id": "services_1", "content": "Plumbing services", "metadata": {}}]
+    merged = RAGQueryEngine._merge_docs(retrieved, structured + [dict(structured[0]), dict(retrieved[0])], 6)
+    assert [doc["content"] for doc in merged] == ["Plumbing services", "Plumber: ₹399", "Painter: ₹499"]
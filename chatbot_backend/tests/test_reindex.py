@@ -0,0 +1,139 @@
+"""
+Background re-index jobs and the copy-on-write swap of the vector store
+"""
+import asyncio
+import threading
+
+from api.jobs import ReindexJobs
+from conftest import make_docs
+
+
+def test_job_runs_in_a_thread_and_reports_its_result():
+    async def run():
+        jobs = ReindexJobs()
+        release = threading.Event()
+
+        def work():
+            release.wait(1)
+            return {"documents": 3}
+
+        job = jobs.start(work)
+        await asyncio.sleep(0.01)
+        assert job["status"] == "running"
+        assert jobs.start(work) is job  # one re-index at a time
+        release.set()
+        while job["status"] == "running":
+            await asyncio.sleep(0.01)
+        return jobs, job
+
+    jobs, job = asyncio.run(run())
+    assert job["status"] == "succeeded" and job["result"] == {"documents": 3}
+    assert jobs.get(job["job_id"]) is job and jobs.current() is job
+
+
+def test_failed_job_records_the_error_and_a_new_one_can_start():
+    async def run():
+        jobs = ReindexJobs(max_finished=1)
+
+        def fail():
+            raise RuntimeError("scrape failed")
+
+        first = jobs.start(fail)
+        while first["status"] in ("queued", "running"):
+            await asyncio.sleep(0.01)
+        second = jobs.start(lambda: {})
+        while second["status"] in ("queued", "running"):
+            await asyncio.sleep(0.01)
+        jobs.start(lambda: {})
+        return jobs, first, second
+
+    jobs, first, second = asyncio.run(run())
+    assert first["status"] == "failed" and first["error"] == "scrape failed"
+    assert second["status"] == "succeeded" and second is not first
+    assert jobs.get(first["job_id"]) is None  # trimmed to max_finished
+
+
+def test_searches_see_the_old_index_until_the_swap(new_store, monkeypatch):
+    store = new_store()
+    old_docs = make_docs(10)
+    store.add_documents(old_docs)
+    old_ids = set(store.collections["general"]["ids"])
+    version = store.version
+    query = old_docs[0]["embedding"]
+
+    seen_during_rebuild = []
+    stage = store._add_to_collection
+
+    def add_and_search(*args):
+        stage(*args)
+        # Staged but not yet published: readers still get the old contents
+        seen_during_rebuild.append({r["id"] for r in store.search("", ["general"], 20, query)})
+
+    monkeypatch.setattr(store, "_add_to_collection", add_and_search)
+    before = store.collections
+    store.add_documents(make_docs(5, seed=1, prefix="new"), prune=True)
+
+    assert seen_during_rebuild == [old_ids]
+    assert set(before["general"]["ids"]) == old_ids  # old snapshot untouched
+    assert len(store.collections["general"]["ids"]) == 5
+    assert not set(store.collections["general"]["ids"]) & old_ids
+    assert store.version == version + 1
+
+
+def load_app(name):
+    """A separate copy of the API module, as another worker process would import it"""
+    import importlib.util
+    import os
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api", "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_workers_share_reindex_jobs_and_run_one_at_a_time(data_dir, monkeypatch):
+    from config import settings
+    from rag.query_engine import RAGQueryEngine
+    monkeypatch.setattr(settings, "VECTOR_STORE_SHARED", True)
+    monkeypatch.setattr(settings, "SESSION_BACKEND", "memory")
+    monkeypatch.chdir(data_dir)
+    first, second = load_app("worker_a"), load_app("worker_b")
+    first.query_engine, second.query_engine = RAGQueryEngine(), RAGQueryEngine()
+
+    started, release = threading.Event(), threading.Event()
+    second_writer_waited = []
+
+    def rebuild_index(engine=None, on_phase=None):
+        started.set()
+        release.wait(2)
+        return {"stats": {"general": 3}}
+
+    monkeypatch.setattr(first, "rebuild_index", rebuild_index)
+
+    def write_from_second_worker():
+        with second.query_engine.vector_store.exclusive_write():
+            second_writer_waited.append(release.is_set())
+
+    async def run():
+        job = await first.scrape_and_update()
+        await asyncio.to_thread(started.wait, 2)
+        # The other worker sees the running job instead of starting its own
+        assert (await second.scrape_and_update())["job_id"] == job["job_id"]
+        assert (await second.scrape_and_update_status(job["job_id"]))["status"] == "running"
+        # ...and cannot write to the store until the job is done
+        writer = threading.Thread(target=write_from_second_worker)
+        writer.start()
+        await asyncio.sleep(0.05)
+        assert not second_writer_waited
+        release.set()
+        await asyncio.to_thread(writer.join, 2)
+        while (await second.scrape_and_update_status(job["job_id"]))["status"] == "running":
+            await asyncio.sleep(0.01)
+        return job, await first.get_stats(), await second.get_stats()
+
+    job, first_stats, second_stats = asyncio.run(run())
+    assert second_writer_waited == [True]
+    assert first_stats["reindex"] == second_stats["reindex"]
+    assert second_stats["reindex"]["job_id"] == job["job_id"]
+    assert second_stats["reindex"]["status"] == "succeeded"
+    assert second_stats["reindex"]["result"] == {"stats": {"general": 3}}
@@ -0,0 +1,211 @@
+"""
+Circuit breaker and rate limiter around the OpenAI endpoints, including hung,
+timed-out and hedged calls
+"""
+import time
+import asyncio
+from contextlib import asynccontextmanager
+import pytest
+import httpx
+
+from rag import http_client
+from rag.deadline import hedged_call
+from rag.resilience import TokenBucket, UpstreamGuard, UpstreamUnavailable, parse_duration
+
+
+class HangingClient:
+    """Async client whose requests never answer (until ``answer_after`` runs out)"""
+
+    def __init__(self, answer_after=None):
+        self.answer_after = answer_after
+
+    async def post(self, path, **kwargs):
+        if self.answer_after is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self.answer_after)
+        return httpx.Response(200, json={})
+
+
+@pytest.fixture
+def guard(monkeypatch):
+    guard = UpstreamGuard("/chat/completions", rate=0, burst=1, failure_threshold=3,
+                          reset_timeout=30, max_wait=1)
+    monkeypatch.setattr(http_client, "_guards", {"/chat/completions": guard})
+    return guard
+
+
+def test_deadline_cancelled_calls_open_the_circuit(guard, monkeypatch):
+    monkeypatch.setattr(http_client, "get_async_http_client", lambda: HangingClient())
+
+    async def hung_call():
+        call = http_client.post_openai_async("/chat/completions", {})
+        with pytest.raises(asyncio.TimeoutError):
+            await hedged_call(lambda: call, timeout=0.01)
+
+    for _ in range(3):
+        asyncio.run(hung_call())
+    assert guard.breaker.state == "open"
+    assert guard.breaker.failures == 3
+
+
+def test_wait_for_timeout_counts_as_failure(guard, monkeypatch):
+    monkeypatch.setattr(http_client, "get_async_http_client", lambda: HangingClient())
+
+    async def hung_call():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(http_client.post_openai_async("/chat/completions", {}), 0.01)
+
+    asyncio.run(hung_call())
+    assert guard.breaker.failures == 1
+
+
+def test_hedge_loser_is_not_a_failure(guard, monkeypatch):
+    clients = iter([HangingClient(), HangingClient(answer_after=0)])
+    monkeypatch.setattr(http_client, "get_async_http_client", lambda: next(clients))
+
+    async def hedged():
+        return await hedged_call(lambda: http_client.post_openai_async("/chat/completions", {}),
+                                 timeout=1, hedge_after=0.01)
+
+    response = asyncio.run(hedged())
+    assert response.status_code == 200
+    assert guard.breaker.state == "closed"
+    assert guard.breaker.failures == 0
+
+
+def test_half_open_probe_is_released_by_hedge_loser():
+    guard = UpstreamGuard("x", rate=0, burst=1, failure_threshold=1, reset_timeout=0, max_wait=1)
+    guard.record_error()
+    assert guard.acquire() == 0.0  # the half-open probe
+    guard.release()
+    assert guard.acquire() == 0.0  # released, so another probe may go
+
+
+def test_stalled_stream_counts_as_failure(guard, monkeypatch):
+    class StallingStreamClient:
+        @asynccontextmanager
+        async def stream(self, method, path, **kwargs):
+            yield httpx.Response(200)
+
+    monkeypatch.setattr(http_client, "get_async_http_client", lambda: StallingStreamClient())
+
+    async def stalled():
+        with pytest.raises(asyncio.TimeoutError):
+            async with http_client.stream_openai_async("/chat/completions", {}):
+                # Headers arrived, but no chunk before the deadline
+                await asyncio.wait_for(asyncio.Event().wait(), 0.01)
+
+    asyncio.run(stalled())
+    assert guard.breaker.failures == 1
+    assert guard.status_codes == {}
+
+
+class OpenStreamClient:
+    """Async client whose streamed requests answer 200 (or raise ``error`` on connect)"""
+
+    def __init__(self, error=None):
+        self.error = error
+
+    @asynccontextmanager
+    async def stream(self, method, path, **kwargs):
+        if self.error is not None:
+            raise self.error
+        yield httpx.Response(200)
+
+
+def test_cancelled_stream_leaves_the_breaker_closed(guard, monkeypatch):
+    monkeypatch.setattr(http_client, "get_async_http_client", lambda: OpenStreamClient())
+
+    async def disconnected():
+        async def consume():
+            async with http_client.stream_openai_async("/chat/completions", {}):
+                await asyncio.Event().wait()
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    for _ in range(5):
+        asyncio.run(disconnected())
+    assert guard.breaker.state == "closed"
+    assert guard.breaker.failures == 0
+
+
+def test_consumer_errors_inside_a_stream_are_not_failures(guard, monkeypatch):
+    monkeypatch.setattr(http_client, "get_async_http_client", lambda: OpenStreamClient())
+
+    async def bad_chunk():
+        with pytest.raises(ValueError):
+            async with http_client.stream_openai_async("/chat/completions", {}):
+                raise ValueError("Expecting value")  # e.g. json.JSONDecodeError
+
+    for _ in range(5):
+        asyncio.run(bad_chunk())
+    assert guard.breaker.state == "closed"
+
+
+def test_stream_transport_errors_count_as_failures(guard, monkeypatch):
+    monkeypatch.setattr(http_client, "get_async_http_client",
+                        lambda: OpenStreamClient(httpx.ConnectError("refused")))
+
+    async def refused():
+        with pytest.raises(httpx.ConnectError):
+            async with http_client.stream_openai_async("/chat/completions", {}):
+                pass
+
+    for _ in range(3):
+        asyncio.run(refused())
+    assert guard.breaker.state == "open"
+
+
+def test_breaker_opens_fails_fast_and_recovers_through_one_probe(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    guard = UpstreamGuard("x", rate=0, burst=1, failure_threshold=2, reset_timeout=30, max_wait=1)
+
+    guard.record_response(500, {})
+    guard.record_response(503, {})
+    assert guard.breaker.state == "open"
+    with pytest.raises(UpstreamUnavailable):
+        guard.acquire()
+
+    now[0] += 31
+    guard.acquire()  # the half-open probe
+    with pytest.raises(UpstreamUnavailable):
+        guard.acquire()  # only one probe at a time
+    guard.record_response(200, {})
+    assert guard.breaker.state == "closed"
+    guard.acquire()
+
+
+def test_client_errors_do_not_count_against_the_upstream():
+    guard = UpstreamGuard("x", rate=0, burst=1, failure_threshold=1, reset_timeout=30, max_wait=1)
+    guard.record_response(400, {})
+    assert guard.breaker.state == "closed"
+    assert guard.status_codes == {400: 1}
+
+
+def test_429_pauses_sending_for_retry_after():
+    guard = UpstreamGuard("x", rate=0, burst=1, failure_threshold=5, reset_timeout=30, max_wait=5)
+    guard.record_response(429, {"retry-after-ms": "1500"})
+    assert 1.4 < guard.acquire() <= 1.5
+    guard.record_response(429, {"retry-after": "20"})
+    with pytest.raises(UpstreamUnavailable):
+        guard.acquire()  # longer than max_wait: fail fast instead of queueing
+
+
+def test_rate_limit_headers_pause_until_reset():
+    guard = UpstreamGuard("x", rate=0, burst=1, failure_threshold=5, reset_timeout=30, max_wait=5)
+    guard.record_response(200, {"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "1s"})
+    assert 0.9 < guard.acquire() <= 1.0
+    assert parse_duration("6m0.5s") == 360.5
+    assert parse_duration("20ms") == 0.02
+
+
+def test_token_bucket_spaces_out_bursts():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
@@ -0,0 +1,43 @@
+"""
+Segmented matrix: a memory-mapped snapshot plus appended rows behaves like one matrix
+"""
+import numpy as np
+import pytest
+
+from rag.segmented_matrix import SegmentedMatrix, append_rows, keep_rows
+
+
+@pytest.fixture
+def mapped(tmp_path):
+    rows = np.random.default_rng(0).normal(size=(10, 4)).astype(np.float32)
+    np.save(tmp_path / "base.npy", rows)
+    return np.load(tmp_path / "base.npy", mmap_mode="r"), rows
+
+
+def test_appends_and_deletes_match_a_plain_matrix(mapped):
+    base, rows = mapped
+    extra = np.arange(12, dtype=np.float32).reshape(3, 4)
+    keep = np.ones(13, dtype=bool)
+    keep[[1, 4, 11]] = False
+
+    matrix = keep_rows(append_rows(base, extra), keep)
+    expected = np.vstack([rows, extra])[keep]
+    assert isinstance(matrix, SegmentedMatrix)
+    assert matrix.base is base  # the snapshot is never copied
+    assert len(matrix) == len(expected)
+    assert np.array_equal(np.asarray(matrix), expected)
+    assert np.array_equal(matrix[[8, 0, 3, -1]], expected[[8, 0, 3, -1]])
+    assert np.array_equal(matrix[-2:], expected[-2:])
+    assert np.array_equal(matrix[5], expected[5])
+
+    query = np.ones(4, dtype=np.float32)
+    assert np.allclose(matrix @ query, expected @ query)
+    assert np.allclose(matrix @ np.eye(4, dtype=np.float32), expected)
+    assert np.allclose(matrix.mean(axis=0), expected.mean(axis=0))
+    assert matrix.resident_nbytes < expected.nbytes
+
+
+def test_in_ram_matrices_stay_plain_arrays():
+    rows = np.zeros((2, 4), dtype=np.float32)
+    assert type(append_rows(rows, rows)) is np.ndarray
+    assert type(keep_rows(rows, np.array([True, False]))) is np.ndarray
@@ -0,0 +1,87 @@
+"""
+Session memory: atomic turn recording, compaction and event-loop safety
+"""
+import asyncio
+import threading
+import pytest
+
+from config import settings
+from rag.session_store import InMemorySessionBackend, SQLiteSessionBackend, SessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend_factory(request, tmp_path):
+    """Backends of one kind; SQLite backends made by one factory share a database (like workers)"""
+    if request.param == "memory":
+        shared = InMemorySessionBackend(100, 600)
+        return lambda: shared
+    return lambda: SQLiteSessionBackend(str(tmp_path / "sessions.sqlite3"), 100, 600)
+
+
+def test_concurrent_turns_are_not_lost(backend_factory):
+    stores = [SessionStore(backend_factory(), max_tokens=100000, summary_max_tokens=200) for _ in range(2)]
+
+    def record(store, worker):
+        for i in range(20):
+            store.record_turn("s1", f"question {worker}-{i}", "answer", "general", [])
+
+    threads = [threading.Thread(target=record, args=(stores[w % 2], w)) for w in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(stores[0].get("s1")["turns"]) == 80
+
+
+def test_old_turns_are_folded_into_the_summary(backend_factory):
+    store = SessionStore(backend_factory(), max_tokens=30, summary_max_tokens=200)
+    for i in range(5):
+        store.record_turn("s1", f"question number {i}", "a reasonably long answer " * 2, "services",
+                          [{"id": "d", "content": "c", "metadata": {}, "embedding": [0.1]}])
+    state = store.get("s1")
+    assert len(state["turns"]) < 5
+    assert "User asked: question number 0" in state["summary"]
+    assert state["intent"] == "services"
+    assert state["docs"] == [{"id": "d", "content": "c", "metadata": {}}]
+
+
+def test_returned_state_is_not_changed_by_later_turns(backend_factory):
+    store = SessionStore(backend_factory(), max_tokens=1000, summary_max_tokens=200)
+    store.record_turn("s1", "first", "answer", "general", [])
+    state = store.get("s1")
+    store.record_turn("s1", "second", "answer", "general", [])
+    assert len(state["turns"]) == 1
+
+
+def test_sqlite_calls_run_off_the_event_loop(tmp_path):
+    backend = SQLiteSessionBackend(str(tmp_path / "sessions.sqlite3"), 100, 600)
+    store = SessionStore(backend, max_tokens=1000, summary_max_tokens=200)
+    threads = []
+    for name in ("get", "update"):
+        method = getattr(backend, name)
+        setattr(backend, name, lambda *args, method=method: threads.append(threading.current_thread()) or method(*args))
+
+    async def turn():
+        await store.record_turn_async("s1", "hello there", "hi", "general", [])
+        return await store.get_async("s1")
+
+    assert asyncio.run(turn())["turns"][0]["query"] == "hello there"
+    assert threads and threading.main_thread() not in threads
+
+
+def test_compaction_counts_each_turn_once(backend_factory, monkeypatch):
+    from rag import session_store
+    counted = []
+    count = session_store.count_tokens
+    monkeypatch.setattr(session_store, "count_tokens", lambda text, model: counted.append(text) or count(text, model))
+
+    store = SessionStore(backend_factory(), max_tokens=1000, summary_max_tokens=100)
+    for i in range(200):
+        store.record_turn("s1", f"question number {i}", "a reasonably long answer " * 4, "general", [])
+    state = store.get("s1")
+
+    # Each query, response and summary line is counted about once, not once per later turn
+    assert len(counted) < 200 * 8
+    assert "User asked: question number 0" not in state["summary"]
+    assert f"User asked: question number {199 - len(state['turns'])}" in state["summary"]
+    assert count(state["summary"], settings.LLM_MODEL) <= 100
@@ -0,0 +1,37 @@
+"""
+Shared mode: worker processes map one published index and take turns writing
+"""
+import numpy as np
+import pytest
+
+from config import settings
+from conftest import make_docs
+
+
+@pytest.fixture
+def shared(monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_SHARED", True)
+
+
+def test_other_workers_pick_up_a_published_generation(new_store, shared):
+    writer, reader = new_store(), new_store()
+    writer.add_documents(make_docs(6))
+    assert reader.collections["general"]["ids"] == []
+
+    assert reader.refresh_from_disk()
+    assert not reader.refresh_from_disk()  # already current
+    collection = reader.collections["general"]
+    assert collection["ids"] == writer.collections["general"]["ids"]
+    assert isinstance(collection["embeddings"], np.memmap)
+    assert reader.persistence.generation == writer.persistence.generation
+
+
+def test_writers_build_on_each_others_changes(new_store, shared):
+    first, second = new_store(), new_store()
+    first.add_documents(make_docs(3))
+    # second has not refreshed, but exclusive_write loads the newest generation first
+    second.add_documents(make_docs(2, seed=1, prefix="other"))
+    assert len(second.collections["general"]["ids"]) == 5
+
+    first.refresh_from_disk()
+    assert len(first.collections["general"]["ids"]) == 5
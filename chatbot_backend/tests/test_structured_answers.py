@@ -0,0 +1,67 @@
+"""
+Price and job lookups answered from structured data, and questions they must not answer
+"""
+import pytest
+
+from rag.structured_answers import StructuredAnswerIndex
+
+SCRAPED = {
+    "services": [
+        {"title": "Plumber", "startingPrice": "₹199", "subServices": ["Tap repair", "Pipe fitting"]},
+        {"title": "Painter", "startingPrice": "₹999", "subServices": ["Wall painting"]},
+        {"title": "AC Service", "startingPrice": "₹499", "subServices": ["Gas refill"]}
+    ],
+    "job_listings": [
+        {"id": "1", "title": "Backend Engineer", "department": "Engineering", "location": "Bangalore, India",
+         "experience": "3-5 years", "salary": "₹18-25 LPA", "isRemote": False},
+        {"id": "2", "title": "Frontend Engineer", "department": "Engineering", "location": "Pune, India",
+         "experience": "2-4 years", "salary": "₹12-18 LPA", "isRemote": True},
+        {"id": "3", "title": "HR Executive", "department": "Human Resources", "location": "Mumbai, India",
+         "experience": "1-3 years", "salary": "₹5-7 LPA", "isRemote": False}
+    ]
+}
+
+
+@pytest.fixture
+def index():
+    index = StructuredAnswerIndex()
+    index.load(SCRAPED)
+    return index
+
+
+def titles(answer):
+    return [source["metadata"].get("service_name") or source["metadata"].get("title")
+            for source in answer["sources"]]
+
+
+def test_price_questions_get_the_matching_prices(index):
+    answer = index.answer("How much does plumbing cost?")
+    assert answer["intent"] == "services" and titles(answer) == ["Plumber"]
+    assert "₹199" in answer["response"]
+    assert titles(index.answer("What are the prices of your services?")) == ["Plumber", "Painter", "AC Service"]
+
+
+def test_job_listing_requests_get_the_matching_jobs(index):
+    answer = index.answer("List engineering jobs in Bangalore")
+    assert answer["intent"] == "careers" and titles(answer) == ["Backend Engineer"]
+    assert titles(index.answer("Do you have any remote jobs?")) == ["Frontend Engineer"]
+    assert titles(index.answer_follow_up("Show engineering jobs in Bangalore", "what about Pune?")) == [
+        "Frontend Engineer"]
+
+
+@pytest.mark.parametrize("query", [
+    "How much experience do I need for engineering jobs?",
+    "What is the salary for all roles in Pune?",
+    "Is there a fee to apply for jobs in Mumbai?",
+    "How much would it cost to fix all of it?",
+    "How much experience do your plumbers have?",
+    "Engineering jobs in Bangalore pay well?",
+    "What are the requirements for HR jobs?"
+])
+def test_questions_a_listing_cannot_answer_go_to_the_llm(index, query):
+    assert index.answer(query) is None
+
+
+def test_follow_ups_asking_for_details_go_to_the_llm(index):
+    assert index.answer_follow_up("Show engineering jobs in Bangalore", "what about the salary?") is None
+    assert index.hits == 0
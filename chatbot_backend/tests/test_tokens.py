@@ -0,0 +1,63 @@
+"""
+Token counting with tiktoken and the character-estimate fallback
+"""
+import time
+import pytest
+
+from rag import tokens
+
+
+class WordEncoding:
+    """Stand-in encoding with one token per word"""
+
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+
+@pytest.fixture
+def fake_tiktoken(monkeypatch):
+    """tiktoken whose encodings fail to load until ``online`` is set; knows only "gpt-known" """
+    state = {"online": False, "loaded": []}
+
+    class FakeTiktoken:
+        @staticmethod
+        def encoding_for_model(model):
+            if not state["online"]:
+                raise ConnectionError("download failed")
+            if model != "gpt-known":
+                raise KeyError(model)
+            state["loaded"].append(model)
+            return WordEncoding()
+
+        @staticmethod
+        def get_encoding(name):
+            state["loaded"].append(name)
+            return WordEncoding()
+
+    monkeypatch.setattr(tokens, "tiktoken", FakeTiktoken)
+    monkeypatch.setattr(tokens, "_failed_at", {})
+    tokens._load_encoding.cache_clear()
+    yield state
+    tokens._load_encoding.cache_clear()
+
+
+def test_failed_encoding_load_is_retried(fake_tiktoken, monkeypatch):
+    text = "a fairly long sentence about home services"
+    estimate = tokens.count_tokens(text, "gpt-known")
+    assert estimate == len(text) // 4 + 1
+
+    fake_tiktoken["online"] = True
+    # Within the retry interval the estimate is still used
+    assert tokens.count_tokens(text, "gpt-known") == estimate
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + tokens._RETRY_AFTER + 1)
+    assert tokens.count_tokens(text, "gpt-known") == 7
+    assert tokens.count_tokens(text, "gpt-known") == 7
+    assert fake_tiktoken["loaded"] == ["gpt-known"]  # cached once loaded
+
+
+def test_unknown_models_use_cl100k(fake_tiktoken):
+    fake_tiktoken["online"] = True
+    assert tokens.count_tokens("hello world", "not-a-real-model") == 2
+    assert fake_tiktoken["loaded"] == ["cl100k_base"]
@@ -0,0 +1,233 @@
+"""
+Simple vector store: storage stats, upserts and persistence
+"""
+import json
+import numpy as np
+import pytest
+
+from config import settings
+from conftest import make_docs
+from rag.ann_index import IVFIndex
+
+
+def test_search_ranks_rows_by_cosine_similarity(new_store):
+    docs = make_docs(30)
+    store = new_store()
+    store.add_documents(docs)
+    matrix = store.collections["general"]["embeddings"]
+    assert matrix.dtype == np.float32
+    assert np.allclose(np.linalg.norm(matrix, axis=1), 1.0, atol=1e-5)
+
+    # Scale does not matter: rows and queries are compared by direction
+    query = np.array(docs[7]["embedding"]) * 5
+    results = store.search("", ["general"], 5, query.tolist())
+    vectors = np.array([doc["embedding"] for doc in docs])
+    cosines = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+    expected = [docs[i]["content"] for i in np.argsort(-cosines)[:5]]
+    assert [r["content"] for r in results] == expected
+    assert results[0]["similarity"] == pytest.approx(1.0, abs=1e-5)
+    assert results[0]["distance"] == pytest.approx(0.0, abs=1e-5)
+    assert store.search_many([query.tolist()], [["general"]], 5)[0] == results
+
+
+def test_zero_query_vector_matches_nothing(new_store):
+    store = new_store()
+    store.add_documents(make_docs(5))
+    assert store.search("", ["general"], 3, [0.0] * 1536) == []
+
+
+def test_sampled_recall_is_computed_once_per_version(new_store, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_QUANTIZATION", "int8")
+    store = new_store()
+    store.add_documents(make_docs(40))
+
+    scored = []
+    score = store._score_collection
+    monkeypatch.setattr(store, "_score_collection", lambda *args: scored.append(1) or score(*args))
+
+    first = store.get_storage_stats()
+    calls = len(scored)
+    assert calls and 0 < first["general"]["recall_at_5"] <= 1
+    assert store.get_storage_stats() == first
+    assert len(scored) == calls
+
+    # A change publishes a new collection, which is measured again
+    store.add_documents(make_docs(5, seed=1, prefix="extra"))
+    store.get_storage_stats()
+    assert len(scored) > calls
+
+
+@pytest.fixture
+def ivf(monkeypatch):
+    """Index collections of 50+ rows with IVF and count how often an index is trained"""
+    monkeypatch.setattr(settings, "ANN_MIN_ROWS", 50)
+    monkeypatch.setattr(settings, "ANN_N_LISTS", 8)
+    monkeypatch.setattr(settings, "ANN_N_PROBE", 8)  # probe every list: results must be exact
+    builds = []
+    build = IVFIndex.build
+    monkeypatch.setattr(IVFIndex, "build", lambda self, matrix: builds.append(len(matrix)) or build(self, matrix))
+    return builds
+
+
+def assert_index_matches(collection):
+    """Every row is in exactly one IVF list, and the lists cover exactly the collection's rows"""
+    index = collection["ann"]
+    rows = np.sort(np.concatenate(index.lists))
+    assert index.size == len(collection["ids"])
+    assert np.array_equal(rows, np.arange(len(collection["ids"])))
+
+
+def test_ivf_index_is_persisted_with_the_snapshot(new_store, ivf):
+    store = new_store()
+    store.add_documents(make_docs(120))
+    assert ivf == [120]
+
+    reloaded = new_store()
+    assert ivf == [120]  # loaded, not retrained
+    assert_index_matches(reloaded.collections["general"])
+    query = make_docs(1, seed=9)[0]["embedding"]
+    assert ([r["id"] for r in reloaded.search("", ["general"], 5, query)]
+            == [r["id"] for r in store.search("", ["general"], 5, query)])
+
+
+def test_replacing_a_document_updates_the_ivf_lists(new_store, ivf):
+    store = new_store()
+    docs = make_docs(120)
+    store.add_documents(docs)
+    before = store.collections["general"]
+
+    changed = dict(docs[3], content="doc 3, now rewritten")
+    store.add_documents([changed])
+    assert ivf == [120]
+    assert before["ann"].size == 120  # readers' snapshot untouched
+    collection = store.collections["general"]
+    assert_index_matches(collection)
+
+    # Found through the index at its new row
+    top = store.search("", ["general"], 1, changed["embedding"])[0]
+    assert top["content"] == "doc 3, now rewritten"
+
+
+def test_logged_changes_are_replayed_into_the_persisted_index(new_store, ivf):
+    store = new_store()
+    docs = make_docs(120)
+    store.add_documents(docs)  # first snapshot
+    store.add_documents(make_docs(10, seed=1, prefix="late"))  # appended to the log
+    store.add_documents([dict(docs[0], content="doc 0, rewritten")])  # tombstone + append
+
+    reloaded = new_store()
+    assert ivf == [120]
+    collection = reloaded.collections["general"]
+    assert len(collection["ids"]) == 130
+    assert_index_matches(collection)
+    assert reloaded.search("", ["general"], 1, docs[0]["embedding"])[0]["content"] == "doc 0, rewritten"
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    """Texts the vector store counts tokens for"""
+    from rag import simple_vector_store
+    texts = []
+    count = simple_vector_store.count_tokens
+    monkeypatch.setattr(simple_vector_store, "count_tokens", lambda text, model: texts.append(text) or count(text, model))
+    return texts
+
+
+def test_token_counts_are_stored_not_recounted_on_load(new_store, counted):
+    store = new_store()
+    store.add_documents(make_docs(5))  # snapshot
+    store.add_documents(make_docs(2, seed=1, prefix="late"))  # log
+    expected = store.collections["general"]["token_counts"]
+    assert len(counted) == 7
+
+    reloaded = new_store()
+    assert len(counted) == 7
+    assert reloaded.collections["general"]["token_counts"] == expected
+
+
+def test_token_counts_missing_from_legacy_snapshots_are_recomputed(new_store, counted, data_dir):
+    store = new_store()
+    store.add_documents(make_docs(3))
+    meta_file = data_dir / "vector_store" / "general.1.meta.json"
+    meta = json.loads(meta_file.read_text())
+    del meta["token_counts"], meta["token_model"]
+    meta_file.write_text(json.dumps(meta))
+
+    reloaded = new_store()
+    assert len(counted) == 6
+    assert reloaded.collections["general"]["token_counts"] == store.collections["general"]["token_counts"]
+
+
+def test_failed_log_append_falls_back_to_a_full_snapshot(new_store, monkeypatch):
+    store = new_store()
+    store.add_documents(make_docs(10))
+    generation = store.persistence.generation
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store.persistence, "append", fail)
+    store.add_documents(make_docs(5, seed=1, prefix="extra"))
+    assert store.persistence.generation == generation + 1
+
+    reloaded = new_store()
+    assert reloaded.get_collection_stats()["general"] == 15
+
+
+def test_appends_keep_the_snapshot_memory_mapped(new_store, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_QUANTIZATION", "int8")
+    store = new_store()
+    store.add_documents(make_docs(40))
+    extra = make_docs(5, seed=1, prefix="extra")
+    store.add_documents(extra)
+
+    for current in (store, new_store()):  # after the append, and after replaying the log
+        stats = current.get_storage_stats()["general"]
+        assert stats["float32_memory_mapped"]
+        # int8 codes plus the five appended float32 rows, not a float32 copy of all 45
+        assert stats["bytes_per_document"] < 1540 + 5 * 1536 * 4 / 45 + 16
+        query = extra[2]["embedding"]
+        assert current.search("", ["general"], 1, query)[0]["content"] == extra[2]["content"]
+
+
+def test_rescraped_documents_are_upserted_by_natural_key(new_store):
+    store = new_store()
+    docs = make_docs(6)
+    store.add_documents(docs)
+    ids = list(store.collections["general"]["ids"])
+    version = store.version
+
+    # Same content again: nothing to embed, nothing published
+    assert store.filter_changed_documents(docs) == []
+    store.add_documents(docs)
+    assert store.version == version
+
+    # Changed content under the same key replaces the row and keeps its ID
+    changed = [dict(doc) for doc in docs]
+    changed[2] = {**changed[2], "content": "doc 2 rewritten"}
+    assert store.filter_changed_documents(changed) == [changed[2]]
+    store.add_documents(changed)
+    collection = store.collections["general"]
+    assert sorted(collection["ids"]) == sorted(ids)
+    assert "doc 2 rewritten" in collection["documents"] and "doc 2 about home services" not in collection["documents"]
+
+
+def test_prune_removes_documents_missing_from_the_scrape(new_store):
+    store = new_store()
+    docs = make_docs(6)
+    store.add_documents(docs)
+    store.add_documents(docs[:4], prune=True)
+    assert store.get_collection_stats()["general"] == 4
+
+    # The removals are logged as tombstones and survive a reload
+    reloaded = new_store()
+    assert sorted(reloaded.collections["general"]["documents"]) == sorted(doc["content"] for doc in docs[:4])
+
+
+def test_documents_without_a_key_are_identified_by_content(new_store):
+    store = new_store()
+    doc = {"content": "Servecure is available in 12 cities", "metadata": {"type": "general"},
+           "embedding": make_docs(1)[0]["embedding"]}
+    store.add_documents([doc, dict(doc)])
+    store.add_documents([dict(doc)])
+    assert store.get_collection_stats()["general"] == 1